@@ -6,6 +6,11 @@ import {
 import { animateTransfer } from "./animations.js";
 import { memoryContentsSpans } from "./memoryPopulation.js";
 import { Transfer } from "./transferInterface.js";
+import {
+	BINARY_MIMETYPE,
+	decodeStepResult,
+	encodeMemoryAndRegisters,
+} from "./wireFormat.js";
 
 const SERVER_URL = "%%SERVER_URL%%"; // this will get replaced by prebuild.js
 
@@ -80,6 +85,39 @@ interface StepResult {
 	output: string;
 }
 
+/**
+ * The reasons the server can give for stopping a run before it reached HLT or INP.
+ */
+type LimitStopReason = "cycle_limit" | "time_limit" | "loop_detected";
+
+/**
+ * The result of one fetch-decode-execute cycle as sent while streaming a run, without the state of the LMC.
+ */
+type StreamedStepResult = Omit<StepResult, "memory_and_registers">;
+
+/**
+ * One message from the server while streaming a run. Batches of results are sent first, and the last message says why the run stopped.
+ */
+type RunStreamMessage =
+	| { results: StreamedStepResult[] }
+	| { stop_reason: "HLT" | "INP" | LimitStopReason; cycles: number }
+	| { error: string; cycles: number };
+
+/**
+ * Alerts the user that a run was stopped early by the server.
+ * @param {LimitStopReason} stopReason The reason the server gave for stopping the run.
+ * @param {number} cycles The number of cycles that were run.
+ */
+function reportStoppedRun(stopReason: LimitStopReason, cycles: number) {
+	alert(
+		{
+			cycle_limit: `Execution stopped after ${cycles} cycles without reaching HLT.`,
+			time_limit: `Execution stopped after running for too long (${cycles} cycles).`,
+			loop_detected: `Execution stopped after ${cycles} cycles: the program is stuck in an infinite loop.`,
+		}[stopReason],
+	);
+}
+
 /**
  * Gets the user to input a three-digit number
  * @returns {string} The number (0-999) that the user inputted.
@@ -188,9 +226,9 @@ export async function assembleCode() {
 
 /**
  * Runs after response from server for one fetch-decode-execute cycle is receieved.
- * @param {StepResult} resJson The response object from the server representing one FDE cycle
+ * @param {StreamedStepResult} resJson The response object from the server representing one FDE cycle
  */
-async function processStepResult(resJson: StepResult) {
+async function processStepResult(resJson: StreamedStepResult) {
 	for (const transfer of resJson.transfers) {
 		await animateTransfer(transfer, memoryContentsSpans);
 		if (transfer.end_mem) {
@@ -237,14 +275,21 @@ async function processStepResult(resJson: StepResult) {
  */
 export async function step() {
 	// call /api/step
+	// the state is sent in the compact binary format, and the server replies in it too
 	const response = await fetch(`${SERVER_URL}/api/step`, {
 		method: "POST",
-		body: JSON.stringify(getMemoryAndRegistersJson()),
-		headers: { "Content-Type": "application/json" },
+		body: encodeMemoryAndRegisters(getMemoryAndRegistersJson()),
+		headers: {
+			"Content-Type": BINARY_MIMETYPE,
+			Accept: `${BINARY_MIMETYPE}, application/json;q=0.9`,
+		},
 		mode: "cors",
 	});
 	if (response.ok) {
-		const resJson = (await response.json()) as StepResult;
+		const resJson =
+			response.headers.get("Content-Type") === BINARY_MIMETYPE
+				? (decodeStepResult(await response.arrayBuffer()) as StepResult)
+				: ((await response.json()) as StepResult);
 		// update changed memory/register locations
 		await processStepResult(resJson);
 	} else {
@@ -253,27 +298,50 @@ export async function step() {
 }
 
 /**
- * Runs after the "Run" button is pressed. Sends the state of the LMC to the server and handles response.
+ * Runs after the "Run" button is pressed. Sends the state of the LMC to the server and handles each batch of the response as it arrives.
  */
 export async function run() {
-	// call /api/run
-	const response = await fetch(`${SERVER_URL}/api/run`, {
+	// call /api/run/stream
+	const response = await fetch(`${SERVER_URL}/api/run/stream`, {
 		method: "POST",
 		body: JSON.stringify(getMemoryAndRegistersJson()),
-		headers: { "Content-Type": "application/json" },
+		headers: {
+			"Content-Type": "application/json",
+			Accept: "application/x-ndjson",
+		},
 		mode: "cors",
 	});
-	if (response.ok) {
-		const resJson = (await response.json()) as StepResult[];
-		for (const stepResJson of resJson) {
-			await processStepResult(stepResJson);
-		}
-		if (resJson[resJson.length - 1].reached_INP) {
-			// continue running by calling /api/run again
-			await run();
-		}
-	} else {
+	if (!(response.ok && response.body)) {
 		alert("Bad response from server");
+		return;
+	}
+
+	const reader = response.body.getReader();
+	const decoder = new TextDecoder();
+	let unfinishedLine = "";
+	while (true) {
+		const { done, value } = await reader.read();
+		if (done) break;
+		// each message is one line of JSON, but a chunk may end part way through a line
+		const lines = (
+			unfinishedLine + decoder.decode(value, { stream: true })
+		).split("\n");
+		unfinishedLine = lines.pop() as string;
+		for (const line of lines.filter(line => line)) {
+			const message = JSON.parse(line) as RunStreamMessage;
+			if ("results" in message) {
+				for (const stepResJson of message.results) {
+					await processStepResult(stepResJson);
+				}
+			} else if ("error" in message) {
+				alert(`Bad response from server: ${message.error}`);
+			} else if (message.stop_reason === "INP") {
+				// continue running by calling /api/run/stream again
+				await run();
+			} else if (message.stop_reason !== "HLT") {
+				reportStoppedRun(message.stop_reason, message.cycles);
+			}
+		}
 	}
 }
 
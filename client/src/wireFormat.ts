@@ -0,0 +1,158 @@
+import { RegisterCode } from "./registerAndMemoryUtilities.js";
+import { Transfer } from "./transferInterface.js";
+
+/**
+ * The MIME type of the compact binary format the server can use instead of JSON for /api/step and /api/run.
+ * The layout is described in server/wire_format.py.
+ */
+export const BINARY_MIMETYPE = "application/x-lmc-binary";
+
+const STATE_MESSAGE = 1;
+const STEP_RESULT_MESSAGE = 2;
+
+const HLT_FLAG = 1;
+const INP_FLAG = 2;
+const OUTPUT_FLAG = 4;
+const INPUT_FLAG = 8;
+const INPUT_WIDTH_SHIFT = 4;
+
+const REGISTER_LOCATION = 1;
+const MEMORY_LOCATION = 2;
+
+/**
+ * The registers in the order they are packed, with the number of digits each one displays.
+ */
+const REGISTERS: [RegisterCode, number][] = [
+	["PC", 2],
+	["ACC", 3],
+	["IR", 1],
+	["MAR", 2],
+	["MDR", 3],
+	["CARRY", 1],
+];
+
+/**
+ * The contents of the memory and registers of the LMC, keyed as the server sends them.
+ */
+export interface MemoryAndRegisters {
+	memory: { [key: string]: string };
+	registers: { [key: string]: string };
+}
+
+/**
+ * The result of one fetch-decode-execute cycle, as decoded from the binary format.
+ */
+export interface DecodedStepResult {
+	memory_and_registers: MemoryAndRegisters;
+	transfers: Transfer[];
+	reached_HLT: boolean;
+	reached_INP: boolean;
+	output: string;
+	input?: string;
+}
+
+/**
+ * Packs the state of the LMC into a binary message to send to the server.
+ * @param state The current contents of the memory and registers.
+ * @returns {ArrayBuffer} The message.
+ */
+export function encodeMemoryAndRegisters(state: MemoryAndRegisters) {
+	const buffer = new ArrayBuffer(1 + 2 * (100 + REGISTERS.length));
+	const view = new DataView(buffer);
+	view.setUint8(0, STATE_MESSAGE);
+	for (let address = 0; address < 100; address++) {
+		const value = state.memory[address.toString().padStart(2, "0")];
+		view.setUint16(1 + 2 * address, Number(value), true);
+	}
+	REGISTERS.forEach(([code], index) => {
+		view.setUint16(201 + 2 * index, Number(state.registers[code]), true);
+	});
+	return buffer;
+}
+
+/**
+ * Unpacks a state of the LMC.
+ * @param {DataView} view The message.
+ * @param {number} offset Where the state starts in the message.
+ * @returns The state, and the offset of the first byte after it.
+ */
+function decodeMemoryAndRegisters(
+	view: DataView,
+	offset: number,
+): [MemoryAndRegisters, number] {
+	const memory = {} as { [key: string]: string };
+	for (let address = 0; address < 100; address++) {
+		memory[address.toString().padStart(2, "0")] = view
+			.getUint16(offset + 2 * address, true)
+			.toString()
+			.padStart(3, "0");
+	}
+	const registers = {} as { [key: string]: string };
+	REGISTERS.forEach(([code, width], index) => {
+		registers[code] = view
+			.getUint16(offset + 200 + 2 * index, true)
+			.toString()
+			.padStart(width, "0");
+	});
+	return [{ memory, registers }, offset + 2 * (100 + REGISTERS.length)];
+}
+
+/**
+ * Unpacks one transfer. The value is padded to the width of where it ends.
+ * @param {DataView} view The message.
+ * @param {number} offset Where the transfer starts in the message.
+ * @returns {Transfer} The transfer.
+ */
+function decodeTransfer(view: DataView, offset: number) {
+	const kind = view.getUint8(offset);
+	const source = view.getUint8(offset + 1);
+	const destination = view.getUint8(offset + 2);
+	const value = view.getUint16(offset + 3, true).toString();
+	const transfer = {} as Transfer;
+	if ((kind & 3) === REGISTER_LOCATION) {
+		transfer.start_reg = REGISTERS[source][0];
+	} else if ((kind & 3) === MEMORY_LOCATION) {
+		transfer.start_mem = source.toString().padStart(2, "0");
+	}
+	if (kind >> 2 === REGISTER_LOCATION) {
+		transfer.end_reg = REGISTERS[destination][0];
+		transfer.value = value.padStart(REGISTERS[destination][1], "0");
+	} else {
+		transfer.end_mem = destination.toString().padStart(2, "0");
+		transfer.value = value.padStart(3, "0");
+	}
+	return transfer;
+}
+
+/**
+ * Unpacks a binary message from the server containing the result of one fetch-decode-execute cycle.
+ * @param {ArrayBuffer} buffer The body of the response.
+ * @returns {DecodedStepResult} The result, in the same shape as the JSON response.
+ */
+export function decodeStepResult(buffer: ArrayBuffer) {
+	const view = new DataView(buffer);
+	if (view.getUint8(0) !== STEP_RESULT_MESSAGE) {
+		throw new Error("Unexpected binary message type");
+	}
+	const flags = view.getUint8(1);
+	const value = view.getUint16(2, true).toString();
+	const transferCount = view.getUint8(4);
+	const transfers = [];
+	let offset = 5;
+	for (let i = 0; i < transferCount; i++) {
+		transfers.push(decodeTransfer(view, offset));
+		offset += 5;
+	}
+	const [memory_and_registers] = decodeMemoryAndRegisters(view, offset);
+	const stepResult: DecodedStepResult = {
+		memory_and_registers,
+		transfers,
+		reached_HLT: Boolean(flags & HLT_FLAG),
+		reached_INP: Boolean(flags & INP_FLAG),
+		output: flags & OUTPUT_FLAG ? value.padStart(3, "0") : "",
+	};
+	if (flags & INPUT_FLAG) {
+		stepResult.input = value.padStart(flags >> INPUT_WIDTH_SHIFT, "0");
+	}
+	return stepResult;
+}
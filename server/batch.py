@@ -0,0 +1,354 @@
+"""This file contains the logic for compiling and running many programs at once, such as when
+grading submissions against lists of inputs. Each program is run to completion with the block
+engine, taking its inputs from a list instead of pausing for the user at every INP instruction. Jobs
+can be spread across several processes so that a batch can use every CPU core, or run together in
+lockstep with NumPy (see lockstep_engine.py). When the same program is run against many lists of
+inputs that start the same way, the work before each INP can be shared between them instead (see
+`run_batch_shared`). Any of these can answer jobs that have been run before from a
+`result_cache.ResultCache` (see `run_batch_cached`).
+Functions:
+    run_job(user_written_code: str, inputs: list, max_cycles: int, time_limit: float) -> dict
+    run_batch(jobs: list, max_cycles: int, time_limit: float, executor: Executor, chunk_size: int)
+        -> list[dict]
+    run_batch_parallel(jobs: list, max_cycles: int, time_limit: float, workers: int,
+        chunk_size: int) -> list[dict]
+    run_batch_lockstep(jobs: list, max_cycles: int, time_limit: float) -> list[dict]
+    run_input_trie(memory_and_registers: dict, jobs: list, results: list, max_cycles: int,
+        time_limit: float)
+    run_batch_shared(jobs: list, max_cycles: int, time_limit: float) -> list[dict]
+    run_batch_cached(jobs: list, run_function: Callable, cache: ResultCache, max_cycles: int,
+        time_limit: float, detect_loops: bool) -> list[dict]"""
+
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import compile_assembly
+import computer as computer_module
+import lockstep_engine
+import result_cache
+
+# default limits on how long one job can run for
+DEFAULT_JOB_CYCLES = 100_000
+DEFAULT_JOB_SECONDS = 2.0
+
+def run_job(user_written_code: str, inputs: list, max_cycles: int = DEFAULT_JOB_CYCLES,
+            time_limit: float = DEFAULT_JOB_SECONDS):
+    """Compile a program and run it until it halts, taking the value for each INP instruction from
+    a list of inputs.
+
+    Parameters
+    ----------
+    user_written_code : str
+        The original assembly code as written by user.
+    inputs : list[int | str]
+        The values to give to INP instructions, in order.
+    max_cycles : int, optional
+        The maximum number of FDE cycles to run in total.
+    time_limit : float, optional
+        The maximum number of seconds to spend running.
+
+    Returns
+    -------
+    dict
+        If the code is invalid, the reason and line number as returned by /api/check. Otherwise, the
+        values output, the number of cycles and inputs used, the final state of the LMC and the
+        reason execution stopped. "INP" means the program asked for more inputs than were given.
+        If an input was invalid or an invalid instruction was run, the stop reason is "error", the
+        error message is included, and the state is from before the program started.
+    """
+    try:
+        compiled_assembly = compile_assembly.compile_assembly_cached(user_written_code)
+    except ValueError as error:
+        return {
+            "valid": False,
+            "reason": error.args[0],
+            "line_number": error.args[1] if len(error.args) > 1 else "unknown",
+        }
+
+    computer = computer_module.Computer(compiled_assembly["memory_and_registers"])
+    job_result = {
+        "valid": True,
+        "outputs": [],
+        "cycles": 0,
+        "inputs_used": 0,
+    }
+    try:
+        run_result = computer.run_blocks(max_cycles, time_limit, detect_loops=True, inputs=inputs)
+        job_result["outputs"] = run_result["outputs"]
+        job_result["cycles"] = run_result["cycles"]
+        job_result["inputs_used"] = run_result["inputs_used"]
+    except (ValueError, OverflowError) as error:
+        job_result["error"] = error.args[0]
+        computer.stop_reason = "error"
+
+    job_result["stop_reason"] = computer.stop_reason
+    job_result["memory_and_registers"] = computer.memory_and_registers
+    return job_result
+
+def default_chunk_size(job_count: int, workers: int | None = None):
+    """Choose how many jobs to send to a worker process at once. Each worker gets about four
+    chunks, which keeps the cost of sending jobs between processes low while still sharing work
+    out evenly when some jobs take longer than others."""
+    workers = workers or os.cpu_count() or 1
+    return max(1, job_count // (workers * 4))
+
+def run_batch(jobs: list, max_cycles: int = DEFAULT_JOB_CYCLES,
+              time_limit: float = DEFAULT_JOB_SECONDS, executor=None, chunk_size=None):
+    """Compile and run many programs, each with its own list of inputs.
+
+    Parameters
+    ----------
+    jobs : list[tuple[str, list]]
+        The user-written code and list of inputs for each job.
+    max_cycles : int, optional
+        The maximum number of FDE cycles to run for each job.
+    time_limit : float, optional
+        The maximum number of seconds to spend running each job.
+    executor : concurrent.futures.Executor, optional
+        The executor (such as a `ProcessPoolExecutor`) to run the jobs on. If not given, jobs are
+        run one after another in this process.
+    chunk_size : int, optional
+        How many jobs to submit to the executor at once. Chosen from the number of jobs if not
+        given.
+
+    Returns
+    -------
+    list[dict]
+        The result of `run_job` for each job, in the same order.
+    """
+    if executor is None:
+        return [
+            run_job(user_written_code, inputs, max_cycles, time_limit)
+            for user_written_code, inputs in jobs
+        ]
+    return list(executor.map(
+        run_job,
+        [user_written_code for user_written_code, _ in jobs],
+        [inputs for _, inputs in jobs],
+        repeat(max_cycles),
+        repeat(time_limit),
+        chunksize=chunk_size or default_chunk_size(len(jobs)),
+    ))
+
+def run_batch_parallel(jobs: list, max_cycles: int = DEFAULT_JOB_CYCLES,
+                       time_limit: float = DEFAULT_JOB_SECONDS, workers=None, chunk_size=None):
+    """Compile and run many programs across a new pool of worker processes. The parameters and
+    return value are the same as for `run_batch`, except that `workers` sets the number of
+    processes (by default, the number of CPU cores)."""
+    with ProcessPoolExecutor(workers) as executor:
+        return run_batch(
+            jobs, max_cycles, time_limit, executor,
+            chunk_size or default_chunk_size(len(jobs), workers),
+        )
+
+def run_batch_lockstep(jobs: list, max_cycles: int = DEFAULT_JOB_CYCLES,
+                       time_limit: float = DEFAULT_JOB_SECONDS):
+    """Compile many programs and run them all together with the lockstep engine, which needs NumPy.
+    The parameters and return value are the same as for `run_batch`, except that infinite loops are
+    not detected (they stop at the cycle limit instead), and the jobs share a time limit of
+    `time_limit` seconds for each job.
+
+    Raises
+    ------
+    ImportError
+        NumPy is not installed.
+    """
+    if not lockstep_engine.is_available():
+        raise ImportError("The lockstep engine needs NumPy, which is not installed")
+    results = [None] * len(jobs)
+    # the index, initial state and integer inputs of each job that can be run
+    runnable = []
+    for index, (user_written_code, inputs) in enumerate(jobs):
+        try:
+            compiled_assembly = compile_assembly.compile_assembly_cached(user_written_code)
+        except ValueError as error:
+            results[index] = {
+                "valid": False,
+                "reason": error.args[0],
+                "line_number": error.args[1] if len(error.args) > 1 else "unknown",
+            }
+            continue
+        state = compiled_assembly["memory_and_registers"]
+        try:
+            inputs = [int(computer_module.validate_input(input_value)) for input_value in inputs]
+        except ValueError as error:
+            results[index] = {
+                "valid": True, "outputs": [], "cycles": 0, "inputs_used": 0, "error": error.args[0],
+                "stop_reason": "error", "memory_and_registers": computer_module.copy_state(state),
+            }
+            continue
+        runnable.append((index, state, inputs))
+
+    run_results = lockstep_engine.run_lockstep(
+        [state for _, state, _ in runnable], [inputs for _, _, inputs in runnable],
+        max_cycles, time_limit * len(jobs),
+    )
+    for (index, _, _), run_result in zip(runnable, run_results):
+        job_result = {
+            "valid": True,
+            "outputs": run_result["outputs"],
+            "cycles": run_result["cycles"],
+            "inputs_used": run_result["inputs_used"],
+        }
+        if "error" in run_result:
+            job_result["error"] = run_result["error"]
+        job_result["stop_reason"] = run_result["stop_reason"]
+        job_result["memory_and_registers"] = run_result["memory_and_registers"]
+        results[index] = job_result
+    return results
+
+def run_input_trie(memory_and_registers: dict, jobs: list, results: list, max_cycles: int,
+                   time_limit: float):
+    """Run one program for many jobs, sharing the work between jobs whose inputs start the same
+    way. The program is run up to its first INP instruction once, then a copy of its state is
+    made for each different first input and run up to the next INP instruction, and so on. This
+    walks a trie of the jobs' inputs, where each node is the state after using a prefix of them.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        The state of the LMC before the program starts, which is not changed.
+    jobs : list[tuple[int, list[int]]]
+        The index and inputs of each job.
+    results : list[dict]
+        The result of every job, as returned by `run_job`, which is filled in when each one stops.
+    max_cycles : int
+        The maximum number of FDE cycles to run each job for in total.
+    time_limit : float
+        The maximum number of seconds to spend running each job in total.
+    """
+    # [(<state>, <jobs that reached it>, <inputs used>, <cycles>, <outputs>, <seconds taken>)]
+    nodes = [(memory_and_registers, jobs, 0, 0, [], 0.0)]
+    while nodes:
+        state, node_jobs, inputs_used, cycles, outputs, seconds = nodes.pop()
+        computer = computer_module.Computer(state)
+        start = time.monotonic()
+        try:
+            run_result = computer.run_blocks(
+                max_cycles - cycles, time_limit - seconds, detect_loops=True,
+            )
+        except (ValueError, OverflowError) as error:
+            for index, _ in node_jobs:
+                results[index] = {
+                    "valid": True, "outputs": [], "cycles": 0, "inputs_used": 0,
+                    "error": error.args[0], "stop_reason": "error",
+                    "memory_and_registers": computer_module.copy_state(memory_and_registers),
+                }
+            continue
+        cycles += run_result["cycles"]
+        outputs = outputs + run_result["outputs"]
+        seconds += time.monotonic() - start
+
+        # the jobs that continue, by their next input
+        forks = defaultdict(list)
+        for index, inputs in node_jobs:
+            if computer.stop_reason == "INP" and inputs_used < len(inputs):
+                forks[inputs[inputs_used]].append((index, inputs))
+                continue
+            results[index] = {
+                "valid": True,
+                "outputs": list(outputs),
+                "cycles": cycles,
+                "inputs_used": inputs_used,
+                "stop_reason": computer.stop_reason,
+                "memory_and_registers": computer_module.copy_state(
+                    run_result["memory_and_registers"],
+                ),
+            }
+        for input_value, fork_jobs in forks.items():
+            computer.finish_after_input(input_value)
+            nodes.append((
+                computer.memory_and_registers, fork_jobs, inputs_used + 1, cycles, outputs, seconds,
+            ))
+
+def run_batch_shared(jobs: list, max_cycles: int = DEFAULT_JOB_CYCLES,
+                     time_limit: float = DEFAULT_JOB_SECONDS):
+    """Compile and run many programs, running each different program once up to each INP
+    instruction and sharing that work between every job whose inputs so far are the same. This is
+    much faster when many jobs share their first inputs and the program does a lot of work before
+    reading them. The parameters and return value are the same as for `run_batch`."""
+    results = [None] * len(jobs)
+    # the index and inputs of the jobs for each program
+    programs = defaultdict(list)
+    for index, (user_written_code, inputs) in enumerate(jobs):
+        try:
+            inputs = [int(computer_module.validate_input(input_value)) for input_value in inputs]
+        except ValueError:
+            # reported the same way as when running the job on its own
+            results[index] = run_job(user_written_code, inputs, max_cycles, time_limit)
+            continue
+        programs[user_written_code].append((index, inputs))
+
+    for user_written_code, program_jobs in programs.items():
+        try:
+            compiled_assembly = compile_assembly.compile_assembly_cached(user_written_code)
+        except ValueError as error:
+            for index, _ in program_jobs:
+                results[index] = {
+                    "valid": False,
+                    "reason": error.args[0],
+                    "line_number": error.args[1] if len(error.args) > 1 else "unknown",
+                }
+            continue
+        run_input_trie(
+            compiled_assembly["memory_and_registers"], program_jobs, results, max_cycles,
+            time_limit,
+        )
+    return results
+
+def run_batch_cached(jobs: list, run_function, cache, max_cycles: int = DEFAULT_JOB_CYCLES,
+                     time_limit: float = DEFAULT_JOB_SECONDS, detect_loops: bool = True):
+    """Compile and run many programs, answering each job from a cache if the same machine code has
+    been run with the same inputs and cycle limit before, and running the rest with another batch
+    function. The results of the jobs that were run are added to the cache.
+
+    Parameters
+    ----------
+    jobs : list[tuple[str, list]]
+        The user-written code and list of inputs for each job.
+    run_function : Callable[[list, int, float], list[dict]]
+        The function to run the jobs not in the cache with, such as `run_batch_shared`.
+    cache : result_cache.ResultCache
+        The cache to look jobs up in and add results to.
+    max_cycles : int, optional
+        The maximum number of FDE cycles to run for each job.
+    time_limit : float, optional
+        The maximum number of seconds to spend running each job.
+    detect_loops : bool, optional
+        Whether `run_function` stops programs stuck in infinite loops, which changes its results.
+
+    Returns
+    -------
+    list[dict]
+        The result of `run_job` for each job, in the same order.
+    """
+    results = [None] * len(jobs)
+    # the index and cache key of each job that has to be run, or None if it can't be cached
+    uncached = []
+    for index, (user_written_code, inputs) in enumerate(jobs):
+        try:
+            compiled_assembly = compile_assembly.compile_assembly_cached(user_written_code)
+            key = result_cache.get_key(
+                compiled_assembly["memory_and_registers"],
+                [computer_module.validate_input(input_value) for input_value in inputs],
+                kind="batch", max_cycles=max_cycles, detect_loops=detect_loops,
+            )
+        except ValueError:
+            # invalid code or inputs are reported by run_function
+            uncached.append((index, None))
+            continue
+        results[index] = cache.get(key)
+        if results[index] is None:
+            uncached.append((index, key))
+
+    if uncached:
+        run_results = run_function(
+            [jobs[index] for index, _ in uncached], max_cycles, time_limit,
+        )
+        for (index, key), job_result in zip(uncached, run_results):
+            results[index] = job_result
+            if key is not None and job_result["stop_reason"] != "time_limit":
+                cache.put(key, job_result)
+    return results
@@ -0,0 +1,251 @@
+"""This script measures how fast the assembler, the engines that run programs and the server are, so
+that changes which slow down the hot paths can be spotted. Each benchmark is run several times and
+the fastest time is kept, which makes results more repeatable. Results are written to a JSON file,
+and can be compared with the results of an earlier run (a baseline).
+Run `python benchmark.py --help` in the `server` directory for the options.
+Functions:
+    make_labelled_program(line_count: int) -> str
+    time_best(function: Callable, rounds: int) -> float
+    run_with_step(memory_and_registers: dict, inputs: list) -> int
+    run_computer(memory_and_registers: dict, method: str, **kwargs) -> dict
+    get_benchmarks() -> dict
+    run_benchmarks(rounds: int, only: list[str]) -> dict
+    compare_results(results: dict, baseline: dict, tolerance: float) -> list[dict]
+    main(argv: list[str]) -> int"""
+
+import argparse
+import functools
+import json
+import platform
+import sys
+import timeit
+from compile_assembly import compile_assembly
+from computer import Computer, copy_state
+from test_programs import COUNTDOWN_PROGRAM, MULTIPLY_PROGRAM
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    EXAMPLE_ASSEMBLY_PROGRAM = f.read()
+
+# the programs run by the engine benchmarks, with the inputs they are given
+WORKLOADS = {
+    "countdown": (COUNTDOWN_PROGRAM, []),
+    "multiply": (MULTIPLY_PROGRAM, []),
+    "example": (EXAMPLE_ASSEMBLY_PROGRAM, ["5"]),
+}
+# results that differ from the baseline by less than this fraction are not reported as regressions
+DEFAULT_TOLERANCE = 0.1
+
+def make_labelled_program(line_count: int = 100):
+    """Make a program of the given number of lines where every line creates a label, and every
+    instruction uses one, to measure the assembler on the largest programs it can get.
+
+    Returns
+    -------
+    str
+        The user-written assembly code.
+    """
+    instruction_count = line_count // 2
+    operations = ["LDA", "ADD", "SUB", "STA", "BRA", "BRZ", "BRP"]
+    lines = []
+    for i in range(instruction_count):
+        operation = operations[i % len(operations)]
+        if operation.startswith("BR"):
+            target = f"line{(i * 7) % instruction_count}"
+        else:
+            target = f"value{(i * 3) % (line_count - instruction_count)}"
+        lines.append(f"line{i} {operation} {target} // comment")
+    for i in range(line_count - instruction_count):
+        lines.append(f"value{i} DAT {i}")
+    return "\n".join(lines)
+
+def time_best(function, rounds: int):
+    """Time a function in several rounds, and return the shortest time one call took in seconds.
+    Each round calls the function enough times to take at least 0.2 seconds, so that very fast
+    functions can still be timed accurately."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(rounds, number)) / number
+
+def run_with_step(memory_and_registers, inputs):
+    """Run a program with `Computer.step` until HLT, using `finish_after_input` for each INP, and
+    return the number of cycles run."""
+    computer = Computer(copy_state(memory_and_registers))
+    inputs = iter(inputs)
+    cycles = 0
+    while True:
+        result = computer.step()
+        cycles += 1
+        if result["reached_HLT"]:
+            return cycles
+        if result["reached_INP"]:
+            computer.finish_after_input(next(inputs))
+
+def run_computer(memory_and_registers, method, **kwargs):
+    """Run a program on a new computer with one of its run methods, without changing the state
+    that is passed in."""
+    return getattr(Computer(copy_state(memory_and_registers)), method)(**kwargs)
+
+def get_benchmarks():
+    """Get every benchmark.
+
+    Returns
+    -------
+    dict[str, tuple[Callable, int | None, str]]
+        For each benchmark name, a function that does the work once, and how many units of work it
+        does (such as FDE cycles) with the name of the unit. If the number of units is None, the
+        result is the time per call in seconds, instead of units per second.
+    """
+    # imported here so that the engine benchmarks can be run without Flask installed
+    import server # pylint: disable=import-outside-toplevel
+
+    labelled_program = make_labelled_program()
+    benchmarks = {
+        "compile_100_lines": (lambda: compile_assembly(labelled_program), 1, "compiles/s"),
+    }
+
+    for name, (program, inputs) in WORKLOADS.items():
+        state = compile_assembly(program)["memory_and_registers"]
+        cycles = run_computer(state, "run_fast", inputs=inputs)["cycles"]
+        benchmarks[f"step_{name}"] = (
+            functools.partial(run_with_step, state, inputs), cycles, "cycles/s",
+        )
+        for granularity in ("trace", "delta"):
+            benchmarks[f"run_{granularity}_{name}"] = (
+                functools.partial(
+                    run_computer, state, "run", granularity=granularity, inputs=inputs,
+                ),
+                cycles, "cycles/s",
+            )
+        for method in ("run_fast", "run_blocks"):
+            benchmarks[f"{method}_{name}"] = (
+                functools.partial(run_computer, state, method, inputs=inputs), cycles, "cycles/s",
+            )
+
+    client = server.app.test_client()
+    example_state = compile_assembly(EXAMPLE_ASSEMBLY_PROGRAM)["memory_and_registers"]
+    countdown_state = compile_assembly(COUNTDOWN_PROGRAM)["memory_and_registers"]
+    benchmarks["flask_compile"] = (
+        lambda: client.post("/api/compile", json={"uncompiledCode": EXAMPLE_ASSEMBLY_PROGRAM}),
+        None, "s",
+    )
+    benchmarks["flask_step"] = (lambda: client.post("/api/step", json=example_state), None, "s")
+    benchmarks["flask_run_countdown"] = (
+        lambda: client.post("/api/run", json=countdown_state), None, "s",
+    )
+    return benchmarks
+
+def run_benchmarks(rounds: int = 5, only=None):
+    """Run the benchmarks.
+
+    Parameters
+    ----------
+    rounds : int, optional
+        How many rounds to time each benchmark for. The fastest is kept.
+    only : list[str], optional
+        If given, only run benchmarks whose names start with one of these.
+
+    Returns
+    -------
+    dict
+        Information about the machine, and the result of each benchmark, with its unit and whether
+        a higher value is better.
+    """
+    results = {}
+    for name, (function, units, unit_name) in get_benchmarks().items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        seconds = time_best(function, rounds)
+        if units is None:
+            results[name] = {"value": seconds, "unit": unit_name, "higher_is_better": False}
+        else:
+            results[name] = {
+                "value": units / seconds, "unit": unit_name, "higher_is_better": True,
+            }
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "rounds": rounds,
+        "results": results,
+    }
+
+def compare_results(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE):
+    """Compare benchmark results with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        The output of `run_benchmarks`.
+    baseline : dict
+        The output of an earlier call to `run_benchmarks`.
+    tolerance : float, optional
+        How much worse (as a fraction) a result can be than the baseline before it counts as a
+        regression.
+
+    Returns
+    -------
+    list[dict]
+        For every benchmark in both, its value and baseline value, the ratio between them (above 1
+        means faster), and whether it is a regression.
+    """
+    comparison = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        baseline_value = baseline["results"][name]["value"]
+        if result["higher_is_better"]:
+            speedup = result["value"] / baseline_value
+        else:
+            speedup = baseline_value / result["value"]
+        comparison.append({
+            "name": name,
+            "value": result["value"],
+            "baseline": baseline_value,
+            "speedup": speedup,
+            "regression": speedup < 1 - tolerance,
+        })
+    return comparison
+
+def main(argv=None):
+    """Run the benchmarks from the command line.
+
+    Returns
+    -------
+    int
+        The exit code: 1 if any benchmark regressed compared to the baseline, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the LMC assembler, engines and server.")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="file to write the results to (default: %(default)s)")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare with")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="rounds to time each benchmark, keeping the fastest (default: 5)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fraction slower than the baseline allowed (default: %(default)s)")
+    parser.add_argument("--only", nargs="*",
+                        help="only run benchmarks whose names start with one of these")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rounds, args.only)
+    for name, result in results["results"].items():
+        print(f"{name:32} {result['value']:14.6g} {result['unit']}")
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        results["comparison"] = compare_results(results, baseline, args.tolerance)
+        print()
+        for row in results["comparison"]:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['name']:32} {row['speedup']:6.2f}x baseline{flag}")
+        regressed = any(row["regression"] for row in results["comparison"])
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=4)
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""This file contains a compact binary trace of every FDE cycle of a run, written to a local file as
+the program runs, for looking into very long runs afterwards. The trace is only ever appended to,
+so it can be read while it is still being written, and a run that is stopped part of the way
+through leaves a trace of every cycle written so far. It is read through `mmap`, so traces of
+millions of cycles can be searched without loading them into memory.
+The trace file begins with a header: the bytes "LMCT", the format version (16-bit), the number of
+cycles in each index chunk (32-bit), and the 100 memory locations before the first cycle (16-bit
+each). Then there is one 8-byte record for each cycle: the address of the instruction run, the
+CARRY after the cycle, the memory location written to (or 255 if none, and the value written is
+the ACC), a padding byte, the instruction (16-bit), and the ACC after the cycle (16-bit).
+The index is a second file, at the same path with ".index" added, with an entry at the end of
+every chunk of cycles: a 100-bit mask (two 64-bit integers) of the memory addresses that the
+chunk's instructions were at or referred to, then the 100 memory locations after the chunk. The
+masks let a search skip chunks that never use an address, and the memory lets the reader rebuild
+memory at any cycle by replaying no more than one chunk of writes.
+All integers are little-endian.
+Classes:
+    TraceRecord
+    TraceWriter
+    TraceReader
+Functions:
+    run_traced(memory_and_registers: dict, trace: TraceWriter, max_cycles: int, time_limit: float,
+        detect_loops: bool, inputs: list[int]) -> dict"""
+
+import mmap
+import struct
+from collections import namedtuple
+import fast_engine
+
+MAGIC = b"LMCT"
+VERSION = 1
+# how many cycles each index entry covers
+DEFAULT_INDEX_INTERVAL = 4096
+# the memory location stored in a record for a cycle that did not write to memory
+NO_WRITE = 255
+
+HEADER_STRUCT = struct.Struct("<4sHI100H")
+RECORD_STRUCT = struct.Struct("<BBBxHH")
+INDEX_STRUCT = struct.Struct("<2Q100H")
+# the mask of every address, so that each address sets its own bit in an index mask
+ADDRESS_BITS = tuple(1 << address for address in range(100))
+LOW_MASK = (1 << 64) - 1
+
+TraceRecord = namedtuple(
+    "TraceRecord", ("cycle", "pc", "opcode", "operand", "acc", "carry", "write_address"),
+)
+TraceRecord.__doc__ = """A `TraceRecord` is one cycle of a trace. `cycle` counts the cycles
+before it, `pc` is the address of the instruction run, `acc` and `carry` are the registers after the
+cycle, and `write_address` is the memory location that ACC was stored in, or None."""
+
+class TraceWriter:
+    """A `TraceWriter` writes the trace of one or more runs to a new file at `path` (and its index
+    to `path` + ".index"). Runs written with the same `TraceWriter`, such as the runs before and
+    after each INP, continue the same trace. It must be closed to write the last records."""
+    def __init__(self, path: str, index_interval: int = DEFAULT_INDEX_INTERVAL):
+        self.path = path
+        self.index_path = path + ".index"
+        self.index_interval = index_interval
+        # the number of records written so far
+        self.records = 0
+        # the addresses used by the records in the current index chunk, as a mask
+        self.mask = 0
+        self.__file = open(path, "wb")
+        self.__index_file = open(self.index_path, "wb")
+        self.__started = False
+
+    def start(self, memory):
+        """Get ready to write a run, writing the header with the memory before it if this is the
+        first one."""
+        if not self.__started:
+            self.__file.write(HEADER_STRUCT.pack(MAGIC, VERSION, self.index_interval, *memory))
+            self.__started = True
+
+    def write(self, records: bytearray, memory=None):
+        """Write packed records, followed by an index entry if they finish a chunk.
+
+        Parameters
+        ----------
+        records : bytearray
+            The records, which must not go past the end of the current chunk.
+        memory : Sequence[int], optional
+            The memory after the records, needed if they finish a chunk.
+        """
+        self.__file.write(records)
+        self.records += len(records) // RECORD_STRUCT.size
+        if self.records % self.index_interval == 0 and records:
+            self.__index_file.write(
+                INDEX_STRUCT.pack(self.mask & LOW_MASK, self.mask >> 64, *memory),
+            )
+            self.mask = 0
+
+    def flush(self):
+        """Write everything buffered to the files, so that a `TraceReader` can read it."""
+        self.__file.flush()
+        self.__index_file.flush()
+
+    def close(self):
+        """Write everything buffered and close the files."""
+        self.__file.close()
+        self.__index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+traced_loop = fast_engine.generate_run_loop({
+    "setup": """
+        context.start(memory)
+        pack = RECORD_STRUCT.pack
+        records = bytearray()
+        # how many more records finish the current index chunk
+        chunk_left = context.index_interval - context.records % context.index_interval
+        mask = context.mask
+    """,
+    "fetch": """
+        address = pc
+        instruction = mdr
+        write_address = NO_WRITE
+    """,
+    "store": "write_address = operand",
+    "end_cycle": """
+        records += pack(address, carry, write_address, instruction, acc)
+        mask |= ADDRESS_BITS[address] | ADDRESS_BITS[operand]
+        chunk_left -= 1
+        if chunk_left == 0:
+            context.mask = mask
+            context.write(records, memory)
+            records = bytearray()
+            chunk_left = context.index_interval
+            mask = 0
+    """,
+    "finish": """
+        context.mask = mask
+        context.write(records)
+    """,
+}, {"RECORD_STRUCT": RECORD_STRUCT, "NO_WRITE": NO_WRITE, "ADDRESS_BITS": ADDRESS_BITS})
+
+def run_traced(memory_and_registers, trace, max_cycles=None, time_limit=None,
+               detect_loops=False, inputs=()):
+    """Keep running FDE cycles until a HLT or INP instruction is reached, or until one of the
+    optional limits stops execution early, writing every cycle to a trace. The parameters and
+    return value are the same as for `fast_engine.run_fast`. If an error stops the run, the cycles
+    before it are still written.
+
+    Raises
+    ------
+    OverflowError
+        The program counter would have been incremented above 99.
+    ValueError
+        An invalid instruction beginning in 0 or 9 was executed.
+    """
+    return traced_loop(
+        memory_and_registers, max_cycles, time_limit, detect_loops, inputs, trace,
+    )
+
+class TraceReader:
+    """A `TraceReader` reads a trace written by a `TraceWriter`, and its index, through `mmap`.
+    Only the records written (and flushed) before it was opened can be read."""
+    def __init__(self, path: str):
+        with open(path, "rb") as trace_file:
+            self.__mmap = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.index_interval, *self.initial_memory = HEADER_STRUCT.unpack_from(
+            self.__mmap,
+        )
+        if magic != MAGIC or version != VERSION:
+            self.__mmap.close()
+            raise ValueError("Not an LMC trace file, or written by a different version")
+        self.__records = memoryview(self.__mmap)[HEADER_STRUCT.size:]
+        # a record being written when the file was opened is ignored
+        self.__length = len(self.__records) // RECORD_STRUCT.size
+
+        self.__index_mmap = None
+        self.__index = memoryview(b"")
+        with open(path + ".index", "rb") as index_file:
+            index_size = index_file.seek(0, 2)
+            if index_size:
+                self.__index_mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__index = memoryview(self.__index_mmap)
+        # the index can be ahead of the records if they have not all been written yet
+        self.__indexed_chunks = min(
+            len(self.__index) // INDEX_STRUCT.size, self.__length // self.index_interval,
+        )
+
+    def __len__(self):
+        """The number of cycles in the trace."""
+        return self.__length
+
+    def __get_record(self, cycle, values):
+        pc, carry, write_address, instruction, acc = values
+        return TraceRecord(
+            cycle, pc, instruction // 100, instruction % 100, acc, carry,
+            None if write_address == NO_WRITE else write_address,
+        )
+
+    def __getitem__(self, cycle: int):
+        """Get the record of one cycle, counting from 0."""
+        if not 0 <= cycle < self.__length:
+            raise IndexError("Cycle is not in the trace")
+        return self.__get_record(
+            cycle, RECORD_STRUCT.unpack_from(self.__records, cycle * RECORD_STRUCT.size),
+        )
+
+    def __range(self, start, stop):
+        """Clamp a range of cycles to the trace."""
+        stop = self.__length if stop is None else min(stop, self.__length)
+        return max(start, 0), stop
+
+    def records(self, start: int = 0, stop: int = None):
+        """Iterate over the records of the cycles from start up to (not including) stop, or to the
+        end of the trace."""
+        start, stop = self.__range(start, stop)
+        if start >= stop:
+            return
+        size = RECORD_STRUCT.size
+        for cycle, values in enumerate(
+            RECORD_STRUCT.iter_unpack(self.__records[start * size:stop * size]), start,
+        ):
+            yield self.__get_record(cycle, values)
+
+    def __get_index_entry(self, chunk):
+        return INDEX_STRUCT.unpack_from(self.__index, chunk * INDEX_STRUCT.size)
+
+    def filter_address(self, address: int, start: int = 0, stop: int = None):
+        """Iterate over the records of the cycles that ran the instruction at an address, or whose
+        instruction referred to it (read, wrote or branched to it), from start up to stop. Chunks
+        of the trace that the index shows never used the address are skipped."""
+        start, stop = self.__range(start, stop)
+        bit = ADDRESS_BITS[address]
+        chunk = start // self.index_interval
+        while start < stop:
+            chunk_stop = min(stop, (chunk + 1) * self.index_interval)
+            if chunk < self.__indexed_chunks:
+                low, high, *_ = self.__get_index_entry(chunk)
+                if not (low | high << 64) & bit:
+                    start, chunk = chunk_stop, chunk + 1
+                    continue
+            for record in self.records(start, chunk_stop):
+                if record.pc == address or (
+                    record.operand == address and record.opcode in (1, 2, 3, 5, 6, 7, 8)
+                ):
+                    yield record
+            start, chunk = chunk_stop, chunk + 1
+
+    def get_memory(self, cycle: int):
+        """Rebuild the memory before a cycle (after `cycle` cycles), from the nearest memory stored
+        in the index and the writes after it. This is only right if memory was not changed between
+        the runs written to the trace.
+
+        Returns
+        -------
+        list[int]
+            The 100 memory locations.
+        """
+        if not 0 <= cycle <= self.__length:
+            raise IndexError("Cycle is not in the trace")
+        chunk = min(cycle // self.index_interval, self.__indexed_chunks)
+        if chunk == 0:
+            memory = list(self.initial_memory)
+        else:
+            memory = list(self.__get_index_entry(chunk - 1)[2:])
+        for record in self.records(chunk * self.index_interval, cycle):
+            if record.write_address is not None:
+                memory[record.write_address] = record.acc
+        return memory
+
+    def close(self):
+        """Close the trace. It can't be read afterwards."""
+        self.__records.release()
+        self.__index.release()
+        self.__mmap.close()
+        if self.__index_mmap is not None:
+            self.__index_mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
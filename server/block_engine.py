@@ -0,0 +1,297 @@
+"""This file contains an engine that runs programs one basic block at a time instead of one
+instruction at a time. A basic block is a run of instructions that ends at a BRZ, BRP, INP, OUT or
+HLT instruction. A BRA instruction is joined onto the block it branches to, so a block can jump
+around memory. The first time a block is reached, it is turned into a generated Python function
+that runs all of its instructions at once, and the function is cached, including between runs. A
+block that branches back to its own start repeats inside its function, so a tight loop does not go
+back through the engine every time round. If an STA instruction writes to a memory location inside
+a cached block, the block is thrown away and found again the next time it is reached, so programs
+that modify their own code still run correctly.
+When a block that repeats is a counting loop (see counting_loops.py), every iteration but the last
+is skipped by working out its effect on memory directly.
+Like the fast engine, this does not record transfers, and gives the same final state as running
+the same number of cycles with `Computer.step`.
+Classes:
+    Block
+Functions:
+    compile_block(memory: array, start: int) -> Block
+    get_block(instructions: tuple) -> Block
+    run_blocks(memory_and_registers: dict, max_cycles: int, time_limit: float, detect_loops: bool,
+        inputs: list[int]) -> dict"""
+
+import functools
+import time
+from counting_loops import find_counting_loop
+import fast_engine
+
+# opcodes of instructions that end a basic block. 0 and 9 are HLT, INP, OUT or invalid instructions
+BLOCK_ENDING_OPCODES = {0, 7, 8, 9}
+# the most instructions that BRA instructions can join into one block
+MAX_BLOCK_LENGTH = 100
+# how many generated blocks to keep between runs
+BLOCK_CACHE_SIZE = 4096
+# roughly how many cycles to run between each check of the time limit
+TIME_CHECK_INTERVAL = 4096
+
+class Block:
+    """A `Block` holds the generated function for one basic block, and what is needed to update
+    the registers after running it."""
+    def __init__(self, instructions):
+        self.start = instructions[0][0]
+        self.length = len(instructions)
+        # memory locations holding the block's instructions
+        self.cells = tuple(address for address, _, _, _ in instructions)
+        # memory locations written to by STA instructions in the block
+        self.writes = tuple(sorted({
+            operand for _, _, opcode, operand in instructions if opcode == 3
+        }))
+        _, _, self.last_opcode, self.last_operand = instructions[-1]
+        # whether the block can branch back to its own start, so can repeat inside its function
+        self.repeats = self.last_opcode in (6, 7, 8) and self.start in (
+            self.last_operand, self.cells[-1] + 1,
+        )
+        self.function = self.__generate_function(instructions)
+        # the counting loop the block runs, if it is one
+        self.counting_loop = find_counting_loop(instructions) if self.repeats else None
+
+    def __generate_function(self, instructions):
+        """Generate a function that runs every instruction in the block.
+
+        The function takes the memory, ACC, CARRY, list of outputs and the most times to repeat the
+        block, and returns the new ACC, CARRY, MDR and PC, and the number of times the block ran.
+        """
+        # only the last ADD or SUB in the block decides the value of CARRY
+        last_arithmetic = max(
+            (index for index, (_, _, opcode, _) in enumerate(instructions) if opcode in (1, 2)),
+            default=None,
+        )
+        indent = "        " if self.repeats else "    "
+        lines = ["def block(memory, acc, carry, outputs, repeats):"]
+        if self.repeats:
+            lines.append("    for count in range(1, repeats + 1):")
+        for index, (_, _, opcode, operand) in enumerate(instructions):
+            if opcode in (1, 2):
+                sign = "+" if opcode == 1 else "-"
+                if index == last_arithmetic:
+                    lines.append(f"{indent}acc {sign}= memory[{operand}]")
+                    condition = "acc > 999" if opcode == 1 else "acc < 0"
+                    lines.append(f"{indent}carry = 1 if {condition} else 0")
+                    lines.append(f"{indent}acc %= 1000")
+                else:
+                    lines.append(f"{indent}acc = (acc {sign} memory[{operand}]) % 1000")
+            elif opcode == 5:
+                lines.append(f"{indent}acc = memory[{operand}]")
+            elif opcode == 3:
+                lines.append(f"{indent}memory[{operand}] = acc")
+            elif opcode == 9 and operand == 2:
+                lines.append(f"{indent}outputs.append(str(acc).zfill(3))")
+            # opcode 4 does nothing, BRA is joined onto the next instruction, and the others end
+            # the block so are handled below
+
+        last_address, last_value, last_opcode, last_operand = instructions[-1]
+        next_address = last_address + 1
+        lines.append(indent + "pc = " + {
+            6: str(last_operand),
+            7: f"{last_operand} if acc == 0 else {next_address}",
+            8: f"{last_operand} if carry == 1 else {next_address}",
+        }.get(last_opcode, str(next_address)))
+        if self.repeats:
+            lines.append(f"{indent}if pc != {self.start}:")
+            lines.append(f"{indent}    break")
+        else:
+            lines.append("    count = 1")
+        mdr = f"memory[{last_operand}]" if last_opcode in (1, 2, 5) else str(last_value)
+        lines.append(f"    return acc, carry, {mdr}, pc, count")
+
+        namespace = {}
+        exec("\n".join(lines), namespace) # pylint: disable=exec-used
+        return namespace["block"]
+
+def compile_block(memory, start):
+    """Find the basic block beginning at a memory address and generate its function.
+
+    The block ends at the first instruction other than BRA that can change the flow of the program.
+    It also ends just after any STA instruction that writes to the block itself, so that the
+    instructions run by the generated function are always the ones in memory.
+
+    Parameters
+    ----------
+    memory : array
+        The 100 memory cells as integers.
+    start : int
+        The address of the first instruction in the block, 0-98.
+
+    Returns
+    -------
+    Block
+        The compiled block.
+    """
+    instructions = []
+    visited = set()
+    address = start
+    # the instruction at 99 can never be run, as the PC can't be incremented past it
+    while address < 99 and address not in visited and len(instructions) < MAX_BLOCK_LENGTH:
+        visited.add(address)
+        opcode, operand = divmod(memory[address], 100)
+        instructions.append((address, memory[address], opcode, operand))
+        if opcode in BLOCK_ENDING_OPCODES:
+            break
+        address = operand if opcode == 6 else address + 1
+
+    for index, (_, _, opcode, operand) in enumerate(instructions):
+        if opcode == 3 and operand in visited:
+            instructions = instructions[:index + 1]
+            break
+    return get_block(tuple(instructions))
+
+@functools.lru_cache(maxsize=BLOCK_CACHE_SIZE)
+def get_block(instructions):
+    """Get the block for a tuple of instructions, reusing the one generated by an earlier run if
+    the same instructions were at the same addresses. Blocks do not change after being generated,
+    so the same one can be used by many runs."""
+    return Block(instructions)
+
+def run_blocks(memory_and_registers, max_cycles=None, time_limit=None, detect_loops=False,
+               inputs=()):
+    """Keep running basic blocks until a HLT or INP instruction is reached, or until one of the
+    optional limits stops execution early. The parameters and return value are the same as for
+    `fast_engine.run_fast`, except that the time limit and loops are only checked between blocks,
+    so execution can stop a few cycles later than with the fast engine.
+
+    Raises
+    ------
+    OverflowError
+        The program counter would have been incremented above 99.
+    ValueError
+        An invalid instruction beginning in 0 or 9 was executed.
+    """
+    memory, registers = fast_engine.decode_state(memory_and_registers)
+    pc = registers["PC"]
+    acc = registers["ACC"]
+    carry = registers["CARRY"]
+    opcode = registers["IR"]
+    operand = registers["MAR"]
+    mdr = registers["MDR"]
+
+    outputs = []
+    cycles = 0
+    inputs_used = 0
+    stop_reason = None
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    next_time_check = 0
+    # states seen at the start of blocks since memory last changed, each packed into one integer
+    seen_states = set() if detect_loops else None
+
+    blocks = [None] * 100 # the cached block starting at each memory location
+    # the start address of every cached block containing each memory location
+    cell_blocks = [set() for _ in range(100)]
+
+    while True:
+        # checked before the PC is, as running out of cycles at address 99 is not an error
+        if max_cycles is not None and cycles >= max_cycles:
+            stop_reason = "cycle_limit"
+            break
+        if deadline is not None and cycles >= next_time_check:
+            if time.monotonic() >= deadline:
+                stop_reason = "time_limit"
+                break
+            next_time_check = cycles + TIME_CHECK_INTERVAL
+
+        block = blocks[pc]
+        if block is None:
+            if pc == 99:
+                raise OverflowError("Can't increment PC to a value above 99.")
+            block = compile_block(memory, pc)
+            blocks[pc] = block
+            for cell in block.cells:
+                cell_blocks[cell].add(pc)
+
+        if block.counting_loop is not None:
+            iterations = block.counting_loop.get_iterations_to_skip(memory)
+            if max_cycles is not None:
+                # leave at least one iteration to run normally before the cycle limit
+                budget = (max_cycles - cycles) // block.length - 1
+                iterations = budget if iterations is None else min(iterations, budget)
+            if iterations is not None and iterations > 0:
+                acc, carry = block.counting_loop.skip(memory, iterations)
+                cycles += iterations * block.length
+                if seen_states is not None:
+                    seen_states.clear()
+
+        repeats = 1
+        if block.repeats and seen_states is None:
+            # repeat until the time limit next needs checking, or the cycle limit would be passed
+            repeats = TIME_CHECK_INTERVAL // block.length + 1
+            if max_cycles is not None:
+                repeats = min(repeats, (max_cycles - cycles) // block.length)
+        if max_cycles is not None and (repeats == 0 or cycles + block.length > max_cycles):
+            # not enough cycles left to run the whole block, so finish one cycle at a time
+            registers = {
+                "PC": pc, "ACC": acc, "IR": opcode, "MAR": operand, "MDR": mdr, "CARRY": carry,
+            }
+            result = fast_engine.run_fast(
+                fast_engine.encode_state(memory, registers),
+                max_cycles - cycles,
+                None if deadline is None else max(deadline - time.monotonic(), 0),
+                detect_loops,
+                inputs[inputs_used:],
+            )
+            result["outputs"] = outputs + result["outputs"]
+            result["cycles"] += cycles
+            result["inputs_used"] += inputs_used
+            return result
+
+        memory_before = None
+        if seen_states is not None and block.writes:
+            memory_before = [memory[address] for address in block.writes]
+
+        acc, carry, mdr, pc, count = block.function(memory, acc, carry, outputs, repeats)
+        cycles += block.length * count
+        opcode, operand = block.last_opcode, block.last_operand
+
+        # throw away any cached blocks that have just been written to
+        for address in block.writes:
+            for start in list(cell_blocks[address]):
+                for cell in blocks[start].cells:
+                    cell_blocks[cell].discard(start)
+                blocks[start] = None
+
+        if opcode == 0:
+            if operand != 0:
+                raise ValueError("Invalid instruction beginning in 0 or 9")
+            stop_reason = "HLT"
+            break
+        if opcode == 9 and operand != 2:
+            if operand != 1:
+                raise ValueError("Invalid instruction beginning in 0 or 9")
+            if inputs_used == len(inputs):
+                stop_reason = "INP"
+                break
+            acc = inputs[inputs_used]
+            inputs_used += 1
+            if seen_states is not None:
+                seen_states.clear()
+
+        if seen_states is not None:
+            if memory_before is not None and memory_before != [
+                memory[address] for address in block.writes
+            ]:
+                seen_states.clear()
+            state = (pc * 1000 + acc) * 2 + carry
+            if state in seen_states:
+                stop_reason = "loop_detected"
+                break
+            seen_states.add(state)
+
+    registers = {
+        "PC": pc, "ACC": acc, "IR": opcode, "MAR": operand, "MDR": mdr, "CARRY": carry,
+    }
+    return {
+        "memory_and_registers": fast_engine.encode_state(memory, registers),
+        "reached_HLT": stop_reason == "HLT",
+        "reached_INP": stop_reason == "INP",
+        "outputs": outputs,
+        "cycles": cycles,
+        "inputs_used": inputs_used,
+        "stop_reason": stop_reason,
+    }
@@ -0,0 +1,144 @@
+"""This file contains breakpoints and watchpoints for running programs. Everything that can stop a
+run is turned into lookup tables before the run starts, so each cycle only has to index a table to
+check them, and runs cost little more when nothing is triggered.
+A breakpoint stops a run before the instruction at its address is run, except on the first cycle of
+the run, so that running again continues past it. A watchpoint stops a run after a cycle that
+writes to a register (ACC or CARRY) or memory location, if the value written meets its condition.
+Watchpoints are dictionaries such as:
+    {"register": "ACC", "condition": "==", "value": 0}
+    {"address": 42}  (stops whenever memory location 42 is written to)
+    {"address": 42, "condition": ">", "value": 500}
+Classes:
+    Breakpoints
+Functions:
+    is_integer(value: Any) -> bool
+    get_line_addresses(line_numbers: list[int], lines: list[int]) -> list[int]"""
+
+import operator
+
+CONDITIONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+# the values each register that can be watched can hold
+WATCHABLE_REGISTERS = {"ACC": 1000, "CARRY": 2}
+
+def is_integer(value):
+    """Whether a value from a request is an integer (and not a boolean)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def get_line_addresses(line_numbers, lines):
+    """Find the memory address that each line of user-written code was compiled into.
+
+    Parameters
+    ----------
+    line_numbers : list[int]
+        The line number of each memory address, from `compile_assembly.get_line_numbers`.
+    lines : list[int]
+        The line numbers (counting from 1) to find.
+
+    Returns
+    -------
+    list[int]
+        The address of each line.
+
+    Raises
+    ------
+    ValueError
+        A line was not compiled into memory, e.g. because it is empty or only a comment.
+    """
+    addresses = []
+    for line in lines:
+        if line not in line_numbers:
+            raise ValueError(f"Line {line} does not contain an instruction")
+        addresses.append(line_numbers.index(line))
+    return addresses
+
+class Breakpoints:
+    """A `Breakpoints` object holds the breakpoints (memory addresses to stop at) and watchpoints
+    for a run, as tables indexed by memory address, or by the value written. Watchpoint tables hold
+    the index of the first watchpoint that is triggered plus one, or 0 if none is. A ValueError is
+    raised if an address or watchpoint is not valid."""
+    def __init__(self, addresses=(), watchpoints=()):
+        self.watchpoints = list(watchpoints)
+        # 1 at each address with a breakpoint
+        self.addresses = bytearray(100)
+        for address in addresses:
+            if not (is_integer(address) and 0 <= address <= 99):
+                raise ValueError("Breakpoint addresses must be integers 0-99")
+            self.addresses[address] = 1
+
+        # the watchpoint triggered by writing each value to the ACC and CARRY
+        self.acc = [0] * WATCHABLE_REGISTERS["ACC"]
+        self.carry = [0] * WATCHABLE_REGISTERS["CARRY"]
+        # for each memory address, None if it is not watched, otherwise the watchpoint triggered by
+        # writing each value to it
+        self.memory = [None] * 100
+        for index, watchpoint in enumerate(self.watchpoints):
+            self.__add_watchpoint(index, watchpoint)
+
+    def __add_watchpoint(self, index, watchpoint):
+        """Fill in the tables for one watchpoint."""
+        if not isinstance(watchpoint, dict):
+            raise ValueError("Each watchpoint must be an object")
+        if "condition" in watchpoint:
+            if watchpoint["condition"] not in CONDITIONS or not is_integer(watchpoint.get("value")):
+                raise ValueError(
+                    f"Watchpoint conditions must be one of {', '.join(CONDITIONS)}, with an "
+                    "integer value"
+                )
+            condition = CONDITIONS[watchpoint["condition"]]
+            value = watchpoint["value"]
+            def is_triggered(written_value):
+                return condition(written_value, value)
+        else:
+            def is_triggered(_):
+                return True
+
+        if watchpoint.get("register") in WATCHABLE_REGISTERS:
+            if "condition" not in watchpoint:
+                raise ValueError("Register watchpoints need a condition")
+            table = self.acc if watchpoint["register"] == "ACC" else self.carry
+        elif is_integer(watchpoint.get("address")) and 0 <= watchpoint["address"] <= 99:
+            if self.memory[watchpoint["address"]] is None:
+                self.memory[watchpoint["address"]] = [0] * 1000
+            table = self.memory[watchpoint["address"]]
+        else:
+            raise ValueError(
+                "Watchpoints need a register (ACC or CARRY) or a memory address 0-99"
+            )
+        for written_value, triggered in enumerate(table):
+            if not triggered and is_triggered(written_value):
+                table[written_value] = index + 1
+
+    def get_watchpoint(self, opcode: int, operand: int, acc: int, carry: int):
+        """Find which watchpoint, if any, is triggered by a cycle that has just been run.
+
+        Parameters
+        ----------
+        opcode : int
+            The opcode of the instruction that was run.
+        operand : int
+            Its operand.
+        acc : int
+            The value of the ACC after the cycle.
+        carry : int
+            The value of the CARRY after the cycle.
+
+        Returns
+        -------
+        int | None
+            The index of the watchpoint, or None if none were triggered.
+        """
+        triggered = 0
+        if opcode in (1, 2):
+            triggered = self.acc[acc] or self.carry[carry]
+        elif opcode == 5 or (opcode == 9 and operand == 1):
+            triggered = self.acc[acc]
+        elif opcode == 3 and self.memory[operand] is not None:
+            triggered = self.memory[operand][acc]
+        return triggered - 1 if triggered else None
@@ -1,10 +1,19 @@
 """This script contains the logic to compile user-written assembly code into object code (labels
 made numerical and comments removed) and machine code (instructions become three-digit numbers in
 base 10).
+Classes:
+    CompileCache
 Functions:
     validate_label_name(label: str, line_number: int) -> None
-    compile_assembly(user_written_code: str) -> result
-    check_assembly(user_written_code: str) -> bool"""
+    compile_assembly(user_written_code: str, analyse: bool) -> result
+    check_assembly(user_written_code: str) -> bool
+    get_line_numbers(user_written_code: str) -> list[int]
+    normalise_code(user_written_code: str) -> str
+    compile_assembly_cached(user_written_code: str, analyse: bool) -> result"""
+
+import hashlib
+from collections import OrderedDict
+import program_analysis
 
 mnemonic_operations_0_args = {"INP", "OUT", "HLT", "DAT"}
 mnemonic_operations_1_arg_is_label = {"ADD", "SUB", "STA", "LDA", "BRA", "BRZ", "BRP"}
@@ -35,111 +44,180 @@ def validate_label_name(label: str, line_number: int):
             line_number,
         )
 
-# todo: could this function benefit from more decomposition?
-def compile_assembly(user_written_code: str):
-    """Compile user-written assembly into object code and machine code (memory/register contents).
+def parse_line(line: str, original_line_number: int):
+    """Tokenise one line of user-written assembly into its intermediate form.
 
     Parameters
     ----------
-    user_written_code : str
-        The original assembly code as written by user.
+    line : str
+        One line of the original assembly code as written by user.
+    original_line_number : int
+        The line number of this line in the user-written code.
 
     Returns
     -------
-    dict
-        The result dictionary, containing object and machine code.
+    dict | None
+        The operation on this line and any label it creates or uses, or None if the line is empty
+        (or only contains a comment).
 
     Raises
     ------
     ValueError
         Incorrect assembly code written by user.
     """
-    lines = []
-    for index, line in enumerate(user_written_code.split("\n")):
-        original_line_number = index + 1
-        line = line.split("//")[0] # remove comment from line
-        line = line.strip().upper()
-        words = line.split()
-        if line == "":
-            # this is an empty line, we can ignore it without raising an error
-            continue
-        if len(words) > 3:
-            raise ValueError("There cannot be more than 3 words on one line", original_line_number)
-
-        if len(words) == 1:
-            if line in mnemonic_operations_0_args:
-                lines.append({ "operation": line })
-            else:
-                # received a line with only 1 word, but it is not an operation that takes no args
-                if line in mnemonic_operations:
-                    raise ValueError("Missing an argument for operation", original_line_number)
-                raise ValueError(f"Invalid operation \"{line}\"", original_line_number)
-
-        elif len(words) == 2:
-            if words[0] in mnemonic_operations_1_arg_is_label:
-                lines.append({
-                    "uses_label": words[1],
-                    "operation": words[0],
-                })
-            elif words[1] in mnemonic_operations_0_args:
-                # line has structure <label> <operation>
-                label = words[0]
-                operation = words[1]
-                validate_label_name(label, original_line_number)
-                lines.append({
-                    "create_label": label,
-                    "operation": operation,
-                })
-            else:
-                raise ValueError("Invalid line. Could not find operation.", original_line_number)
+    line = line.split("//")[0] # remove comment from line
+    line = line.strip().upper()
+    words = line.split()
+    if line == "":
+        # this is an empty line, we can ignore it without raising an error
+        return None
+    if len(words) > 3:
+        raise ValueError("There cannot be more than 3 words on one line", original_line_number)
 
-        else:
-            # len(words) is 3
-            # words[1] must be the operation
-            if words[1] not in mnemonic_operations_1_arg:
-                if words[1] in mnemonic_operations_0_args:
-                    raise ValueError(
-                        "Operation does not take arguments, received one.",
-                        original_line_number
-                    )
+    if len(words) == 1:
+        if line in mnemonic_operations_0_args:
+            return { "operation": line }
+        # received a line with only 1 word, but it is not an operation that takes no args
+        if line in mnemonic_operations:
+            raise ValueError("Missing an argument for operation", original_line_number)
+        raise ValueError(f"Invalid operation \"{line}\"", original_line_number)
+
+    elif len(words) == 2:
+        if words[0] in mnemonic_operations_1_arg_is_label:
+            return {
+                "uses_label": words[1],
+                "operation": words[0],
+            }
+        if words[1] in mnemonic_operations_0_args:
+            # line has structure <label> <operation>
+            label = words[0]
+            operation = words[1]
+            validate_label_name(label, original_line_number)
+            return {
+                "create_label": label,
+                "operation": operation,
+            }
+        raise ValueError("Invalid line. Could not find operation.", original_line_number)
+
+    else:
+        # len(words) is 3
+        # words[1] must be the operation
+        if words[1] not in mnemonic_operations_1_arg:
+            if words[1] in mnemonic_operations_0_args:
                 raise ValueError(
-                    "Line with 3 words should have structure: <label>, <operation>, <value>.",
+                    "Operation does not take arguments, received one.",
                     original_line_number
                 )
-            # process label in words[0] and value in words[2]
-            label = words[0]
-            operation = words[1]
-            arg = words[2]
+            raise ValueError(
+                "Line with 3 words should have structure: <label>, <operation>, <value>.",
+                original_line_number
+            )
+        # process label in words[0] and value in words[2]
+        label = words[0]
+        operation = words[1]
+        arg = words[2]
 
-            # validate label
-            validate_label_name(label, original_line_number)
+        # validate label
+        validate_label_name(label, original_line_number)
+
+        if operation == "DAT":
+            # validate value
+            if not arg.isdigit():
+                raise ValueError(
+                    f"Expected number 0-999, received {arg} (not a number)",
+                    original_line_number,
+                )
+            if not 0 <= int(arg) <= 999:
+                raise ValueError(
+                    f"Expected number 0-999, received {arg} (out of range)",
+                    original_line_number,
+                )
+
+            return {
+                "create_label": label,
+                "operation": words[1],
+                "value": arg.zfill(3),
+            }
+        # line has structure <label being created> <operation> <label being used as opcode>
+        return {
+            "create_label": label,
+            "operation": words[1],
+            "uses_label": arg,
+        }
 
-            if operation == "DAT":
-                # validate value
-                if not arg.isdigit():
-                    raise ValueError(
-                        f"Expected number 0-999, received {arg} (not a number)",
-                        original_line_number,
-                    )
-                if not 0 <= int(arg) <= 999:
-                    raise ValueError(
-                        f"Expected number 0-999, received {arg} (out of range)",
-                        original_line_number,
-                    )
-
-                lines.append({
-                    "create_label": label,
-                    "operation": words[1],
-                    "value": arg.zfill(3),
-                })
-            else:
-                # line has structure <label being created> <operation> <label being used as opcode>
-                lines.append({
-                    "create_label": label,
-                    "operation": words[1],
-                    "uses_label": arg,
-                })
+def assemble_line(line: dict, created_labels: dict):
+    """Turn one line of intermediate code, which has been given a memory address, into object code
+    and machine code.
 
+    Parameters
+    ----------
+    line : dict
+        The intermediate form of the line, as returned by `parse_line`, with a memory address.
+    created_labels : dict
+        The memory address of every label that has been created.
+
+    Returns
+    -------
+    tuple[str, str]
+        The line of object code, and the contents of the line's memory location.
+    """
+    cleaned_up_line = f"{line['memory_address']} {line['operation']}"
+    line_in_memory = ""
+
+    # add opcode to line_in_memory
+    if line["operation"] == "DAT":
+        val = line["value"] if "value" in line else "000"
+        line_in_memory += val
+        cleaned_up_line += " " + val
+    else:
+        line_in_memory += {
+            "ADD": "1",
+            "SUB": "2",
+            "STA": "3",
+            "LDA": "5",
+            "BRA": "6",
+            "BRZ": "7",
+            "BRP": "8",
+            "INP": "901",
+            "OUT": "902",
+            "HLT": "000",
+        }[line["operation"]]
+
+    if "uses_label" in line:
+        used_label_loc = created_labels[line["uses_label"]]
+        cleaned_up_line += f" {used_label_loc}"
+        # add operand (label address) to line_in_memory
+        line_in_memory += used_label_loc
+
+    return cleaned_up_line, line_in_memory
+
+# todo: could this function benefit from more decomposition?
+def compile_assembly(user_written_code: str, analyse: bool = False):
+    """Compile user-written assembly into object code and machine code (memory/register contents).
+
+    Parameters
+    ----------
+    user_written_code : str
+        The original assembly code as written by user.
+    analyse : bool, optional
+        Whether to also statically analyse the compiled program, as described in
+        program_analysis.py.
+
+    Returns
+    -------
+    dict
+        The result dictionary, containing object and machine code, and the analysis if requested.
+
+    Raises
+    ------
+    ValueError
+        Incorrect assembly code written by user.
+    """
+    lines = []
+    for index, line in enumerate(user_written_code.split("\n")):
+        parsed_line = parse_line(line, index + 1)
+        if parsed_line is not None:
+            lines.append(parsed_line)
 
     # process code from intermediate object to finished form
 
@@ -193,37 +271,12 @@ def compile_assembly(user_written_code: str):
 
     # loop through lines to populate result
     for line in lines:
-        cleaned_up_line = f"{line['memory_address']} {line['operation']}"
-        line_in_memory = ""
-
-        # add opcode to line_in_memory
-        if line["operation"] == "DAT":
-            val = line["value"] if "value" in line else "000"
-            line_in_memory += val
-            cleaned_up_line += " " + val
-        else:
-            line_in_memory += {
-                "ADD": "1",
-                "SUB": "2",
-                "STA": "3",
-                "LDA": "5",
-                "BRA": "6",
-                "BRZ": "7",
-                "BRP": "8",
-                "INP": "901",
-                "OUT": "902",
-                "HLT": "000",
-            }[line["operation"]]
-
-        if "uses_label" in line:
-            used_label_loc = created_labels[line["uses_label"]]
-            cleaned_up_line += f" {used_label_loc}"
-            # add operand (label address) to line_in_memory
-            line_in_memory += used_label_loc
-
+        cleaned_up_line, line_in_memory = assemble_line(line, created_labels)
         result["object_code"].append(cleaned_up_line)
         result["memory_and_registers"]["memory"][line["memory_address"]] = line_in_memory
 
+    if analyse:
+        result["analysis"] = program_analysis.analyse_program(result)
     return result
 
 def check_assembly(user_written_code: str):
@@ -240,3 +293,124 @@ def check_assembly(user_written_code: str):
     except ValueError:
         return False
     return True
+
+def get_line_numbers(user_written_code: str):
+    """Find the line number in user-written assembly code of each line of object code, which is
+    also the line that was compiled into each memory address.
+
+    Parameters
+    ----------
+    user_written_code : str
+        The original assembly code as written by user, which must be valid.
+
+    Returns
+    -------
+    list[int]
+        The line number (counting from 1) of every non-empty line, in order.
+    """
+    return [
+        index + 1 for index, line in enumerate(user_written_code.split("\n"))
+        if parse_line(line, index + 1) is not None
+    ]
+
+def normalise_code(user_written_code: str):
+    """Remove everything from user-written assembly code that does not affect how it compiles
+    (comments, case and extra whitespace), while keeping every line so that line numbers in error
+    messages stay the same.
+
+    Parameters
+    ----------
+    user_written_code : str
+        The original assembly code as written by user.
+
+    Returns
+    -------
+    str
+        The normalised code, which compiles to the same result as the original.
+    """
+    return "\n".join(
+        " ".join(line.split("//")[0].upper().split()) for line in user_written_code.split("\n")
+    )
+
+def copy_result(result: dict):
+    """Copy a compile result deeply enough that running a `Computer` on it does not modify the
+    original."""
+    return {
+        "object_code": list(result["object_code"]),
+        "memory_and_registers": {
+            "memory": dict(result["memory_and_registers"]["memory"]),
+            "registers": dict(result["memory_and_registers"]["registers"]),
+        },
+    }
+
+class CompileCache:
+    """A bounded, least recently used cache of compile results, keyed by a hash of the normalised
+    code. Code that fails to compile is cached too, and raises the same `ValueError` (with the same
+    line number) every time it is compiled."""
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # {<hash of normalised code>: (<result or None>, <ValueError args or None>)}
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        """Remove every entry from the cache and reset the hit and miss counters."""
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, user_written_code: str, analyse: bool = False):
+        """Compile user-written assembly, reusing the result from the cache if the same code (after
+        normalisation) has been compiled recently.
+
+        Parameters
+        ----------
+        user_written_code : str
+            The original assembly code as written by user.
+        analyse : bool, optional
+            Whether to also statically analyse the compiled program.
+
+        Returns
+        -------
+        dict
+            A copy of the result dictionary, containing object and machine code.
+
+        Raises
+        ------
+        ValueError
+            Incorrect assembly code written by user.
+        """
+        normalised_code = normalise_code(user_written_code)
+        key = hashlib.sha256(normalised_code.encode("utf-8")).hexdigest()
+
+        if key in self.__entries:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            result, error_args = self.__entries[key]
+        else:
+            self.misses += 1
+            try:
+                result, error_args = compile_assembly(normalised_code), None
+            except ValueError as error:
+                result, error_args = None, error.args
+            self.__entries[key] = (result, error_args)
+            if len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+        if error_args is not None:
+            raise ValueError(*error_args)
+        result = copy_result(result)
+        if analyse:
+            result["analysis"] = program_analysis.analyse_program(result)
+        return result
+
+compile_cache = CompileCache()
+
+def compile_assembly_cached(user_written_code: str, analyse: bool = False):
+    """Compile user-written assembly using the shared `compile_cache`. Behaves the same as
+    `compile_assembly`."""
+    return compile_cache.compile(user_written_code, analyse)
@@ -1,13 +1,158 @@
 """This file is responsible for the fetch-decode-execute cycle. The Computer class represents the
 entire LMC in a specific state, and has step and run methods which are triggered by the user.
 Classes:
-    Computer"""
+    State
+    Computer
+Functions:
+    validate_input(input_value: int | str) -> str
+    copy_state(memory_and_registers: dict) -> dict
+    get_state_delta(before: dict, after: dict) -> dict"""
+
+import time
+import binary_trace
+import block_engine
+import fast_engine
+import profiler
+import state_history
+from fast_engine import ADDRESS_STRINGS, DIGIT_STRINGS, VALUE_STRINGS
+
+# the levels of detail that `Computer.run` can return, from least to most
+GRANULARITIES = ("final", "outputs", "delta", "trace")
+# the registers in the order `State.get_registers` returns them, with the string form of each
+# value they can hold
+REGISTER_CODES = ("PC", "ACC", "IR", "MAR", "MDR", "CARRY")
+REGISTER_STRINGS = (
+    ADDRESS_STRINGS, VALUE_STRINGS, DIGIT_STRINGS, ADDRESS_STRINGS, VALUE_STRINGS, DIGIT_STRINGS,
+)
+
+def validate_input(input_value):
+    """Check that an input value for an INP instruction is a number 0-999, and return it in the
+    string form that `Computer.finish_after_input` takes.
+
+    Raises
+    ------
+    ValueError
+        The input is not a number 0-999.
+    """
+    if isinstance(input_value, int) and not isinstance(input_value, bool):
+        input_value = str(input_value)
+    if not (isinstance(input_value, str) and input_value.isdigit() and len(input_value) <= 3):
+        raise ValueError(f"Expected input 0-999, received {input_value!r}")
+    return input_value
+
+def copy_state(memory_and_registers):
+    """Copy the state of the LMC, so that it can be compared with the state after running."""
+    return {
+        "memory": dict(memory_and_registers["memory"]),
+        "registers": dict(memory_and_registers["registers"]),
+    }
+
+def get_state_delta(before, after):
+    """Describes the registers and memory locations that differ between two states of the LMC.
+
+    Parameters
+    ----------
+    before : dict
+        The earlier state of the LMC.
+    after : dict
+        The later state of the LMC.
+
+    Returns
+    -------
+    dict
+        The registers and memory locations that changed, mapped to their new values.
+    """
+    return {
+        part: {
+            key: value for key, value in after[part].items() if before[part].get(key) != value
+        }
+        for part in ("registers", "memory")
+    }
+
+class State:
+    """A `State` holds the memory and registers of the LMC as integers, which is what `Computer`
+    works on during each FDE cycle. It is only converted to and from the dictionary of strings
+    used by the API when a state is received or sent back. Memory should be changed with `write`,
+    so that the string form of memory kept by `to_dict` stays up to date."""
+    __slots__ = ("memory", "pc", "acc", "ir", "mar", "mdr", "carry", "memory_strings")
+
+    def __init__(self, memory, pc=0, acc=0, ir=0, mar=0, mdr=0, carry=0):
+        # the 100 memory locations, as an array of integers
+        self.memory = memory
+        self.pc = pc
+        self.acc = acc
+        self.ir = ir
+        self.mar = mar
+        self.mdr = mdr
+        self.carry = carry
+        # the memory as a dictionary of strings, made the first time it is needed
+        self.memory_strings = None
+
+    @classmethod
+    def from_dict(cls, memory_and_registers):
+        """Make a `State` from the dictionary of strings used by the API."""
+        memory, registers = fast_engine.decode_state(memory_and_registers)
+        state = cls(
+            memory, registers["PC"], registers["ACC"], registers["IR"], registers["MAR"],
+            registers["MDR"], registers["CARRY"],
+        )
+        # the strings are already known, so they do not need to be formatted again
+        state.memory_strings = dict(memory_and_registers["memory"])
+        return state
+
+    def write(self, address: int, value: int):
+        """Change the value in one memory location."""
+        self.memory[address] = value
+        if self.memory_strings is not None:
+            # make a new dictionary, so that states returned by `to_dict` before are not changed
+            self.memory_strings = {
+                **self.memory_strings, ADDRESS_STRINGS[address]: VALUE_STRINGS[value],
+            }
+
+    def to_dict(self):
+        """Convert the state into the dictionary of strings used by the API. The memory dictionary
+        is shared between the results of calls made before memory is next written to, so it
+        should not be changed."""
+        if self.memory_strings is None:
+            self.memory_strings = dict(
+                zip(ADDRESS_STRINGS, map(VALUE_STRINGS.__getitem__, self.memory))
+            )
+        return {
+            "memory": self.memory_strings,
+            "registers": {
+                "PC": ADDRESS_STRINGS[self.pc],
+                "ACC": VALUE_STRINGS[self.acc],
+                "IR": DIGIT_STRINGS[self.ir],
+                "MAR": ADDRESS_STRINGS[self.mar],
+                "MDR": VALUE_STRINGS[self.mdr],
+                "CARRY": DIGIT_STRINGS[self.carry],
+            },
+        }
+
+    def get_registers(self):
+        """Get the value of each register, in the order of `REGISTER_CODES`."""
+        return self.pc, self.acc, self.ir, self.mar, self.mdr, self.carry
 
 class Computer:
     """A `Computer` object is instantiated with memory and register contents every time the client
-    asks to step or run."""
-    def __init__(self, memory_and_registers):
-        self.memory_and_registers = memory_and_registers
+    asks to step or run. The state is kept as a `State` while running, and `memory_and_registers`
+    gives it in the format used by the API. If `keep_history` is True, the state before every cycle
+    is recorded in `self.history`, so that the computer can go back to it with `seek`."""
+    def __init__(self, memory_and_registers, keep_history=False):
+        self.state = State.from_dict(memory_and_registers)
+        self.stop_reason = None
+        self.inputs_used = 0
+        # the index of the watchpoint that stopped the last run, if one did
+        self.watchpoint = None
+        # the line of user-written code each memory address was compiled from, if known
+        self.line_numbers = None
+        self.history = state_history.StateHistory(self.state) if keep_history else None
+
+    @property
+    def memory_and_registers(self):
+        """The current state of the LMC as a dictionary of strings, from `State.to_dict`. Changing
+        the registers does not change the computer, and the memory should not be changed."""
+        return self.state.to_dict()
 
     def __fetch(self):
         """Runs the fetch stage of the FDE cycle on the Computer object.
@@ -17,57 +162,28 @@ class Computer:
         list[Transfer] # todo
             A list of transfer dictionaries.
         """
-        transfers = []
+        state = self.state
+        pc = state.pc
 
         # copy value from program counter to MAR
-        pc_value = self.memory_and_registers["registers"]["PC"]
-        self.memory_and_registers["registers"]["MAR"] = pc_value
-        transfers.append({
-            "start_reg": "PC",
-            "end_reg": "MAR",
-            "value": pc_value,
-        })
-
+        state.mar = pc
         # copy assembly instruction from memory (at address in MAR) to MDR
-        mar_value = self.memory_and_registers["registers"]["MAR"]
-        assembly_instruction = self.memory_and_registers["memory"][mar_value]
-        self.memory_and_registers["registers"]["MDR"] = assembly_instruction
-        transfers.append({
-            "start_mem": mar_value,
-            "end_reg": "MDR",
-            "value": assembly_instruction,
-        })
-
+        mdr = state.mdr = state.memory[pc]
         # increment program counter by 1
-        pc_value = self.memory_and_registers["registers"]["PC"]
-        if pc_value == "99":
+        if pc == 99:
             raise OverflowError("Can't increment PC to a value above 99.")
-        self.memory_and_registers["registers"]["PC"] = str(int(pc_value) + 1).zfill(2)
-        transfers.append({
-            "start_reg": "PC",
-            "end_reg": "PC",
-            "value": self.memory_and_registers["registers"]["PC"],
-        })
-
+        state.pc = pc + 1
         # copy assembly instruction from MDR to IR and MAR
-        mdr_value = self.memory_and_registers["registers"]["MDR"]
-        # copy opcode from MDR to IR
-        opcode = mdr_value[0]
-        self.memory_and_registers["registers"]["IR"] = opcode
-        transfers.append({
-            "start_reg": "MDR",
-            "end_reg": "IR",
-            "value": opcode,
-        })
-        # copy operand from MDR to MAR
-        operand = mdr_value[1:]
-        self.memory_and_registers["registers"]["MAR"] = operand
-        transfers.append({
-            "start_reg": "MDR",
-            "end_reg": "MAR",
-            "value": operand,
-        })
-        return transfers
+        # copy opcode from MDR to IR, and operand from MDR to MAR
+        state.ir, state.mar = divmod(mdr, 100)
+
+        return [
+            {"start_reg": "PC", "end_reg": "MAR", "value": ADDRESS_STRINGS[pc]},
+            {"start_mem": ADDRESS_STRINGS[pc], "end_reg": "MDR", "value": VALUE_STRINGS[mdr]},
+            {"start_reg": "PC", "end_reg": "PC", "value": ADDRESS_STRINGS[state.pc]},
+            {"start_reg": "MDR", "end_reg": "IR", "value": DIGIT_STRINGS[state.ir]},
+            {"start_reg": "MDR", "end_reg": "MAR", "value": ADDRESS_STRINGS[state.mar]},
+        ]
 
     def __decode(self):
         """Runs the decode stage of the FDE cycle on the Computer object.
@@ -77,20 +193,17 @@ class Computer:
         list[Transfer] # todo: define Transfer
             A list of transfer dictionaries.
         """
+        state = self.state
         transfers = []
 
-        opcode = self.memory_and_registers["registers"]["IR"]
-        operand = self.memory_and_registers["registers"]["MAR"]
-
-        if opcode in ("1", "2", "5"):
+        if state.ir in (1, 2, 5):
             # direct addressing
             # fetch required data (from memory location stored in MAR, i.e. the operand)
-            argument = self.memory_and_registers["memory"][operand]
-            self.memory_and_registers["registers"]["MDR"] = argument
+            state.mdr = state.memory[state.mar]
             transfers.append({
-                "start_mem": operand,
+                "start_mem": ADDRESS_STRINGS[state.mar],
                 "end_reg": "MDR",
-                "value": argument,
+                "value": VALUE_STRINGS[state.mdr],
             })
         return transfers
 
@@ -109,130 +222,115 @@ class Computer:
         ValueError
             _description_
         """
+        state = self.state
         reached_hlt = False
         reached_inp = False
         output = ""
         transfers = []
 
-        opcode = self.memory_and_registers["registers"]["IR"]
-        operand = self.memory_and_registers["registers"]["MAR"]
-        if opcode in ("9", "0"):
+        opcode = state.ir
+        operand = state.mar
+        if opcode in (9, 0):
             # INP, OUT, or HLT. operand should not be treated as memory address.
-            if opcode == "0" and operand == "00":
+            if opcode == 0 and operand == 0:
                 reached_hlt = True
-            elif opcode == "9" and operand == "01":
+            elif opcode == 9 and operand == 1:
                 reached_inp = True
-            elif opcode == "9" and operand == "02":
+            elif opcode == 9 and operand == 2:
                 # OUT
-                output = self.memory_and_registers["registers"]["ACC"]
+                output = VALUE_STRINGS[state.acc]
             else:
                 raise ValueError("Invalid instruction beginning in 0 or 9")
-        elif opcode in ("1", "2", "5"):
+        elif opcode in (1, 2, 5):
             # we are using the value in the MDR to modify the value in the ACC
 
-            argument = self.memory_and_registers["registers"]["MDR"]
+            argument = state.mdr
             # todo: does this need a better name? it is the contents of the memory location referred
             # to by the operand, and will be the argument passed to the instruction
 
             # execute instruction
             match opcode:
-                case "1":
+                case 1:
                     # add
                     # add from MDR to ACC
-                    arithmetic_result = int(
-                        self.memory_and_registers["registers"]["ACC"]
-                    ) + int(argument)
-                    self.memory_and_registers["registers"]["ACC"] = str(
-                        arithmetic_result % 1000
-                    ).zfill(3)
+                    arithmetic_result = state.acc + argument
+                    state.acc = arithmetic_result % 1000
                     transfers.append({
-                        "start_mem": operand,
+                        "start_mem": ADDRESS_STRINGS[operand],
                         "end_reg": "ACC",
-                        "value": self.memory_and_registers["registers"]["ACC"],
+                        "value": VALUE_STRINGS[state.acc],
                     })
-                    if int(arithmetic_result) > 999:
-                        self.memory_and_registers["registers"]["CARRY"] = "1"
-                    else:
-                        self.memory_and_registers["registers"]["CARRY"] = "0"
+                    state.carry = 1 if arithmetic_result > 999 else 0
                     transfers.append({
                         "start_reg": "ACC",
                         "end_reg": "CARRY",
-                        "value": self.memory_and_registers["registers"]["CARRY"],
+                        "value": DIGIT_STRINGS[state.carry],
                     })
-                case "2":
+                case 2:
                     # sub
                     # subtract MDR value from ACC
-                    arithmetic_result = int(
-                        self.memory_and_registers["registers"]["ACC"]
-                    ) - int(argument)
-                    self.memory_and_registers["registers"]["ACC"] = str(
-                        arithmetic_result % 1000
-                    ).zfill(3)
+                    arithmetic_result = state.acc - argument
+                    state.acc = arithmetic_result % 1000
                     transfers.append({
-                        "start_mem": operand,
+                        "start_mem": ADDRESS_STRINGS[operand],
                         "end_reg": "ACC",
-                        "value": self.memory_and_registers["registers"]["ACC"],
+                        "value": VALUE_STRINGS[state.acc],
                     })
-                    if int(arithmetic_result) < 0:
-                        self.memory_and_registers["registers"]["CARRY"] = "1"
-                    else:
-                        self.memory_and_registers["registers"]["CARRY"] = "0"
+                    state.carry = 1 if arithmetic_result < 0 else 0
                     transfers.append({
                         "start_reg": "ACC",
                         "end_reg": "CARRY",
-                        "value": self.memory_and_registers["registers"]["CARRY"],
+                        "value": DIGIT_STRINGS[state.carry],
                     })
-                case "5":
+                case 5:
                     # lda
                     # set ACC value to value stored in MDR
-                    self.memory_and_registers["registers"]["ACC"] = argument
+                    state.acc = argument
                     transfers.append({
                         "start_reg": "MDR",
                         "end_reg": "ACC",
-                        "value": argument,
+                        "value": VALUE_STRINGS[argument],
                     })
 
         else:
             match opcode:
-                case "3":
+                case 3:
                     # sta
                     # copy from ACC to memory location stored in MAR
-                    acc_value = self.memory_and_registers["registers"]["ACC"]
-                    self.memory_and_registers["memory"][operand] = acc_value
+                    state.write(operand, state.acc)
                     transfers.append({
                         "start_reg": "ACC",
-                        "end_mem": operand,
-                        "value": acc_value,
+                        "end_mem": ADDRESS_STRINGS[operand],
+                        "value": VALUE_STRINGS[state.acc],
                     })
-                case "6":
+                case 6:
                     # bra
                     # set PC to operand
-                    self.memory_and_registers["registers"]["PC"] = operand
+                    state.pc = operand
                     transfers.append({
                         # todo: transfer coming from actual operand
                         "end_reg": "PC",
-                        "value": self.memory_and_registers["registers"]["PC"],
+                        "value": ADDRESS_STRINGS[state.pc],
                     })
-                case "7":
+                case 7:
                     # brz
                     # set PC to operand if ACC is 0
-                    if self.memory_and_registers["registers"]["ACC"] == "000":
-                        # set IR to operand
-                        self.memory_and_registers["registers"]["PC"] = operand
+                    if state.acc == 0:
+                        state.pc = operand
                         transfers.append({
                             # todo: transfer coming from actual operand
                             "end_reg": "PC",
-                            "value": self.memory_and_registers["registers"]["PC"],
+                            "value": ADDRESS_STRINGS[state.pc],
                         })
-                case "8":
+                case 8:
                     # brp
                     # set PC to operand if CARRY is 1
-                    if self.memory_and_registers["registers"]["CARRY"] == "1":
-                        self.memory_and_registers["registers"]["PC"] = operand
+                    if state.carry == 1:
+                        state.pc = operand
                         transfers.append({
                             # todo: transfer coming from actual operand
                             "end_reg": "PC",
-                            "value": self.memory_and_registers["registers"]["PC"],
+                            "value": ADDRESS_STRINGS[state.pc],
                         })
 
         return reached_hlt, reached_inp, output, transfers
@@ -243,30 +341,45 @@ class Computer:
         Returns:
             dict: A dictionary containing a list of transfers and the new state of the LMC
         """
-        return_obj = {
-            "memory_and_registers": None,
-            "transfers": None,
-            "reached_HLT": False,
-            "reached_INP": False,
-            "output": "",
-        }
+        result = self.__step()
+        result["memory_and_registers"] = self.state.to_dict()
+        return result
+
+    def __step(self):
+        """Runs one FDE cycle like `step`, without converting the state of the LMC for the API."""
+        if self.history is not None:
+            self.history.record(self.state)
 
         # fetch
-        return_obj["transfers"] = self.__fetch()
+        transfers = self.__fetch()
 
         # decode
-        return_obj["transfers"].extend(self.__decode())
+        transfers += self.__decode()
 
         # execute
-        (   return_obj["reached_HLT"],
-            return_obj["reached_INP"],
-            return_obj["output"],
-            new_transfers
-        ) = self.__execute()
-        return_obj["transfers"].extend(new_transfers)
+        reached_hlt, reached_inp, output, new_transfers = self.__execute()
+        transfers += new_transfers
+
+        return {
+            "transfers": transfers,
+            "reached_HLT": reached_hlt,
+            "reached_INP": reached_inp,
+            "output": output,
+        }
 
-        return_obj["memory_and_registers"] = self.memory_and_registers
-        return return_obj
+    def step_delta(self):
+        """Runs one FDE cycle like `step`, but returns only the registers and memory locations that
+        changed instead of the whole state of the LMC.
+
+        Returns
+        -------
+        dict
+            The result of `step`, with "delta" in place of "memory_and_registers".
+        """
+        registers_before = self.state.get_registers()
+        result = self.__step()
+        result["delta"] = self.__get_delta(registers_before, result)
+        return result
 
     def finish_after_input(self, input_value: str):
         """Finishes one FDE cycle after an input value has been retrieved from the user.
@@ -283,30 +396,316 @@ class Computer:
         """
         # todo: should input value be validated here? maybe think about this once more structure
         # put input value into accumulator
-        self.memory_and_registers["registers"]["ACC"] = input_value.zfill(3)
+        self.state.acc = int(input_value)
         transfer = {
             # todo: start location: from input?
             "end_reg": "ACC",
-            "value": input_value,
+            "value": VALUE_STRINGS[self.state.acc],
         }
         return transfer
 
-    def run(self):
-        """Keeps running FDE cycles until a HLT or INP instruction is reached
+    def run(self, max_cycles=None, time_limit=None, detect_loops=False, granularity="trace",
+            inputs=(), profile=None, breakpoints=None, trace=None):
+        """Keeps running FDE cycles until a HLT or INP instruction is reached, or until one of the
+        optional limits, breakpoints or watchpoints stops execution early. The reason execution
+        stopped is stored in `self.stop_reason` as one of "HLT", "INP", "cycle_limit",
+        "time_limit", "loop_detected", "breakpoint" or "watchpoint", and the index of the
+        watchpoint that stopped it (if any) in `self.watchpoint`.
+        If inputs are given, INP instructions take their values from them in order, and execution
+        only stops at an INP once they have all been used. The number used is stored in
+        `self.inputs_used`.
 
-        Returns:
-            _type_: _description_
+        Parameters
+        ----------
+        max_cycles : int, optional
+            The maximum number of FDE cycles to run.
+        time_limit : float, optional
+            The maximum number of seconds to spend running.
+        detect_loops : bool, optional
+            Whether to stop when the PC, ACC and CARRY repeat without memory being written to in
+            between, which means the program is stuck in an infinite loop.
+        granularity : str, optional
+            How much detail to return, one of `GRANULARITIES`:
+            "final" returns only the final state, "outputs" also returns the values output,
+            "delta" also returns the registers and memory locations changed by each cycle, and
+            "trace" returns the full result of every step call.
+        inputs : Iterable[int | str], optional
+            The values to give to INP instructions, each a number 0-999.
+        profile : profiler.Profile, optional
+            Counters to add every cycle of the run to. Only available for the "final" and
+            "outputs" granularities, without breakpoints.
+        breakpoints : breakpoints.Breakpoints, optional
+            Breakpoints and watchpoints to stop at.
+        trace : binary_trace.TraceWriter, optional
+            A binary trace file to write every cycle of the run to. Only available for the "final"
+            and "outputs" granularities, without breakpoints or profiling.
+
+        Returns
+        -------
+        list[dict] | dict
+            For "trace", the result of every FDE cycle (step call) that was run. Otherwise, a
+            summary of the run, with "watchpoint" if a watchpoint stopped it.
+
+        Raises
+        ------
+        ValueError
+            Unknown granularity, invalid input, or an invalid instruction was executed.
         """
-        reached_hlt = False
-        reached_inp = False
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity \"{granularity}\"")
+
+        if trace is not None:
+            if granularity not in ("final", "outputs") or breakpoints is not None \
+                    or profile is not None:
+                raise ValueError(
+                    "Traces can only be written for final and outputs granularities, without "
+                    "breakpoints or profiling"
+                )
+            result = self.__run_engine(
+                binary_trace.run_traced, trace, max_cycles, time_limit, detect_loops, inputs,
+            )
+            if granularity == "final":
+                del result["outputs"]
+            return result
+
+        if profile is not None:
+            if granularity not in ("final", "outputs") or breakpoints is not None:
+                raise ValueError(
+                    "Profiling is only available for final and outputs granularities, without "
+                    "breakpoints"
+                )
+            result = self.__run_engine(
+                profiler.run_profiled, profile, max_cycles, time_limit, detect_loops, inputs,
+            )
+            if granularity == "final":
+                del result["outputs"]
+            return result
+
+        if granularity in ("final", "outputs") and self.history is None:
+            if breakpoints is None:
+                # nothing is needed from each cycle, so the block engine can be used
+                result = self.run_blocks(max_cycles, time_limit, detect_loops, inputs)
+            else:
+                # blocks can't stop part of the way through, so use the integer engine
+                result = self.run_fast(max_cycles, time_limit, detect_loops, inputs, breakpoints)
+            if granularity == "final":
+                del result["outputs"]
+            return result
+
+        # the final and outputs granularities only get here while keeping the history, which needs
+        # every cycle to be run one at a time
+        cycles = 0
+        outputs = []
+        deltas = []
 
         # store list of results from every FDE cycle (step call) we do, and return all
         all_results = []
 
-        while not any((reached_hlt, reached_inp)):
-            result = self.step()
-            reached_hlt = result["reached_HLT"]
-            reached_inp = result["reached_INP"]
-            all_results.append(result)
+        registers_before = self.state.get_registers()
+        for result in self.iter_run(
+            max_cycles, time_limit, detect_loops, inputs, include_state=granularity == "trace",
+            breakpoints=breakpoints,
+        ):
+            cycles += 1
+            if granularity == "trace":
+                all_results.append(result)
+                continue
+            if granularity == "delta":
+                deltas.append(self.__get_delta(registers_before, result))
+                registers_before = self.state.get_registers()
+            if result["output"]:
+                outputs.append(result["output"])
+
+        if granularity == "trace":
+            return all_results
+        summary = {
+            "memory_and_registers": self.memory_and_registers,
+            "reached_HLT": self.stop_reason == "HLT",
+            "reached_INP": self.stop_reason == "INP",
+            "outputs": outputs,
+            "cycles": cycles,
+            "inputs_used": self.inputs_used,
+            "stop_reason": self.stop_reason,
+        }
+        if granularity == "delta":
+            summary["deltas"] = deltas
+        elif granularity == "final":
+            del summary["outputs"]
+        if self.watchpoint is not None:
+            summary["watchpoint"] = self.watchpoint
+        return summary
+
+    def iter_run(self, max_cycles=None, time_limit=None, detect_loops=False, inputs=(),
+                 include_state=True, breakpoints=None):
+        """Generator version of `run`, which yields the result of each FDE cycle as soon as it has
+        been run instead of collecting them into a list. `self.stop_reason` is set once the
+        generator is exhausted. The parameters are the same as for `run`, and if `include_state`
+        is False, results do not have "memory_and_registers".
+
+        Yields
+        ------
+        dict
+            The result of each FDE cycle (step call). When an INP instruction takes a value from
+            the inputs, its result has reached_INP set to False, the value in "input", and the
+            transfer of the value into the ACC added to its transfers.
+        """
+        self.stop_reason = None
+        self.inputs_used = 0
+        self.watchpoint = None
+        inputs = iter(inputs)
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        # states seen since memory was last written to
+        seen_states = set()
+        cycles = 0
+
+        while self.stop_reason is None:
+            if max_cycles is not None and cycles >= max_cycles:
+                self.stop_reason = "cycle_limit"
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = "time_limit"
+                break
+            if breakpoints is not None and cycles and breakpoints.addresses[self.state.pc]:
+                self.stop_reason = "breakpoint"
+                break
+
+            memory_before = None
+            if detect_loops:
+                # remember the contents of the memory location that an STA is about to overwrite
+                memory = self.state.memory
+                opcode, operand = divmod(memory[self.state.pc], 100)
+                if opcode == 3:
+                    memory_before = (operand, memory[operand])
+
+            result = self.step() if include_state else self.__step()
+            cycles += 1
+
+            if result["reached_INP"]:
+                input_value = next(inputs, None)
+                if input_value is not None:
+                    # use the next input instead of stopping
+                    input_value = validate_input(input_value)
+                    result["transfers"].append(self.finish_after_input(input_value))
+                    result["reached_INP"] = False
+                    result["input"] = input_value
+                    self.inputs_used += 1
+                    # the program can act differently after an input, so states seen so far do
+                    # not show a loop
+                    seen_states.clear()
+
+            if result["reached_HLT"]:
+                self.stop_reason = "HLT"
+            elif result["reached_INP"]:
+                self.stop_reason = "INP"
+            else:
+                if breakpoints is not None:
+                    self.watchpoint = breakpoints.get_watchpoint(
+                        self.state.ir, self.state.mar, self.state.acc, self.state.carry,
+                    )
+                if self.watchpoint is not None:
+                    self.stop_reason = "watchpoint"
+                elif detect_loops:
+                    if (memory_before is not None
+                            and self.state.memory[memory_before[0]] != memory_before[1]):
+                        seen_states.clear()
+                    state = (self.state.pc, self.state.acc, self.state.carry)
+                    if state in seen_states:
+                        self.stop_reason = "loop_detected"
+                    seen_states.add(state)
+
+            yield result
+
+    def __get_delta(self, registers_before, step_result):
+        """Describes only what changed during one FDE cycle.
 
-        return all_results
+        Parameters
+        ----------
+        registers_before : tuple[int]
+            The registers from before the cycle was run, from `State.get_registers`.
+        step_result : dict
+            The value returned by `step` for the cycle.
+
+        Returns
+        -------
+        dict
+            The registers and memory locations that changed, mapped to their new values, and the
+            value output during the cycle if there was one.
+        """
+        delta = {
+            "registers": {
+                code: strings[value] for code, strings, value, value_before in zip(
+                    REGISTER_CODES, REGISTER_STRINGS, self.state.get_registers(), registers_before,
+                ) if value != value_before
+            },
+            "memory": {
+                transfer["end_mem"]: transfer["value"]
+                for transfer in step_result["transfers"] if "end_mem" in transfer
+            },
+        }
+        if step_result["output"]:
+            delta["output"] = step_result["output"]
+        return delta
+
+    def run_fast(self, max_cycles=None, time_limit=None, detect_loops=False, inputs=(),
+                 breakpoints=None):
+        """Keeps running FDE cycles until a HLT or INP instruction is reached, using the integer
+        engine in fast_engine.py. No transfers are recorded, but the final state is the same as
+        the one `run` would reach. The optional limits, inputs and breakpoints behave the same as
+        in `run`.
+
+        Returns
+        -------
+        dict
+            The final state of the LMC, whether HLT or INP was reached, the values output, the
+            number of cycles run, the number of inputs used and the reason execution stopped.
+        """
+        return self.__run_engine(
+            fast_engine.run_fast, max_cycles, time_limit, detect_loops, inputs,
+            breakpoints=breakpoints,
+        )
+
+    def run_blocks(self, max_cycles=None, time_limit=None, detect_loops=False, inputs=()):
+        """Keeps running FDE cycles until a HLT or INP instruction is reached, using the basic
+        block engine in block_engine.py. This is the same as `run_fast`, except that the time limit
+        and loops are only checked between blocks, so execution can stop a few cycles later."""
+        return self.__run_engine(
+            block_engine.run_blocks, max_cycles, time_limit, detect_loops, inputs,
+        )
+
+    def __run_engine(self, engine, *args, **kwargs):
+        """Run with one of the engines that work on integers, and store its final state. The last
+        positional argument is the list of inputs, which is validated and converted to integers
+        first."""
+        *args, inputs = args
+        result = engine(
+            self.memory_and_registers, *args,
+            [int(validate_input(input_value)) for input_value in inputs], **kwargs,
+        )
+        self.state = State.from_dict(result["memory_and_registers"])
+        self.stop_reason = result["stop_reason"]
+        self.inputs_used = result["inputs_used"]
+        self.watchpoint = result.get("watchpoint")
+        if self.history is not None:
+            # the engines do not record each cycle
+            self.history.clear(self.state, result["cycles"])
+        return result
+
+    def seek(self, cycle: int):
+        """Go back to the state after an earlier cycle, using the history. Cycles after it are
+        forgotten, so running continues from there.
+
+        Parameters
+        ----------
+        cycle : int
+            The number of cycles since the history was started (or `self.history.cycle` minus the
+            number of cycles to step back).
+
+        Raises
+        ------
+        ValueError
+            No history is being kept, or the cycle is not in it.
+        """
+        if self.history is None:
+            raise ValueError("No history is being kept for this computer")
+        self.history.seek(self.state, cycle)
+        self.stop_reason = None
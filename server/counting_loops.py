@@ -0,0 +1,162 @@
+"""This file contains a way of recognising simple counting loops, so that the engines can skip
+straight past most of their iterations instead of running every one. A counting loop is one where
+every iteration loads some memory locations, adds or subtracts memory locations that the loop never
+changes, and stores each result back where it came from, then uses BRZ to leave the loop once the
+last value stored is 000, such as:
+    loop LDA count
+         SUB one
+         STA count
+         BRZ done
+         BRA loop
+Each of those locations changes by the same amount every iteration (mod 1000), so the number of
+iterations until the BRZ is taken can be worked out directly, and the iterations before it can be
+skipped by updating memory arithmetically. The last iteration is always run normally, so the
+engines leave the loop exactly as they would have, and the number of cycles run stays exact.
+Classes:
+    CountingLoop
+Functions:
+    find_counting_loop(instructions: Sequence[tuple[int, int, int, int]]) -> CountingLoop | None"""
+
+import math
+
+class CountingLoop:
+    """A `CountingLoop` holds what one iteration of a counting loop does to memory, starting just
+    after its BRZ. It is only valid while the instructions it was found from are still in memory,
+    which `matches` checks."""
+    def __init__(self, instructions, groups):
+        # memory locations holding the loop's instructions, and the instructions
+        self.cells = tuple(address for address, _, _, _ in instructions)
+        self.values = tuple(value for _, value, _, _ in instructions)
+        # how many cycles one iteration takes
+        self.length = len(instructions)
+        # [(<address loaded and stored>, [(<1 for ADD, -1 for SUB>, <address added/subtracted>)])]
+        # in the order they run. the last one decides whether the loop is left
+        self.groups = groups
+
+    def matches(self, memory):
+        """Whether the loop's instructions are still in memory."""
+        return all(memory[address] == value for address, value in zip(self.cells, self.values))
+
+    def __get_changes(self, memory):
+        """Get how much each group's memory location changes by every iteration, mod 1000."""
+        return [
+            sum(sign * memory[address] for sign, address in operations) % 1000
+            for _, operations in self.groups
+        ]
+
+    def get_iterations_to_skip(self, memory):
+        """Find how many iterations can be skipped, starting just after the BRZ, before the one in
+        which the BRZ is taken.
+
+        Returns
+        -------
+        int | None
+            The number of iterations, or None if the BRZ is never taken, so the loop never ends.
+        """
+        changes = self.__get_changes(memory)
+        if not any(changes):
+            # memory never changes, so the engines need to run the loop to detect that it is stuck
+            return 0
+        change = changes[-1]
+        value = memory[self.groups[-1][0]]
+        if change == 0:
+            return 0 if value == 0 else None
+        # find the smallest number of iterations n > 0 where value + n * change = 0 (mod 1000)
+        divisor = math.gcd(change, 1000)
+        if value % divisor != 0:
+            return None
+        modulus = 1000 // divisor
+        iterations = (-value // divisor * pow(change // divisor, -1, modulus)) % modulus
+        return (iterations or modulus) - 1
+
+    def skip(self, memory, iterations: int):
+        """Change memory to how it would be after running some iterations of the loop, starting
+        just after the BRZ, where the BRZ is not taken in any of them.
+
+        Parameters
+        ----------
+        memory : array | list
+            The 100 memory cells as integers, which are changed in place.
+        iterations : int
+            How many iterations to skip, at least 1.
+
+        Returns
+        -------
+        tuple[int, int]
+            The ACC and CARRY after the last iteration skipped.
+        """
+        changes = self.__get_changes(memory)
+        for (address, _), change in zip(self.groups, changes):
+            memory[address] = (memory[address] + iterations * change) % 1000
+
+        # run the last group of the last iteration again, to find the CARRY it left
+        address, operations = self.groups[-1]
+        acc = (memory[address] - changes[-1]) % 1000
+        for sign, operand in operations[:-1]:
+            acc = (acc + sign * memory[operand]) % 1000
+        sign, operand = operations[-1]
+        acc += sign * memory[operand]
+        carry = 1 if acc > 999 or acc < 0 else 0
+        return acc % 1000, carry
+
+def find_counting_loop(instructions):
+    """Check whether one iteration of a loop is a counting loop.
+
+    Parameters
+    ----------
+    instructions : Sequence[tuple[int, int, int, int]]
+        The address, value, opcode and operand of each instruction run in one iteration of the
+        loop, in order. Apart from BRA instructions, the iteration must end with the BRZ, as the
+        engines skip iterations from the point just after it.
+
+    Returns
+    -------
+    CountingLoop | None
+        The counting loop, or None if the instructions are not one.
+    """
+    # the instructions must run one after another, with the loop continuing past a single BRZ
+    # when it is not taken, and nothing else that can change the flow of the program
+    branches = []
+    for index, (address, _, opcode, operand) in enumerate(instructions):
+        next_address = instructions[(index + 1) % len(instructions)][0]
+        if opcode == 6:
+            if operand != next_address:
+                return None
+        elif address + 1 != next_address or opcode not in (1, 2, 3, 5, 7):
+            return None
+        elif opcode == 7:
+            if operand == next_address:
+                return None
+            branches.append(index)
+    # ignoring the BRAs, the BRZ must be last
+    steps = [(opcode, operand) for _, _, opcode, operand in instructions if opcode != 6]
+    if len(branches) != 1 or steps[-1][0] != 7:
+        return None
+
+    # every group is LDA x, any ADDs and SUBs, then STA x, and the BRZ comes straight after the last
+    groups = []
+    index = 0
+    while index < len(steps) - 1:
+        opcode, address = steps[index]
+        if opcode != 5:
+            return None
+        operations = []
+        index += 1
+        while steps[index][0] in (1, 2):
+            operations.append((1 if steps[index][0] == 1 else -1, steps[index][1]))
+            index += 1
+        if steps[index] != (3, address):
+            return None
+        groups.append((address, operations))
+        index += 1
+    if not groups or not groups[-1][1]:
+        return None
+
+    # the loop must not change its own instructions, any location it adds or subtracts, or any
+    # location twice
+    written = [address for address, _ in groups]
+    read = {operand for _, operations in groups for _, operand in operations}
+    cells = {address for address, _, _, _ in instructions}
+    if len(set(written)) != len(written) or read & set(written) or cells & set(written):
+        return None
+    return CountingLoop(instructions, groups)
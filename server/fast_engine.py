@@ -0,0 +1,413 @@
+"""This file contains a fast alternative to the fetch-decode-execute cycle in computer.py. Instead
+of working on the nested dictionary of strings every cycle, the state of the LMC is decoded once
+into integers, run in a tight loop, and only converted back into the string-keyed state at the end.
+No transfers are recorded, so this is only suitable when the client does not need to animate each
+cycle. Most iterations of counting loops are skipped (see counting_loops.py), while still counting
+their cycles.
+The loop is generated from a template (see `generate_run_loop`), which the profiler and the binary
+trace add their own code to, so that every engine that runs one instruction at a time shares it.
+Functions:
+    parse_value(value: str | int, limit: int, name: str) -> int
+    decode_state(memory_and_registers: dict) -> tuple[array, dict]
+    encode_state(memory: array, registers: dict) -> dict
+    generate_run_loop(hooks: dict[str, str], namespace: dict) -> Callable
+    run_fast(memory_and_registers: dict, max_cycles: int, time_limit: float, detect_loops: bool,
+        inputs: list[int]) -> dict"""
+
+import textwrap
+import time
+from array import array
+from counting_loops import find_counting_loop
+
+# how many cycles to run between each check of the time limit
+TIME_CHECK_INTERVAL = 1024
+# the string form of every memory address, every value a memory location or 3-digit register can
+# hold, and every digit, so that they do not need to be formatted again each time
+ADDRESS_STRINGS = tuple(str(address).zfill(2) for address in range(100))
+VALUE_STRINGS = tuple(str(value).zfill(3) for value in range(1000))
+DIGIT_STRINGS = tuple(str(digit) for digit in range(10))
+# the integer value of each string in VALUE_STRINGS, which is faster to look up than to parse
+VALUE_INTS = {string: value for value, string in enumerate(VALUE_STRINGS)}
+# the largest value each register can hold
+REGISTER_LIMITS = {"PC": 99, "ACC": 999, "IR": 9, "MAR": 99, "MDR": 999, "CARRY": 1}
+
+
+def parse_value(value, limit: int, name: str):
+    """Convert one memory location or register from the state of the LMC into an integer.
+
+    Parameters
+    ----------
+    value : str | int
+        The value, as a string of digits or an integer.
+    limit : int
+        The largest value allowed.
+    name : str
+        What the value is, for the error message.
+
+    Raises
+    ------
+    ValueError
+        The value is not a whole number from 0 to limit.
+    """
+    if isinstance(value, str) and value.isdecimal() and value.isascii():
+        value = int(value)
+    if not (isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= limit):
+        raise ValueError(f"{name} must be a number from 0 to {limit}, received {value!r}")
+    return value
+
+def decode_state(memory_and_registers):
+    """Convert the string-keyed state of the LMC into integers.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        The state of the LMC, in the format used by `Computer`.
+
+    Returns
+    -------
+    tuple[array, dict]
+        The 100 memory cells as an integer array, and a dictionary of integer register values.
+
+    Raises
+    ------
+    ValueError
+        A memory location or register is missing, or holds a value it can't hold.
+    """
+    if not isinstance(memory_and_registers, dict):
+        raise ValueError("The state must be an object with memory and registers")
+    memory_strings = memory_and_registers.get("memory")
+    registers = memory_and_registers.get("registers")
+    if not (isinstance(memory_strings, dict) and isinstance(registers, dict)):
+        raise ValueError("The state must be an object with memory and registers")
+    try:
+        # building a list first is faster than building the array from an iterator
+        memory = array("h", list(map(VALUE_INTS.__getitem__,
+                                     map(memory_strings.__getitem__, ADDRESS_STRINGS))))
+    except (KeyError, TypeError):
+        # a value was not written with 3 digits, or is not valid
+        memory = array("h", (
+            parse_value(memory_strings.get(address), 999, f"Memory location {address}")
+            for address in ADDRESS_STRINGS
+        ))
+    registers = {
+        code: parse_value(registers.get(code), limit, code)
+        for code, limit in REGISTER_LIMITS.items()
+    }
+    return memory, registers
+
+
+def encode_state(memory, registers):
+    """Convert integer memory and registers back into the string-keyed state of the LMC.
+
+    Parameters
+    ----------
+    memory : array
+        The 100 memory cells as integers.
+    registers : dict
+        The integer value of each register.
+
+    Returns
+    -------
+    dict
+        The state of the LMC, in the format used by `Computer`.
+    """
+    return {
+        "memory": dict(zip(ADDRESS_STRINGS, map(VALUE_STRINGS.__getitem__, memory))),
+        "registers": {
+            "PC": ADDRESS_STRINGS[registers["PC"]],
+            "ACC": VALUE_STRINGS[registers["ACC"]],
+            "IR": DIGIT_STRINGS[registers["IR"]],
+            "MAR": ADDRESS_STRINGS[registers["MAR"]],
+            "MDR": VALUE_STRINGS[registers["MDR"]],
+            "CARRY": DIGIT_STRINGS[registers["CARRY"]],
+        },
+    }
+
+
+# the loop shared by the engines that run one instruction at a time (see `generate_run_loop`).
+# each line that is just {<hook>} is replaced by that hook's code, and a line ending in
+# "# if <hook>" is only kept if that hook has code
+RUN_LOOP_TEMPLATE = """
+def run_loop(memory_and_registers, max_cycles, time_limit, detect_loops, inputs, context):
+    memory, registers = decode_state(memory_and_registers)
+    pc = registers["PC"]
+    acc = registers["ACC"]
+    carry = registers["CARRY"]
+    opcode = registers["IR"]
+    operand = registers["MAR"]
+    mdr = registers["MDR"]
+
+    outputs = []
+    cycles = 0
+    inputs_used = 0
+    stop_reason = None
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    # states seen since memory last changed, each packed into one integer
+    seen_states = set() if detect_loops else None
+    {setup}
+
+    try:
+        while True:
+            if cycles == max_cycles:
+                stop_reason = "cycle_limit"
+                break
+            if (deadline is not None and cycles % TIME_CHECK_INTERVAL == 0
+                    and time.monotonic() >= deadline):
+                stop_reason = "time_limit"
+                break
+            {before_cycle}
+
+            # fetch
+            mdr = memory[pc]
+            if pc == 99:
+                raise OverflowError("Can't increment PC to a value above 99.")
+            {fetch}
+            pc += 1
+            opcode, operand = divmod(mdr, 100)
+            cycles += 1
+
+            # decode and execute
+            if opcode == 1:
+                mdr = memory[operand]
+                acc += mdr
+                carry = 1 if acc > 999 else 0
+                acc %= 1000
+                {arithmetic}
+            elif opcode == 2:
+                mdr = memory[operand]
+                acc -= mdr
+                carry = 1 if acc < 0 else 0
+                acc %= 1000
+                {arithmetic}
+            elif opcode == 5:
+                mdr = memory[operand]
+                acc = mdr
+                {load}
+            elif opcode == 3:
+                {store}
+                if memory[operand] != acc:
+                    memory[operand] = acc
+                    if seen_states is not None:
+                        seen_states.clear()
+            elif opcode == 6:
+                {jump}
+                pc = operand
+            elif opcode == 7:
+                if acc == 0:
+                    {branch_taken}
+                    pc = operand
+                else: # if branch_not_taken
+                    {branch_not_taken}
+            elif opcode == 8:
+                if carry == 1:
+                    {branch_taken}
+                    pc = operand
+                else: # if branch_not_taken
+                    {branch_not_taken}
+            elif opcode == 9 and operand == 2:
+                {output}
+                outputs.append(str(acc).zfill(3))
+            elif opcode == 0 and operand == 0:
+                {halt}
+                stop_reason = "HLT"
+                {end_cycle}
+                break
+            elif opcode == 9 and operand == 1:
+                {input}
+                if inputs_used == len(inputs):
+                    stop_reason = "INP"
+                    {end_cycle}
+                    break
+                acc = inputs[inputs_used]
+                inputs_used += 1
+                if seen_states is not None:
+                    seen_states.clear()
+                {input_taken}
+            elif opcode in (0, 9):
+                raise ValueError("Invalid instruction beginning in 0 or 9")
+            {end_cycle}
+
+            if seen_states is not None:
+                state = (pc * 1000 + acc) * 2 + carry
+                if state in seen_states:
+                    stop_reason = "loop_detected"
+                    break
+                seen_states.add(state)
+    finally:
+        {finish}
+
+    registers = {
+        "PC": pc, "ACC": acc, "IR": opcode, "MAR": operand, "MDR": mdr, "CARRY": carry,
+    }
+    result = {
+        "memory_and_registers": encode_state(memory, registers),
+        "reached_HLT": stop_reason == "HLT",
+        "reached_INP": stop_reason == "INP",
+        "outputs": outputs,
+        "cycles": cycles,
+        "inputs_used": inputs_used,
+        "stop_reason": stop_reason,
+    }
+    {result}
+    return result
+"""
+
+def generate_run_loop(hooks: dict, namespace: dict = None):
+    """Generate a loop that runs FDE cycles one instruction at a time, with extra code added at
+    some points of every cycle. The fast engine, the profiler and the binary trace all run the
+    same generated loop, so that every instruction behaves the same in each of them, without the
+    cost of calling a function for each hook every cycle.
+
+    Parameters
+    ----------
+    hooks : dict[str, str]
+        The code to add at each point in `RUN_LOOP_TEMPLATE`, by the name of the point. The code
+        can use the loop's variables (such as memory, pc, opcode, operand, acc and carry, and
+        context, which is the object passed to the loop by the engine), and can stop execution by
+        setting stop_reason and using break in before_cycle and end_cycle. setup runs before the
+        loop, finish after it (even if an error is raised), and result can add to the result.
+    namespace : dict, optional
+        Names used by the hooks' code, other than the loop's variables.
+
+    Returns
+    -------
+    Callable[[dict, int, float, bool, Sequence[int], Any], dict]
+        The loop, which takes the state, max_cycles, time_limit, detect_loops, inputs and context,
+        and returns the same result as `run_fast`.
+    """
+    lines = []
+    for line in RUN_LOOP_TEMPLATE.split("\n"):
+        code, _, condition = line.partition(" # if ")
+        if condition and not hooks.get(condition):
+            continue
+        name = code.strip()
+        if name.startswith("{") and name.endswith("}"):
+            indent = code[:len(code) - len(code.lstrip())]
+            hook_lines = textwrap.dedent(hooks.get(name[1:-1], "")).strip("\n").split("\n")
+            if hook_lines == [""]:
+                # a block with nothing else in it still needs a statement
+                hook_lines = ["pass"] if name == "{finish}" else []
+            lines.extend(indent + hook_line for hook_line in hook_lines)
+        else:
+            lines.append(code)
+
+    namespace = {
+        "time": time, "TIME_CHECK_INTERVAL": TIME_CHECK_INTERVAL,
+        "decode_state": decode_state, "encode_state": encode_state, **(namespace or {}),
+    }
+    exec("\n".join(lines), namespace) # pylint: disable=exec-used
+    return namespace["run_loop"]
+
+fast_loop = generate_run_loop({
+    "setup": """
+        # the tables from the breakpoints, and the watchpoint that was triggered plus one
+        watching = context is not None
+        breakpoint_addresses = watch_memory = None
+        watch_acc = watch_carry = None
+        if watching:
+            breakpoint_addresses = context.addresses
+            watch_acc, watch_carry = context.acc, context.carry
+            watch_memory = context.memory
+        triggered = 0
+        # the counting loop (see counting_loops.py) ending in each BRA that has jumped back, by
+        # the addresses of the loop's first and last instructions, or None if it is not one.
+        # loops are not skipped while watching, as a watchpoint could be triggered in any
+        # iteration
+        counting_loops = None if watching else {}
+    """,
+    "before_cycle": """
+        if watching and breakpoint_addresses[pc] and cycles:
+            stop_reason = "breakpoint"
+            break
+    """,
+    "arithmetic": """
+        if watching:
+            triggered = watch_acc[acc] or watch_carry[carry]
+    """,
+    "load": """
+        if watching:
+            triggered = watch_acc[acc]
+    """,
+    "store": """
+        if watching and watch_memory[operand] is not None:
+            triggered = watch_memory[operand][acc]
+    """,
+    "jump": """
+        if counting_loops is not None and operand < pc:
+            key = operand * 100 + pc
+            loop = counting_loops.get(key, False)
+            if loop is False or (loop is not None and not loop.matches(memory)):
+                loop = find_counting_loop(tuple(
+                    (address, memory[address], *divmod(memory[address], 100))
+                    for address in range(operand, pc)
+                ))
+                counting_loops[key] = loop
+            if loop is not None:
+                iterations = loop.get_iterations_to_skip(memory)
+                if max_cycles is not None:
+                    # leave at least one iteration to run normally before the cycle limit
+                    budget = (max_cycles - cycles) // loop.length - 1
+                    iterations = budget if iterations is None else min(iterations, budget)
+                if iterations is not None and iterations > 0:
+                    acc, carry = loop.skip(memory, iterations)
+                    cycles += iterations * loop.length
+                    if seen_states is not None:
+                        seen_states.clear()
+    """,
+    "input_taken": """
+        if watching:
+            triggered = watch_acc[acc]
+    """,
+    "end_cycle": """
+        if triggered:
+            stop_reason = "watchpoint"
+            break
+    """,
+    "result": """
+        if triggered:
+            result["watchpoint"] = triggered - 1
+    """,
+}, {"find_counting_loop": find_counting_loop})
+
+def run_fast(memory_and_registers, max_cycles=None, time_limit=None, detect_loops=False,
+             inputs=(), breakpoints=None):
+    """Keep running FDE cycles until a HLT or INP instruction is reached, or until one of the
+    optional limits stops execution early, without recording transfers. The final state is
+    identical to the one reached by calling `Computer.step` the same number of times.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        The state of the LMC to start from. This is not modified.
+    max_cycles : int, optional
+        The maximum number of FDE cycles to run.
+    time_limit : float, optional
+        The maximum number of seconds to spend running.
+    detect_loops : bool, optional
+        Whether to stop when the PC, ACC and CARRY repeat without memory changing in between,
+        which means the program is stuck in an infinite loop.
+    inputs : Sequence[int], optional
+        The values 0-999 to give to INP instructions, in order. Execution only stops at an INP
+        instruction once they have all been used.
+    breakpoints : breakpoints.Breakpoints, optional
+        Breakpoints and watchpoints to stop at.
+
+    Returns
+    -------
+    dict
+        The final state of the LMC, whether HLT or INP was reached, the list of values output by
+        OUT instructions, the number of cycles run, the number of inputs used, and the reason
+        execution stopped (one of "HLT", "INP", "cycle_limit", "time_limit", "loop_detected",
+        "breakpoint" or "watchpoint"). If a watchpoint stopped execution, its index is in
+        "watchpoint".
+
+    Raises
+    ------
+    OverflowError
+        The program counter would have been incremented above 99.
+    ValueError
+        An invalid instruction beginning in 0 or 9 was executed.
+    """
+    return fast_loop(
+        memory_and_registers, max_cycles, time_limit, detect_loops, inputs, breakpoints,
+    )
@@ -0,0 +1,220 @@
+"""This file contains an assembler for use while the user is editing their code. It keeps the
+intermediate form of every line between edits, so that only the edited lines are tokenised again,
+and only the memory locations affected by an edit are assembled again. The result is always the
+same as compiling the whole program with `compile_assembly`.
+Classes:
+    IncrementalAssembler"""
+
+import compile_assembly
+
+class IncrementalAssembler:
+    """An `IncrementalAssembler` holds one program being edited, and is updated with the lines that
+    change each time the user edits it."""
+    def __init__(self, user_written_code: str = ""):
+        # one entry for every line of user-written code
+        self.__parsed_lines = [] # intermediate form of the line, or None if empty or invalid
+        self.__line_errors = [] # error message for the line, or None if valid
+        self.__error_count = 0
+
+        # intermediate form of every non-empty valid line, in order. each one is given a memory
+        # address, which is its index in this list
+        self.__program = []
+        self.__object_code = []
+        self.__memory = {str(i).zfill(2): "000" for i in range(100)}
+
+        # {<label name>: {<id of line>: <line>}} for the lines that create and use each label
+        self.__label_definitions = {}
+        self.__label_uses = {}
+        # {<label name>: <memory address>} for every label that has been created
+        self.__label_addresses = {}
+
+        self.replace_lines(0, 0, user_written_code.split("\n"))
+
+    def __len__(self):
+        return len(self.__parsed_lines)
+
+    def __program_position(self, line_index: int):
+        """Find the position in the program of the first instruction at or after a line."""
+        for parsed_line in reversed(self.__parsed_lines[:line_index]):
+            if parsed_line is not None:
+                return int(parsed_line["memory_address"]) + 1
+        return 0
+
+    def __index_line(self, parsed_line: dict, add: bool):
+        """Add a line to, or remove it from, the label definitions and reverse index of uses."""
+        for key, index in (
+            ("create_label", self.__label_definitions),
+            ("uses_label", self.__label_uses),
+        ):
+            if key not in parsed_line:
+                continue
+            lines = index.setdefault(parsed_line[key], {})
+            if add:
+                lines[id(parsed_line)] = parsed_line
+            else:
+                del lines[id(parsed_line)]
+                if not lines:
+                    del index[parsed_line[key]]
+
+    def __assemble(self, parsed_line: dict, changed_memory: dict):
+        """Assemble one line into its object code entry and memory location."""
+        if "uses_label" in parsed_line and parsed_line["uses_label"] not in self.__label_addresses:
+            # label has not been created. the program is invalid until it is
+            return
+        cleaned_up_line, line_in_memory = compile_assembly.assemble_line(
+            parsed_line, self.__label_addresses,
+        )
+        address = parsed_line["memory_address"]
+        self.__object_code[int(address)] = cleaned_up_line
+        if int(address) < 100 and self.__memory[address] != line_in_memory:
+            self.__memory[address] = line_in_memory
+            changed_memory[address] = line_in_memory
+
+    def replace_lines(self, start: int, end: int, new_lines: list):
+        """Replace some lines of the program with new ones, and reassemble only what they affect.
+
+        Parameters
+        ----------
+        start : int
+            The index (from 0) of the first line to replace.
+        end : int
+            The index of the line after the last one to replace. If this is equal to start, the new
+            lines are inserted without replacing anything.
+        new_lines : list[str]
+            The lines of user-written code to put in place of the old ones.
+
+        Returns
+        -------
+        dict
+            Every memory location whose contents changed, mapped to its new contents.
+
+        Raises
+        ------
+        IndexError
+            The range of lines to replace is not in the program.
+        """
+        if not 0 <= start <= end <= len(self.__parsed_lines):
+            raise IndexError("Lines to replace are outside of the program.")
+
+        # tokenise only the new lines
+        new_parsed_lines = []
+        new_line_errors = []
+        for offset, line in enumerate(new_lines):
+            try:
+                new_parsed_lines.append(compile_assembly.parse_line(line, start + offset + 1))
+                new_line_errors.append(None)
+            except ValueError as error:
+                new_parsed_lines.append(None)
+                new_line_errors.append(error.args[0])
+
+        old_instructions = [line for line in self.__parsed_lines[start:end] if line is not None]
+        new_instructions = [line for line in new_parsed_lines if line is not None]
+        position = self.__program_position(start)
+        old_program_length = len(self.__program)
+
+        self.__error_count += sum(error is not None for error in new_line_errors)
+        self.__error_count -= sum(error is not None for error in self.__line_errors[start:end])
+        self.__parsed_lines[start:end] = new_parsed_lines
+        self.__line_errors[start:end] = new_line_errors
+
+        for parsed_line in old_instructions:
+            self.__index_line(parsed_line, add=False)
+        for parsed_line in new_instructions:
+            self.__index_line(parsed_line, add=True)
+        replaced_range = slice(position, position + len(old_instructions))
+        self.__program[replaced_range] = new_instructions
+        self.__object_code[replaced_range] = [""] * len(new_instructions)
+
+        # give memory addresses to the new lines. lines after the edit only move if the number of
+        # instructions changed
+        if len(new_instructions) == len(old_instructions):
+            renumber_end = position + len(new_instructions)
+        else:
+            renumber_end = len(self.__program)
+        to_assemble = {}
+        affected_labels = {
+            line["create_label"] for line in old_instructions if "create_label" in line
+        }
+        for address in range(position, renumber_end):
+            parsed_line = self.__program[address]
+            parsed_line["memory_address"] = str(address).zfill(2)
+            to_assemble[id(parsed_line)] = parsed_line
+            if "create_label" in parsed_line:
+                affected_labels.add(parsed_line["create_label"])
+
+        changed_memory = {}
+        # clear memory locations no longer used if the program got shorter
+        for address in range(len(self.__program), min(old_program_length, 100)):
+            address = str(address).zfill(2)
+            if self.__memory[address] != "000":
+                self.__memory[address] = "000"
+                changed_memory[address] = "000"
+
+        # lines using a label that has moved need reassembling too
+        for label in affected_labels:
+            if label in self.__label_definitions:
+                # if a label is created more than once, the last one is used
+                new_address = max(
+                    (line["memory_address"] for line in self.__label_definitions[label].values()),
+                    key=int,
+                )
+            else:
+                new_address = None
+            if new_address == self.__label_addresses.get(label):
+                continue
+            if new_address is None:
+                del self.__label_addresses[label]
+            else:
+                self.__label_addresses[label] = new_address
+            to_assemble.update(self.__label_uses.get(label, {}))
+
+        for parsed_line in to_assemble.values():
+            self.__assemble(parsed_line, changed_memory)
+        return changed_memory
+
+    def result(self):
+        """Get the compiled program, which is the same as `compile_assembly` would return for the
+        current code.
+
+        Returns
+        -------
+        dict
+            The result dictionary, containing object and machine code.
+
+        Raises
+        ------
+        ValueError
+            Incorrect assembly code written by user.
+        """
+        if self.__error_count:
+            for index, error in enumerate(self.__line_errors):
+                if error is not None:
+                    raise ValueError(error, index + 1)
+
+        if any(label not in self.__label_addresses for label in self.__label_uses):
+            for parsed_line in self.__program:
+                if ("uses_label" in parsed_line
+                        and parsed_line["uses_label"] not in self.__label_addresses):
+                    raise ValueError(
+                        f"Label \"{parsed_line['uses_label']}\" used without being created.\
+ Create labels by putting a label name at start of line.",
+                    )
+
+        if len(self.__program) > 100:
+            raise ValueError("Too many lines to fit in memory.")
+
+        return {
+            "object_code": list(self.__object_code),
+            "memory_and_registers": {
+                "memory": dict(self.__memory),
+                "registers": {
+                    # all registers start at 0
+                    "PC": "00",
+                    "ACC": "000",
+                    "IR": "0",
+                    "MAR": "00",
+                    "MDR": "000",
+                    "CARRY": "0",
+                },
+            },
+        }
@@ -0,0 +1,187 @@
+"""This script measures how quickly the server answers cheap requests (/api/check and
+/api/compile) while other clients keep it busy with heavy runs, to check that heavy programs don't
+hold up everyone else. The server is started on a local port in a background thread, first with no
+heavy runs to get a baseline, and then with several clients sending heavy runs at the same time.
+Runs are done in the request thread, or in worker processes if `--workers` is given (see
+run_executor.py).
+Run `python load_test.py --help` in the `server` directory for the options.
+Functions:
+    percentile(values: list[float], fraction: float) -> float
+    post_json(url: str, body: dict) -> int
+    measure_latencies(url: str, body: dict, duration: float) -> list[float]
+    run_load_test(duration: float, heavy_clients: int, workers: int) -> dict
+    main(argv: list[str]) -> int"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from werkzeug.serving import make_server
+from benchmark import EXAMPLE_ASSEMBLY_PROGRAM
+from compile_assembly import compile_assembly
+import run_executor as run_executor_module
+import server
+
+# counts forever, so every heavy run goes on until it reaches its cycle limit
+HEAVY_PROGRAM = """
+loop LDA count
+ADD one
+STA count
+BRA loop
+count DAT 0
+one DAT 1
+"""
+
+def percentile(values, fraction: float):
+    """Get the value that the given fraction of values are less than or equal to, e.g. 0.99 for
+    the 99th percentile."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def post_json(url: str, body: dict):
+    """Send a POST request with a JSON body, read the whole response, and return its status
+    code."""
+    request = urllib.request.Request(
+        url, json.dumps(body).encode(), {"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+def measure_latencies(url: str, body: dict, duration: float):
+    """Send the same request one after another for a number of seconds.
+
+    Returns
+    -------
+    list[float]
+        The time each request took in seconds.
+    """
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        post_json(url, body)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def run_load_test(duration: float = 5.0, heavy_clients: int = 4, workers: int = 0):
+    """Measure the latency of cheap requests with and without heavy runs happening at once.
+
+    Parameters
+    ----------
+    duration : float, optional
+        How many seconds to measure for, with and without heavy runs.
+    heavy_clients : int, optional
+        How many clients send heavy runs at the same time.
+    workers : int, optional
+        How many worker processes to run programs in, or 0 to run them in the request thread.
+
+    Returns
+    -------
+    dict
+        For each phase ("idle" and "loaded"), the number of cheap requests and their median and
+        99th percentile latencies in seconds for each endpoint, and for the loaded phase, the
+        number of heavy runs finished and refused.
+    """
+    previous_executor = server.run_executor
+    server.run_executor = run_executor_module.RunExecutor(workers) if workers else None
+    # don't print a line for every request
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{http_server.server_port}"
+
+    cheap_requests = {
+        "/api/check": {"uncompiledCode": EXAMPLE_ASSEMBLY_PROGRAM},
+        "/api/compile": {"uncompiledCode": EXAMPLE_ASSEMBLY_PROGRAM},
+    }
+    heavy_body = {
+        **compile_assembly(HEAVY_PROGRAM)["memory_and_registers"],
+        "max_cycles": server.MAX_RUN_CYCLES, "granularity": "delta",
+    }
+
+    def measure_phase():
+        phase = {}
+        for endpoint, body in cheap_requests.items():
+            latencies = measure_latencies(base_url + endpoint, body, duration / len(cheap_requests))
+            phase[endpoint] = {
+                "requests": len(latencies),
+                "p50": percentile(latencies, 0.5),
+                "p99": percentile(latencies, 0.99),
+            }
+        return phase
+
+    heavy_statuses = []
+    stopping = threading.Event()
+    def send_heavy_runs():
+        while not stopping.is_set():
+            heavy_statuses.append(post_json(base_url + "/api/run", heavy_body))
+
+    try:
+        results = {"idle": measure_phase()}
+        heavy_threads = [threading.Thread(target=send_heavy_runs) for _ in range(heavy_clients)]
+        for thread in heavy_threads:
+            thread.start()
+        results["loaded"] = measure_phase()
+        stopping.set()
+        for thread in heavy_threads:
+            thread.join()
+        results["loaded"]["heavy_runs"] = heavy_statuses.count(200)
+        results["loaded"]["heavy_runs_refused"] = heavy_statuses.count(503)
+    finally:
+        http_server.shutdown()
+        if server.run_executor is not None:
+            server.run_executor.shutdown()
+        server.run_executor = previous_executor
+    return results
+
+def main(argv=None):
+    """Run the load test from the command line.
+
+    Returns
+    -------
+    int
+        The exit code: 1 if a maximum p99 latency was given and a cheap endpoint went over it while
+        heavy runs were happening, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure the latency of cheap requests while heavy programs run.",
+    )
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds to measure with and without heavy runs (default: 5.0)")
+    parser.add_argument("--heavy-clients", type=int, default=4,
+                        help="clients sending heavy runs at once (default: 4)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes to run programs in, 0 for none (default: 0)")
+    parser.add_argument("--max-p99", type=float,
+                        help="fail if a cheap endpoint's p99 latency under load is above this")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    args = parser.parse_args(argv)
+
+    results = run_load_test(args.duration, args.heavy_clients, args.workers)
+    failed = False
+    for phase_name, phase in results.items():
+        for endpoint in ("/api/check", "/api/compile"):
+            latencies = phase[endpoint]
+            print(f"{phase_name:8} {endpoint:14} {latencies['requests']:6} requests  "
+                  f"p50 {latencies['p50'] * 1000:8.2f} ms  p99 {latencies['p99'] * 1000:8.2f} ms")
+            if phase_name == "loaded" and args.max_p99 is not None \
+                    and latencies["p99"] > args.max_p99:
+                failed = True
+    print(f"heavy runs finished: {results['loaded']['heavy_runs']}, "
+          f"refused: {results['loaded']['heavy_runs_refused']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=4)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
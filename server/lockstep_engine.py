@@ -0,0 +1,198 @@
+"""This file contains an engine that runs many LMCs at once in lockstep, for when the same program
+is run against many lists of inputs, or many programs are run, such as when grading. The memories
+of N machines form an (N, 100) NumPy array and each register is an array of length N, so every
+cycle is a fixed number of array operations on all the machines still running, instead of one pass
+through the interpreter for each machine. Machines that have halted, are waiting for an input or
+have stopped with an error are dropped from the arrays that are worked on.
+NumPy is optional: `is_available` says whether it is installed, and `run_lockstep` raises an
+ImportError if it is not.
+Functions:
+    is_available() -> bool
+    run_lockstep(states: list[dict], inputs: list[list[int]], max_cycles: int,
+        time_limit: float) -> list[dict]"""
+
+import time
+from fast_engine import VALUE_STRINGS, decode_state, encode_state
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# how many cycles to run between each check of the time limit
+TIME_CHECK_INTERVAL = 1024
+
+def is_available():
+    """Whether NumPy is installed, so that `run_lockstep` can be used."""
+    return np is not None
+
+def run_lockstep(states, inputs=None, max_cycles=None, time_limit=None):
+    """Run many LMCs until each one reaches a HLT or INP instruction, or until a limit stops them
+    all. Each machine ends in the same state it would reach by calling `Computer.step` the same
+    number of times. Infinite loops are not detected, so they run until a limit is reached.
+
+    Parameters
+    ----------
+    states : list[dict]
+        The state of each LMC, in the format used by `Computer`. They are not changed.
+    inputs : list[Sequence[int]], optional
+        For each LMC, the values 0-999 to give to its INP instructions, in order. A machine only
+        stops at an INP instruction once it has used all of its inputs.
+    max_cycles : int, optional
+        The maximum number of FDE cycles to run each machine for.
+    time_limit : float, optional
+        The maximum number of seconds to spend running, for all of the machines together.
+
+    Returns
+    -------
+    list[dict]
+        For each machine, in order, the same result as `fast_engine.run_fast`, with a stop reason
+        of "HLT", "INP", "cycle_limit" or "time_limit". If the machine ran an invalid instruction
+        or tried to increment the PC past 99, the stop reason is "error", the error message is
+        included, and the state is the one it started in.
+
+    Raises
+    ------
+    ImportError
+        NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError("The lockstep engine needs NumPy, which is not installed")
+    count = len(states)
+    if count == 0:
+        return []
+    if inputs is None:
+        inputs = [()] * count
+
+    decoded = [decode_state(state) for state in states]
+    memory = np.array([machine_memory.tolist() for machine_memory, _ in decoded], dtype=np.int32)
+    registers = {
+        code: np.array([machine_registers[code] for _, machine_registers in decoded],
+                       dtype=np.int32)
+        for code in ("PC", "ACC", "IR", "MAR", "MDR", "CARRY")
+    }
+    pc, acc, carry = registers["PC"], registers["ACC"], registers["CARRY"]
+    # the inputs of every machine, padded with zeros to the same length
+    input_counts = np.array([len(machine_inputs) for machine_inputs in inputs], dtype=np.int32)
+    padded_inputs = np.zeros((count, max(1, int(input_counts.max()))), dtype=np.int32)
+    for row, machine_inputs in enumerate(inputs):
+        padded_inputs[row, :len(machine_inputs)] = machine_inputs
+    inputs_used = np.zeros(count, dtype=np.int32)
+
+    outputs = [[] for _ in range(count)]
+    stop_reasons = [None] * count
+    stop_cycles = [0] * count
+    errors = {}
+    # the rows of the machines still running
+    running = np.arange(count)
+    # why the machines still running at the end stopped
+    stopped_reason = None
+    cycles = 0
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    while running.size:
+        if cycles == max_cycles:
+            stopped_reason = "cycle_limit"
+            break
+        if (deadline is not None and cycles % TIME_CHECK_INTERVAL == 0
+                and time.monotonic() >= deadline):
+            stopped_reason = "time_limit"
+            break
+
+        # fetch. machines that fail part of the way through the cycle still go through it, but are
+        # reported in the state they started in, so what happens to them does not matter
+        old_pc = pc[running]
+        overflowed = old_pc == 99
+        instruction = memory[running, old_pc]
+        opcode, operand = instruction // 100, instruction % 100
+        cycles += 1
+
+        # decode and execute
+        old_acc = acc[running]
+        old_carry = carry[running]
+        loaded = memory[running, operand]
+        is_add = opcode == 1
+        is_sub = opcode == 2
+        is_lda = opcode == 5
+        total = np.where(is_add, old_acc + loaded, np.where(is_sub, old_acc - loaded, old_acc))
+        new_carry = np.where(is_add, total > 999, np.where(is_sub, total < 0, old_carry))
+        new_acc = np.where(is_lda, loaded, total % 1000)
+
+        is_inp = instruction == 901
+        has_input = inputs_used[running] < input_counts[running]
+        takes_input = is_inp & has_input
+        if takes_input.any():
+            rows = running[takes_input]
+            new_acc[takes_input] = padded_inputs[rows, inputs_used[rows]]
+            inputs_used[rows] += 1
+
+        is_sta = opcode == 3
+        if is_sta.any():
+            memory[running[is_sta], operand[is_sta]] = old_acc[is_sta]
+
+        is_out = instruction == 902
+        if is_out.any():
+            for row, value in zip(running[is_out].tolist(), old_acc[is_out].tolist()):
+                outputs[row].append(VALUE_STRINGS[value])
+
+        jumps = (opcode == 6) | ((opcode == 7) & (old_acc == 0)) \
+            | ((opcode == 8) & (old_carry == 1))
+        pc[running] = np.where(jumps, operand, old_pc + 1)
+        acc[running] = new_acc
+        carry[running] = new_carry
+        registers["IR"][running] = opcode
+        registers["MAR"][running] = operand
+        registers["MDR"][running] = np.where(is_add | is_sub | is_lda, loaded, instruction)
+
+        invalid = ((opcode == 0) & (operand != 0)) \
+            | ((opcode == 9) & (operand != 1) & (operand != 2))
+        halted = instruction == 0
+        waiting = is_inp & ~has_input
+        stopping = overflowed | invalid | halted | waiting
+        if stopping.any():
+            for row, overflow, invalid_instruction, halt in zip(
+                running[stopping].tolist(), overflowed[stopping].tolist(),
+                invalid[stopping].tolist(), halted[stopping].tolist(),
+            ):
+                stop_cycles[row] = cycles
+                if overflow:
+                    stop_reasons[row] = "error"
+                    errors[row] = "Can't increment PC to a value above 99."
+                elif invalid_instruction:
+                    stop_reasons[row] = "error"
+                    errors[row] = "Invalid instruction beginning in 0 or 9"
+                else:
+                    stop_reasons[row] = "HLT" if halt else "INP"
+            running = running[~stopping]
+
+    for row in running.tolist():
+        stop_reasons[row] = stopped_reason
+        stop_cycles[row] = cycles
+
+    results = []
+    for row in range(count):
+        if stop_reasons[row] == "error":
+            results.append({
+                "memory_and_registers": encode_state(*decoded[row]),
+                "reached_HLT": False,
+                "reached_INP": False,
+                "outputs": [],
+                "cycles": 0,
+                "inputs_used": 0,
+                "stop_reason": "error",
+                "error": errors[row],
+            })
+            continue
+        results.append({
+            "memory_and_registers": encode_state(
+                memory[row].tolist(),
+                {code: int(values[row]) for code, values in registers.items()},
+            ),
+            "reached_HLT": stop_reasons[row] == "HLT",
+            "reached_INP": stop_reasons[row] == "INP",
+            "outputs": outputs[row],
+            "cycles": stop_cycles[row],
+            "inputs_used": int(inputs_used[row]),
+            "stop_reason": stop_reasons[row],
+        })
+    return results
@@ -0,0 +1,135 @@
+"""This file contains a small registry of metrics about the server, such as how long each request
+takes, which can be read by Prometheus from the text format it produces. Metrics are kept in memory
+for as long as the server process runs.
+Classes:
+    Histogram
+    MetricsRegistry
+Functions:
+    format_labels(labels: dict) -> str"""
+
+import bisect
+import threading
+
+# upper bounds of the histogram buckets for each kind of value
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+CYCLE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+def format_labels(labels: dict):
+    """Format labels as they appear after a metric name, such as {endpoint="/api/run"}."""
+    if not labels:
+        return ""
+    formatted_labels = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        formatted_labels.append(f"{name}=\"{value}\"")
+    return "{" + ",".join(formatted_labels) + "}"
+
+class Histogram:
+    """A `Histogram` counts how many observed values fall into each of a fixed set of buckets, as
+    well as their total and how many there were."""
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # the number of values in each bucket, not including smaller buckets. the last count is for
+        # values larger than every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Add one value to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: dict):
+        """Get the lines of Prometheus text for this histogram, with cumulative bucket counts."""
+        lines = []
+        cumulative_count = 0
+        for upper_bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative_count += count
+            bucket_labels = format_labels({**labels, "le": upper_bound})
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative_count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+class MetricsRegistry:
+    """A `MetricsRegistry` holds every metric the server records. Each metric is defined once with
+    a name and description, then recorded with any labels, and every combination of labels is kept
+    separately. It is safe to use from several threads at once."""
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # {<name>: (<type>, <description>, <buckets or None>)}
+        self.__definitions = {}
+        # {<name>: {<tuple of label names and values>: <Histogram or number>}}
+        self.__values = {}
+
+    def __define(self, name: str, metric_type: str, description: str, buckets=None):
+        with self.__lock:
+            self.__definitions[name] = (metric_type, description, buckets)
+            self.__values.setdefault(name, {})
+
+    def define_counter(self, name: str, description: str):
+        """Define a counter, which only goes up."""
+        self.__define(name, "counter", description)
+
+    def define_gauge(self, name: str, description: str):
+        """Define a gauge, which can be set to any value."""
+        self.__define(name, "gauge", description)
+
+    def define_histogram(self, name: str, description: str, buckets: tuple):
+        """Define a histogram with the given upper bounds for its buckets."""
+        self.__define(name, "histogram", description, buckets)
+
+    def increment(self, name: str, amount=1, **labels):
+        """Add to a counter."""
+        key = tuple(labels.items())
+        with self.__lock:
+            values = self.__values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name: str, value, **labels):
+        """Set the value of a gauge, or of a counter that is counted somewhere else."""
+        with self.__lock:
+            self.__values[name][tuple(labels.items())] = value
+
+    def observe(self, name: str, value, **labels):
+        """Add a value to a histogram."""
+        key = tuple(labels.items())
+        with self.__lock:
+            values = self.__values[name]
+            if key not in values:
+                values[key] = Histogram(self.__definitions[name][2])
+            values[key].observe(value)
+
+    def get(self, name: str, **labels):
+        """Get the current value of a counter or gauge, or the histogram, for some labels.
+
+        Returns
+        -------
+        int | float | Histogram | None
+            The value, or None if nothing has been recorded with these labels.
+        """
+        with self.__lock:
+            return self.__values[name].get(tuple(labels.items()))
+
+    def render(self):
+        """Get every metric in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The text to serve to Prometheus.
+        """
+        lines = []
+        with self.__lock:
+            for name, (metric_type, description, _) in self.__definitions.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in self.__values[name].items():
+                    if metric_type == "histogram":
+                        lines.extend(value.render(name, dict(key)))
+                    else:
+                        lines.append(f"{name}{format_labels(dict(key))} {value}")
+        return "\n".join(lines) + "\n"
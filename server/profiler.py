@@ -0,0 +1,141 @@
+"""This file contains a profiler for LMC programs, which counts where a program spends its cycles.
+Programs are run with the integer loop from `fast_engine.generate_run_loop`, with counters added
+for every memory address and instruction. The counters are kept in preallocated arrays of integers,
+and their code is added to the loop itself, so profiling adds little to the cost of each cycle.
+Classes:
+    Profile
+Functions:
+    run_profiled(memory_and_registers: dict, profile: Profile, max_cycles: int, time_limit: float,
+        detect_loops: bool, inputs: list[int]) -> dict
+    get_report(profile: Profile, compiled_assembly: dict, line_numbers: list[int]) -> dict"""
+
+from array import array
+import fast_engine
+import program_analysis
+
+# the name of each instruction, in the order they are counted in `Profile.instructions`. opcode 4
+# is not used by any mnemonic and does nothing
+INSTRUCTION_NAMES = ("HLT", "ADD", "SUB", "STA", "4xx", "LDA", "BRA", "BRZ", "BRP", "INP", "OUT")
+INP_INDEX = 9
+OUT_INDEX = 10
+# how many memory addresses to list as hot spots in a report
+HOT_SPOT_COUNT = 10
+
+class Profile:
+    """A `Profile` holds the counters for one or more runs of a program. Running more of the same
+    program with the same `Profile`, such as after each INP, adds to the counts."""
+    def __init__(self):
+        # how many times the instruction at each memory address was run
+        self.executions = array("Q", bytes(8 * 100))
+        # how many times each instruction was run, in the order of `INSTRUCTION_NAMES`
+        self.instructions = array("Q", bytes(8 * len(INSTRUCTION_NAMES)))
+        # how many times the BRZ or BRP instruction at each memory address did and didn't branch
+        self.branches_taken = array("Q", bytes(8 * 100))
+        self.branches_not_taken = array("Q", bytes(8 * 100))
+        # how many times each memory location was read by ADD, SUB and LDA, and written by STA
+        self.reads = array("Q", bytes(8 * 100))
+        self.writes = array("Q", bytes(8 * 100))
+
+    @property
+    def cycles(self):
+        """The total number of FDE cycles counted."""
+        return sum(self.executions)
+
+profiled_loop = fast_engine.generate_run_loop({
+    "setup": """
+        executions = context.executions
+        instructions = context.instructions
+        branches_taken = context.branches_taken
+        branches_not_taken = context.branches_not_taken
+        reads = context.reads
+        writes = context.writes
+    """,
+    "fetch": "executions[pc] += 1",
+    "arithmetic": "reads[operand] += 1",
+    "load": "reads[operand] += 1",
+    "store": "writes[operand] += 1",
+    "branch_taken": "branches_taken[pc - 1] += 1",
+    "branch_not_taken": "branches_not_taken[pc - 1] += 1",
+    "output": "instructions[OUT_INDEX] += 1",
+    "halt": "instructions[0] += 1",
+    "input": "instructions[INP_INDEX] += 1",
+    "end_cycle": """
+        if 0 < opcode < 9:
+            instructions[opcode] += 1
+    """,
+}, {"INP_INDEX": INP_INDEX, "OUT_INDEX": OUT_INDEX})
+
+def run_profiled(memory_and_registers, profile, max_cycles=None, time_limit=None,
+                 detect_loops=False, inputs=()):
+    """Keep running FDE cycles until a HLT or INP instruction is reached, or until one of the
+    optional limits stops execution early, counting every cycle in a profile. The parameters and
+    return value are the same as for `fast_engine.run_fast`.
+
+    Raises
+    ------
+    OverflowError
+        The program counter would have been incremented above 99.
+    ValueError
+        An invalid instruction beginning in 0 or 9 was executed.
+    """
+    return profiled_loop(
+        memory_and_registers, max_cycles, time_limit, detect_loops, inputs, profile,
+    )
+
+def get_report(profile, compiled_assembly, line_numbers):
+    """Map the counts in a profile back onto the lines of the program that was run.
+
+    Parameters
+    ----------
+    profile : Profile
+        The counters from running the program.
+    compiled_assembly : dict
+        The result of `compile_assembly` for the program.
+    line_numbers : list[int]
+        The line number in the user-written code of each line of object code, as returned by
+        `compile_assembly.get_line_numbers`.
+
+    Returns
+    -------
+    dict
+        lines: the counts for each line of object code, with its address and source line number.
+        instructions: how many times each instruction was run.
+        hot_spots: the lines run most often, most first.
+        loops: every loop in the program with the number of cycles spent in it, most first.
+    """
+    lines = []
+    for address, (object_code, line_number) in enumerate(
+        zip(compiled_assembly["object_code"], line_numbers)
+    ):
+        lines.append({
+            "address": str(address).zfill(2),
+            "object_code": object_code,
+            "line_number": line_number,
+            "executions": profile.executions[address],
+            "reads": profile.reads[address],
+            "writes": profile.writes[address],
+            "branches_taken": profile.branches_taken[address],
+            "branches_not_taken": profile.branches_not_taken[address],
+        })
+
+    hot_spots = sorted(
+        (line for line in lines if line["executions"]),
+        key=lambda line: line["executions"], reverse=True,
+    )[:HOT_SPOT_COUNT]
+
+    memory, _ = fast_engine.decode_state(compiled_assembly["memory_and_registers"])
+    loops = []
+    for loop in program_analysis.get_loops(program_analysis.get_graph(memory, 0)):
+        loops.append({
+            "addresses": [str(address).zfill(2) for address in loop],
+            "line_numbers": [line_numbers[address] for address in loop if address < len(lines)],
+            "cycles": sum(profile.executions[address] for address in loop),
+        })
+    loops.sort(key=lambda loop: loop["cycles"], reverse=True)
+
+    return {
+        "lines": lines,
+        "instructions": dict(zip(INSTRUCTION_NAMES, profile.instructions)),
+        "hot_spots": [line["address"] for line in hot_spots],
+        "loops": loops,
+    }
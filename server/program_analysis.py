@@ -0,0 +1,209 @@
+"""This file contains a static analysis of programs in memory, which looks at the instructions
+without running them. It builds a control-flow graph of the memory locations that can be reached
+from the program counter, and uses it to find code that can never run, loops that can never exit,
+and programs that can be proven to never reach HLT or INP.
+The analysis assumes that memory holding code does not change. If an STA instruction that can be
+reached writes to a memory location holding code that can be reached, the program may modify itself,
+and is never reported as running forever.
+Functions:
+    get_successors(address: int, value: int) -> list[int]
+    is_stop(address: int, value: int) -> bool
+    get_graph(memory: array, start: int) -> dict[int, list[int]]
+    get_modified_code(memory: array, graph: dict) -> list[int]
+    never_stops(memory_and_registers: dict) -> bool
+    get_loops(graph: dict) -> list[list[int]]
+    analyse_memory(memory_and_registers: dict) -> dict
+    analyse_program(compiled_assembly: dict) -> dict"""
+
+import fast_engine
+
+def get_successors(address: int, value: int):
+    """Get the memory addresses that the PC can hold after running one instruction.
+
+    Parameters
+    ----------
+    address : int
+        The address the instruction is stored at.
+    value : int
+        The instruction, 0-999.
+
+    Returns
+    -------
+    list[int]
+        The possible next addresses. Empty for HLT, invalid instructions, and address 99 (as the PC
+        can't be incremented past it).
+    """
+    if address == 99:
+        return []
+    opcode, operand = divmod(value, 100)
+    if opcode == 6:
+        return [operand]
+    if opcode in (7, 8):
+        # branch taken, or not taken
+        return [operand] if operand == address + 1 else [operand, address + 1]
+    if opcode in (0, 9) and value not in (901, 902):
+        return []
+    return [address + 1]
+
+def is_stop(address: int, value: int):
+    """Whether running from a memory address stops the program: a HLT, INP or invalid
+    instruction, or address 99."""
+    return address == 99 or (value // 100 in (0, 9) and value != 902)
+
+def get_graph(memory, start: int):
+    """Build the control-flow graph of every memory address that can be reached from one address.
+
+    Parameters
+    ----------
+    memory : array
+        The 100 memory cells as integers.
+    start : int
+        The address to start from, usually the PC.
+
+    Returns
+    -------
+    dict[int, list[int]]
+        Every reachable address, mapped to its possible next addresses.
+    """
+    graph = {}
+    to_visit = [start]
+    while to_visit:
+        address = to_visit.pop()
+        if address in graph:
+            continue
+        graph[address] = get_successors(address, memory[address])
+        to_visit.extend(graph[address])
+    return graph
+
+def get_modified_code(memory, graph: dict):
+    """Find the reachable addresses that are written to by a reachable STA instruction."""
+    return sorted({
+        memory[address] % 100 for address in graph
+        if memory[address] // 100 == 3 and memory[address] % 100 in graph
+    })
+
+def never_stops(memory_and_registers: dict):
+    """Check whether a program can be proven to keep running forever, so will never reach a HLT or
+    INP instruction, or stop with an error.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        State of LMC.
+
+    Returns
+    -------
+    bool
+        True if the program never stops, False if it might.
+    """
+    memory, registers = fast_engine.decode_state(memory_and_registers)
+    graph = get_graph(memory, registers["PC"])
+    if any(is_stop(address, memory[address]) for address in graph):
+        return False
+    return not get_modified_code(memory, graph)
+
+def get_loops(graph: dict):
+    """Find the loops in a control-flow graph, which are its strongly connected components that
+    contain a cycle.
+
+    Returns
+    -------
+    list[list[int]]
+        The addresses in each loop, in order of their smallest address.
+    """
+    # every address that can be reached in one or more steps from each address
+    reachable_from = {}
+    for address in graph:
+        reached = set()
+        to_visit = list(graph[address])
+        while to_visit:
+            next_address = to_visit.pop()
+            if next_address not in reached:
+                reached.add(next_address)
+                to_visit.extend(graph[next_address])
+        reachable_from[address] = reached
+
+    loops = []
+    in_loop = set()
+    for address in sorted(graph):
+        if address in in_loop or address not in reachable_from[address]:
+            continue
+        loop = sorted(
+            other for other in reachable_from[address] if address in reachable_from[other]
+        )
+        in_loop.update(loop)
+        loops.append(loop)
+    return loops
+
+def analyse_memory(memory_and_registers: dict):
+    """Analyse the program in memory, starting from the PC.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        State of LMC.
+
+    Returns
+    -------
+    dict
+        graph: every reachable memory address, mapped to the addresses that can run after it.
+        self_loops: addresses holding a BRA to itself, which never exits.
+        stateless_loops: loops (other than self loops) with no INP, and no STA that writes to
+            memory that the loop reads or runs, so the only thing that can change whether they exit
+            is ACC and CARRY.
+        modified_code: reachable addresses that are written to by a reachable STA.
+        never_stops: whether the program can be proven to never reach HLT or INP.
+        Addresses are two-digit strings, as in memory.
+    """
+    memory, registers = fast_engine.decode_state(memory_and_registers)
+    graph = get_graph(memory, registers["PC"])
+
+    stateless_loops = []
+    self_loops = []
+    for loop in get_loops(graph):
+        if len(loop) == 1 and memory[loop[0]] == 600 + loop[0]:
+            self_loops.append(loop[0])
+            continue
+        values = [memory[address] for address in loop]
+        read = {value % 100 for value in values if value // 100 in (1, 2, 5)}
+        written = {value % 100 for value in values if value // 100 == 3}
+        if 901 not in values and not written & (read | set(loop)):
+            stateless_loops.append(loop)
+
+    modified_code = get_modified_code(memory, graph)
+    stops = any(is_stop(address, memory[address]) for address in graph)
+
+    def to_address(address):
+        return str(address).zfill(2)
+    return {
+        "graph": {
+            to_address(address): [to_address(successor) for successor in graph[address]]
+            for address in sorted(graph)
+        },
+        "self_loops": [to_address(address) for address in self_loops],
+        "stateless_loops": [[to_address(address) for address in loop] for loop in stateless_loops],
+        "modified_code": [to_address(address) for address in modified_code],
+        "never_stops": not (stops or modified_code),
+    }
+
+def analyse_program(compiled_assembly: dict):
+    """Analyse a program that has just been compiled, as `analyse_memory` does, and also find the
+    instructions that can never run.
+
+    Parameters
+    ----------
+    compiled_assembly : dict
+        The result of `compile_assembly`.
+
+    Returns
+    -------
+    dict
+        The result of `analyse_memory`, with unreachable: the addresses of instructions (lines
+        other than DAT) that can never run.
+    """
+    analysis = analyse_memory(compiled_assembly["memory_and_registers"])
+    analysis["unreachable"] = [
+        line[:2] for line in compiled_assembly["object_code"]
+        if line[3:6] != "DAT" and line[:2] not in analysis["graph"]
+    ]
+    return analysis
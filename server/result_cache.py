@@ -0,0 +1,163 @@
+"""This file contains a cache of the results of running programs, kept on disk in an SQLite
+database so that it survives the server restarting. Running a program is deterministic, so its
+results only depend on the state of the LMC it starts in (such as the machine code from
+`compile_assembly`), the inputs it is given and the options it is run with, and a program that is
+run again with the same ones can be answered from the cache instead of being run. Results that were
+stopped by a time limit depend on how fast the server was, so they are never cached.
+Results are stored compressed, and the least recently used ones are removed once they take up more
+than a maximum number of bytes.
+Classes:
+    ResultCache
+Functions:
+    get_key(memory_and_registers: dict, inputs: list, **options) -> str"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from fast_engine import decode_state
+
+# default limit on the size of the compressed results in the cache
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# results that take up more than this fraction of the cache on their own are not stored
+MAX_ENTRY_FRACTION = 1 / 16
+
+def get_key(memory_and_registers: dict, inputs, **options):
+    """Get the key that the results of a run are stored under in a `ResultCache`.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        The state of the LMC before the run, in the format used by `Computer`.
+    inputs : Iterable[int | str]
+        The values given to INP instructions.
+    **options
+        Anything else that changes the results, such as the cycle limit and granularity. They must
+        be JSON serialisable.
+
+    Returns
+    -------
+    str
+        A hash of the state, inputs and options, which is the same for equal values however they
+        are written (e.g. "5" or "005").
+
+    Raises
+    ------
+    ValueError
+        The state or an input is not a number.
+    """
+    memory, registers = decode_state(memory_and_registers)
+    key = json.dumps(
+        [memory.tolist(), sorted(registers.items()), [int(value) for value in inputs], options],
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """A `ResultCache` stores the results of runs in an SQLite database at `path`, using at most
+    `max_bytes` for the compressed results. It is safe to use from several threads, and several
+    processes can share the same database."""
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(
+            path, timeout=10.0, check_same_thread=False, isolation_level=None,
+        )
+        with self.__lock:
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @property
+    def size(self):
+        """The number of bytes taken up by the compressed results."""
+        with self.__lock:
+            return self.__connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()[0]
+
+    def get(self, key: str):
+        """Get the results stored under a key, or None if there are none."""
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__connection.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key),
+            )
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, value):
+        """Store the results of a run under a key, removing the least recently used results if the
+        cache is then too large. Results too large to fit are not stored.
+
+        Parameters
+        ----------
+        key : str
+            The key from `get_key`.
+        value : Any
+            The results, which must be JSON serialisable.
+        """
+        compressed = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        if len(compressed) > self.max_bytes * MAX_ENTRY_FRACTION:
+            return
+        with self.__lock:
+            self.__connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.__connection.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, compressed, len(compressed), time.time()),
+                )
+                self.__evict()
+                self.__connection.execute("COMMIT")
+            except BaseException:
+                self.__connection.execute("ROLLBACK")
+                raise
+
+    def __evict(self):
+        """Remove the least recently used results until the cache is no larger than `max_bytes`."""
+        size = self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        if size <= self.max_bytes:
+            return
+        evicted = []
+        for key, entry_size in self.__connection.execute(
+            "SELECT key, size FROM results ORDER BY last_used"
+        ):
+            if size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            size -= entry_size
+        self.__connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def clear(self):
+        """Remove every result from the cache and reset the hit and miss counters."""
+        with self.__lock:
+            self.__connection.execute("DELETE FROM results")
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """Close the database. The cache can't be used afterwards."""
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,114 @@
+"""This file contains a bounded executor for running programs in worker processes. Running a program
+is CPU-bound, so when it happens in the process serving requests it holds the GIL and slows down
+every other request, including cheap ones like /api/check. Running it in a worker process leaves
+the server free to answer those while the request that started the run waits for its result.
+The number of runs that can be running or waiting for a worker at once is limited, and new runs
+are refused once it is reached (admission control), so a burst of heavy runs can't build up an
+unbounded queue or use up every thread of the server.
+Classes:
+    ExecutorFullError
+    RunExecutor
+Functions:
+    run_computer(computer: Computer, run_args: dict) -> tuple[Computer, list[dict] | dict]"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# how many runs can wait for a worker, for each worker, before more are refused
+DEFAULT_QUEUE_PER_WORKER = 4
+
+class ExecutorFullError(RuntimeError):
+    """Raised when a run is submitted to a `RunExecutor` that already has as many runs as it
+    allows."""
+
+def run_computer(computer, run_args: dict):
+    """Run a computer in a worker process. The computer is a copy, so it is returned along with the
+    results of the run.
+
+    Parameters
+    ----------
+    computer : Computer
+        The computer to run.
+    run_args : dict
+        The keyword arguments to pass to `Computer.run`.
+
+    Returns
+    -------
+    tuple[Computer, list[dict] | dict]
+        The computer after the run, and the return value of `Computer.run`.
+    """
+    return computer, computer.run(**run_args)
+
+class RunExecutor:
+    """A `RunExecutor` runs functions in a pool of `max_workers` worker processes, with at most
+    `max_pending` of them running or queued at once. It is safe to use from several threads."""
+    def __init__(self, max_workers: int, max_pending: int = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending if max_pending is not None \
+            else max_workers * (1 + DEFAULT_QUEUE_PER_WORKER)
+        self.__lock = threading.Lock()
+        self.__pending = 0
+        # created the first time it is needed, so that no processes are started until then
+        self.__pool = None
+
+    @property
+    def pending(self):
+        """The number of functions running or waiting for a worker."""
+        return self.__pending
+
+    def __finish(self, _):
+        with self.__lock:
+            self.__pending -= 1
+
+    def submit(self, function, *args):
+        """Run a function in a worker process.
+
+        Parameters
+        ----------
+        function : Callable
+            The function to run, which must be defined at the top level of a module so that it can
+            be sent to the worker.
+        *args
+            Its arguments, which must be picklable.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The result of the function, once it has finished.
+
+        Raises
+        ------
+        ExecutorFullError
+            `max_pending` functions are already running or queued.
+        """
+        with self.__lock:
+            if self.__pending >= self.max_pending:
+                raise ExecutorFullError("Too many programs are running, try again later")
+            if self.__pool is None:
+                self.__pool = ProcessPoolExecutor(self.max_workers)
+            self.__pending += 1
+        try:
+            future = self.__pool.submit(function, *args)
+        except Exception:
+            self.__finish(None)
+            raise
+        future.add_done_callback(self.__finish)
+        return future
+
+    def run(self, function, *args):
+        """Run a function in a worker process and wait for its result. Exceptions raised by the
+        function are raised again here.
+
+        Raises
+        ------
+        ExecutorFullError
+            `max_pending` functions are already running or queued.
+        """
+        return self.submit(function, *args).result()
+
+    def shutdown(self):
+        """Stop the worker processes, after the functions already submitted have finished."""
+        with self.__lock:
+            pool, self.__pool = self.__pool, None
+        if pool is not None:
+            pool.shutdown()
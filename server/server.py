@@ -1,14 +1,349 @@
 """This script is responsible for the running of the Flask server and handling of each request."""
 
-from flask import Flask, request, jsonify
+import atexit
+import contextlib
+import functools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import flask_cors
+import batch
+import breakpoints as breakpoints_module
 import compile_assembly
 import computer as computer_module
+import incremental_assembly
+import lockstep_engine
+import metrics
+import profiler
+import program_analysis
+import result_cache as result_cache_module
+import run_executor as run_executor_module
+import session_store
+import wire_format
 
 
 app = Flask(__name__)
 flask_cors.CORS(app)
 
+# programs being edited, for /api/check-edit
+editing_sessions = session_store.SessionStore()
+# computers kept between /api/step, /api/run and /api/after-input requests, so that clients only
+# need to send a session id instead of the whole state of the LMC
+execution_sessions = session_store.SessionStore(max_size=1000, ttl=3600.0)
+
+# metrics about requests and runs, read by Prometheus from /metrics
+server_metrics = metrics.MetricsRegistry()
+server_metrics.define_histogram(
+    "lmc_request_duration_seconds",
+    "Time taken to handle each request. For streamed responses, the time until the stream starts.",
+    metrics.LATENCY_BUCKETS,
+)
+server_metrics.define_counter("lmc_requests_total", "Number of requests handled.")
+server_metrics.define_histogram(
+    "lmc_request_size_bytes", "Size of each request body.", metrics.SIZE_BUCKETS,
+)
+server_metrics.define_histogram(
+    "lmc_response_size_bytes", "Size of each response body, except streamed responses.",
+    metrics.SIZE_BUCKETS,
+)
+server_metrics.define_histogram(
+    "lmc_run_cycles", "Number of FDE cycles run by each run or batch job.", metrics.CYCLE_BUCKETS,
+)
+server_metrics.define_counter(
+    "lmc_compile_cache_hits_total", "Number of compiles answered from the compile cache.",
+)
+server_metrics.define_counter(
+    "lmc_compile_cache_misses_total", "Number of compiles not found in the compile cache.",
+)
+server_metrics.define_gauge(
+    "lmc_compile_cache_hit_ratio", "Fraction of compiles answered from the compile cache.",
+)
+server_metrics.define_gauge("lmc_compile_cache_entries", "Number of programs in the compile cache.")
+server_metrics.define_gauge(
+    "lmc_run_executor_pending", "Number of runs running or waiting in worker processes.",
+)
+server_metrics.define_counter(
+    "lmc_runs_rejected_total", "Number of runs refused because too many were already pending.",
+)
+server_metrics.define_counter(
+    "lmc_result_cache_hits_total", "Number of runs and batch jobs answered from the result cache.",
+)
+server_metrics.define_counter(
+    "lmc_result_cache_misses_total", "Number of runs and batch jobs not found in the result cache.",
+)
+server_metrics.define_gauge(
+    "lmc_result_cache_bytes", "Size of the compressed results in the result cache.",
+)
+
+# limits on how long one /api/run request can keep executing. clients may ask for lower limits.
+MAX_RUN_CYCLES = 10_000
+MAX_RUN_SECONDS = 5.0
+# streamed runs only hold one batch in memory at a time, so they can go on for longer
+MAX_STREAM_CYCLES = 1_000_000
+MAX_STREAM_SECONDS = 60.0
+DEFAULT_STREAM_BATCH_SIZE = 50
+MAX_STREAM_BATCH_SIZE = 1000
+# limits for /api/batch, where each job is one program run against one list of inputs
+MAX_BATCH_JOBS = 1000
+MAX_BATCH_JOB_CYCLES = batch.DEFAULT_JOB_CYCLES
+MAX_BATCH_JOB_SECONDS = batch.DEFAULT_JOB_SECONDS
+# batches with at least this many jobs are spread across worker processes
+PARALLEL_BATCH_THRESHOLD = 16
+# streamed programs that can be proven to never stop get the same cycle limit as /api/run, unless
+# the client asks for more
+MAX_NON_TERMINATING_STREAM_CYCLES = MAX_RUN_CYCLES
+
+# runs for /api/run are sent to this many worker processes if LMC_RUN_WORKERS is set, so that heavy
+# programs don't slow down cheap requests such as /api/check. otherwise they run in the request
+# thread, which is faster for short runs
+run_executor = None
+if os.environ.get("LMC_RUN_WORKERS"):
+    run_executor = run_executor_module.RunExecutor(int(os.environ["LMC_RUN_WORKERS"]))
+    atexit.register(run_executor.shutdown)
+
+# results of /api/run and /api/batch are kept in an SQLite database at LMC_RESULT_CACHE if it is
+# set, so that programs run again with the same inputs are answered without running them, even
+# after the server restarts. LMC_RESULT_CACHE_BYTES sets how large it can get
+result_cache = None
+if os.environ.get("LMC_RESULT_CACHE"):
+    result_cache = result_cache_module.ResultCache(
+        os.environ["LMC_RESULT_CACHE"],
+        int(os.environ.get("LMC_RESULT_CACHE_BYTES", result_cache_module.DEFAULT_MAX_BYTES)),
+    )
+
+@functools.cache
+def get_batch_process_pool():
+    """Get the pool of worker processes shared by every /api/batch request, creating it the first
+    time it is needed. The pool is shut down when the server exits, cancelling any jobs that have
+    not started."""
+    pool = ProcessPoolExecutor()
+    atexit.register(pool.shutdown, cancel_futures=True)
+    return pool
+
+def get_state(req_body):
+    """Extract the memory and registers of the LMC from a request body, ignoring any options that
+    were sent alongside them."""
+    return {
+        "memory": req_body.get("memory"),
+        "registers": req_body.get("registers"),
+    }
+
+def get_request_body():
+    """Get the body of a request to /api/step or /api/run. This is either JSON, or a state of the
+    LMC in the binary wire format (see wire_format.py), in which case no other options can be sent.
+
+    Returns
+    -------
+    dict | None
+        The request body, or None if it is not JSON or the binary format.
+
+    Raises
+    ------
+    ValueError
+        The binary request body is not a valid state of the LMC.
+    """
+    if request.mimetype == wire_format.MIMETYPE:
+        req_body = wire_format.decode(request.get_data())
+        if not (isinstance(req_body, dict) and "memory" in req_body):
+            raise ValueError("Binary request body must be a state of the LMC")
+        return req_body
+    if request.is_json:
+        return request.get_json()
+    return None
+
+def make_state_response(value):
+    """Make a response containing a state of the LMC, a step result or a list of step results. The
+    binary wire format is used if the client accepts it in preference to JSON."""
+    if request.accept_mimetypes.best_match(
+        ["application/json", wire_format.MIMETYPE]
+    ) == wire_format.MIMETYPE:
+        return Response(wire_format.encode(value), mimetype=wire_format.MIMETYPE)
+    return jsonify(value)
+
+def use_session(store, session_id):
+    """Get the value stored in a session, holding the session's lock until the request has been
+    handled (or until its stream has ended), so that requests using the same session are handled
+    one at a time. Returns None if the session does not exist or has expired."""
+    if "sessions_in_use" not in g:
+        g.sessions_in_use = contextlib.ExitStack()
+    return g.sessions_in_use.enter_context(store.use(session_id))
+
+def get_computer(req_body):
+    """Get the computer that a request should run. If the request has a session_id, this is the
+    computer kept in that session, otherwise it is a new computer built from the state in the
+    request body. A session's computer is not used by any other request until this one has been
+    handled.
+
+    Returns
+    -------
+    tuple[Computer, bool]
+        The computer, and whether it came from a session.
+
+    Raises
+    ------
+    LookupError
+        The session does not exist or has expired.
+    ValueError
+        The state in the request body is not a valid state of the LMC.
+    """
+    if "session_id" in req_body:
+        computer = None
+        if isinstance(req_body["session_id"], str):
+            computer = use_session(execution_sessions, req_body["session_id"])
+        if computer is None:
+            raise LookupError("Session not found. Compile the program again to start a new one.")
+        return computer, True
+    return computer_module.Computer(get_state(req_body)), False
+
+def get_inputs(req_body):
+    """Get the list of values for INP instructions to use during a run from a request body.
+
+    Raises
+    ------
+    ValueError
+        The inputs are not a list of numbers 0-999.
+    """
+    inputs = req_body.get("inputs", [])
+    if not isinstance(inputs, list):
+        raise ValueError("inputs must be a list")
+    return [computer_module.validate_input(input_value) for input_value in inputs]
+
+def get_run_limits(req_body, cycle_cap=MAX_RUN_CYCLES, time_cap=MAX_RUN_SECONDS):
+    """Get the cycle and time limits for a run from a request body, capped at the server maximums.
+
+    Raises
+    ------
+    ValueError
+        A limit was given that is not a positive number.
+    """
+    max_cycles = req_body.get("max_cycles", cycle_cap)
+    time_limit = req_body.get("time_limit", time_cap)
+    if not (isinstance(max_cycles, int) and not isinstance(max_cycles, bool) and max_cycles > 0):
+        raise ValueError("max_cycles must be a positive integer")
+    if not (isinstance(time_limit, (int, float)) and not isinstance(time_limit, bool)
+            and time_limit > 0):
+        raise ValueError("time_limit must be a positive number")
+    return min(max_cycles, cycle_cap), min(time_limit, time_cap)
+
+def get_breakpoints(req_body, computer):
+    """Get the breakpoints and watchpoints for a run from a request body. Breakpoints can be sent
+    as memory addresses (breakpoints) or, in a session, as line numbers of the program it was
+    compiled from (breakpoint_lines).
+
+    Returns
+    -------
+    Breakpoints | None
+        The breakpoints, or None if there are none.
+
+    Raises
+    ------
+    ValueError
+        The breakpoints or watchpoints are not valid.
+    """
+    if not any(key in req_body for key in ("breakpoints", "breakpoint_lines", "watchpoints")):
+        return None
+    addresses = req_body.get("breakpoints", [])
+    lines = req_body.get("breakpoint_lines", [])
+    watchpoints = req_body.get("watchpoints", [])
+    if not all(isinstance(value, list) for value in (addresses, lines, watchpoints)):
+        raise ValueError("breakpoints, breakpoint_lines and watchpoints must be lists")
+    if lines:
+        if computer.line_numbers is None:
+            raise ValueError("breakpoint_lines can only be used in a session")
+        if not all(breakpoints_module.is_integer(line) for line in lines):
+            raise ValueError("breakpoint_lines must be integers")
+        addresses = addresses + breakpoints_module.get_line_addresses(computer.line_numbers, lines)
+    return breakpoints_module.Breakpoints(addresses, watchpoints)
+
+def get_cached_run(memory_and_registers, run_args, in_session):
+    """Look up the results of a run in the result cache. Runs in a session or with breakpoints
+    are not cached, as they change more than the results.
+
+    Parameters
+    ----------
+    memory_and_registers : dict
+        The state of the LMC before the run.
+    run_args : dict
+        The keyword arguments that `Computer.run` will be called with.
+    in_session : bool
+        Whether the run is in an execution session.
+
+    Returns
+    -------
+    tuple[str | None, dict | None]
+        The key to store the results under after running, or None if they can't be cached, and
+        the stop reason and results from the cache, or None if they are not in it.
+    """
+    if result_cache is None or in_session or run_args["breakpoints"] is not None:
+        return None, None
+    try:
+        cache_key = result_cache_module.get_key(
+            memory_and_registers, run_args["inputs"], kind="run",
+            max_cycles=run_args["max_cycles"], detect_loops=run_args["detect_loops"],
+            granularity=run_args["granularity"],
+        )
+    except ValueError:
+        # the state is not valid, which running reports
+        return None, None
+    return cache_key, result_cache.get(cache_key)
+
+@app.before_request
+def start_request_timer():
+    """Record when each request started being handled, to measure how long it takes."""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record how long each request to an /api endpoint took, its status, and the size of the
+    request and response bodies."""
+    if request.url_rule is None or not request.url_rule.rule.startswith("/api/"):
+        return response
+    endpoint = request.url_rule.rule
+    server_metrics.observe(
+        "lmc_request_duration_seconds", time.perf_counter() - g.request_start, endpoint=endpoint,
+    )
+    server_metrics.increment(
+        "lmc_requests_total", endpoint=endpoint, method=request.method,
+        status=str(response.status_code),
+    )
+    if request.content_length is not None:
+        server_metrics.observe("lmc_request_size_bytes", request.content_length, endpoint=endpoint)
+    if not response.is_streamed and response.content_length is not None:
+        server_metrics.observe(
+            "lmc_response_size_bytes", response.content_length, endpoint=endpoint,
+        )
+    return response
+
+@app.teardown_request
+def release_sessions(_):
+    """Let other requests use the sessions that a request used, once it has been handled."""
+    if "sessions_in_use" in g:
+        g.sessions_in_use.close()
+
+@app.get("/metrics")
+def get_metrics():
+    """Handles the GET /metrics endpoint. Returns every metric in the Prometheus text format. Only
+    requests from the same machine are allowed."""
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return "Metrics are only available locally", 403
+    cache = compile_assembly.compile_cache
+    lookups = cache.hits + cache.misses
+    server_metrics.set("lmc_compile_cache_hits_total", cache.hits)
+    server_metrics.set("lmc_compile_cache_misses_total", cache.misses)
+    server_metrics.set("lmc_compile_cache_hit_ratio", cache.hits / lookups if lookups else 0.0)
+    server_metrics.set("lmc_compile_cache_entries", len(cache))
+    if run_executor is not None:
+        server_metrics.set("lmc_run_executor_pending", run_executor.pending)
+    if result_cache is not None:
+        server_metrics.set("lmc_result_cache_hits_total", result_cache.hits)
+        server_metrics.set("lmc_result_cache_misses_total", result_cache.misses)
+        server_metrics.set("lmc_result_cache_bytes", result_cache.size)
+    return Response(
+        server_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
 @app.post("/api/check")
 def post_check():
     """Handles the POST /api/check endpoint.
@@ -21,7 +356,7 @@ def post_check():
             return "uncompiledCode was not string", 400
 
         try:
-            compile_assembly.compile_assembly(req_body["uncompiledCode"])
+            compile_assembly.compile_assembly_cached(req_body["uncompiledCode"])
             return jsonify({"valid": True})
 
         except ValueError as error:
@@ -35,7 +370,10 @@ def post_check():
 @app.post("/api/compile")
 def post_compile():
     """Handles the POST /api/compile endpoint.
-    Receives user-written assembly and compiles it to object code and machine code."""
+    Receives user-written assembly and compiles it to object code and machine code. If session is
+    true, also starts an execution session, and returns its session_id for use instead of the state
+    of the LMC in /api/step, /api/run, /api/run/stream and /api/after-input. If analyse is true,
+    the result also has a static analysis of the program (see program_analysis.py)."""
     if request.is_json:
         req_body = request.get_json()
         # todo: ALL RESPONSES SHOULD BE JSON
@@ -46,7 +384,21 @@ def post_compile():
             return "uncompiledCode was not string", 400
 
         try:
-            compiled_assembly = compile_assembly.compile_assembly(req_body["uncompiledCode"])
+            compiled_assembly = compile_assembly.compile_assembly_cached(
+                req_body["uncompiledCode"], bool(req_body.get("analyse")),
+            )
+            if req_body.get("session"):
+                computer = computer_module.Computer(
+                    compiled_assembly["memory_and_registers"], keep_history=True,
+                )
+                # so that breakpoints can be set on lines
+                computer.line_numbers = compile_assembly.get_line_numbers(
+                    req_body["uncompiledCode"],
+                )
+                session_id = execution_sessions.add(computer)
+                return jsonify({
+                    "valid": True, "result": compiled_assembly, "session_id": session_id,
+                })
             return jsonify({"valid": True, "result": compiled_assembly})
         except ValueError as error:
             return jsonify({
@@ -56,19 +408,77 @@ def post_compile():
             })
     return "Expected JSON request", 415 # Unsupported Media Type
 
-@app.post("/api/step")
-def post_step():
-    """Handles the POST /api/step endpoint. Receives state of LMC and runs one
-    fetch-decode-execute cycle. Returns list of transfers."""
+@app.post("/api/check-edit")
+def post_check_edit():
+    """Handles the POST /api/check-edit endpoint.
+    Checks user-written assembly code while it is being edited. The first request sends the whole
+    program as uncompiledCode and gets back a session id. Later requests send the session id and
+    only the edited lines: the lines from start (inclusive, counting from 0) to end (exclusive) are
+    replaced with lines. Returns whether the code is valid and which memory locations changed."""
     if request.is_json:
         req_body = request.get_json()
+        if "session_id" in req_body:
+            if not isinstance(req_body["session_id"], str):
+                return "session_id was not string", 400
+            assembler = use_session(editing_sessions, req_body["session_id"])
+            if assembler is None:
+                return "Session not found. Send uncompiledCode to start a new one.", 404
+            session_id = req_body["session_id"]
+            start, end, lines = (req_body.get(key) for key in ("start", "end", "lines"))
+            if not (isinstance(start, int) and isinstance(end, int) and isinstance(lines, list)
+                    and all(isinstance(line, str) for line in lines)):
+                return "Need start and end line indexes, and lines as a list of strings", 400
+            try:
+                changed_memory = assembler.replace_lines(start, end, lines)
+            except IndexError as error:
+                return error.args[0], 400
+        elif isinstance(req_body.get("uncompiledCode"), str):
+            assembler = incremental_assembly.IncrementalAssembler(req_body["uncompiledCode"])
+            session_id = editing_sessions.add(assembler)
+            changed_memory = None
+        else:
+            return "Could not find session_id or uncompiledCode", 400
+
         try:
-            computer = computer_module.Computer(req_body)
-            response = jsonify(computer.step())
-            return response
+            assembler.result()
+            return jsonify({
+                "session_id": session_id, "valid": True, "changed_memory": changed_memory,
+            })
+        except ValueError as error:
+            return jsonify({
+                "session_id": session_id,
+                "valid": False,
+                "reason": error.args[0],
+                "line_number": error.args[1] if len(error.args) > 1 else "unknown",
+                "changed_memory": changed_memory,
+            })
+    return "Expected JSON request", 415
+
+@app.post("/api/step")
+def post_step():
+    """Handles the POST /api/step endpoint. Receives state of LMC (or a session_id) and runs one
+    fetch-decode-execute cycle. Returns list of transfers. In a session, only the registers and
+    memory locations that changed are returned, instead of the whole state.
+    The state can be sent, and the result received, in the binary wire format instead of JSON."""
+    try:
+        req_body = get_request_body()
+    except ValueError as err:
+        return err.args[0], 400
+    if req_body is not None:
+        try:
+            computer, in_session = get_computer(req_body)
+        except LookupError as err:
+            return err.args[0], 404
         except ValueError as err:
+            return err.args[0], 400
+        try:
+            if in_session:
+                return jsonify(computer.step_delta())
+            response = make_state_response(computer.step())
+            return response
+        except (ValueError, OverflowError) as err:
             return f"Error when trying to step: {err.args[0]}", 500
-    return "Expected JSON request", 415
+    return "Expected JSON or binary request", 415
 
 @app.post("/api/after-input")
 def post_after_input():
@@ -76,24 +486,393 @@ def post_after_input():
     collected from user, and updates the LMC accordingly. Returns one transfer."""
     if request.is_json:
         req_body = request.get_json()
-        if not (req_body["input"] and req_body["state"]):
-            return "Invalid request body. Need input and state.", 400
-        computer = computer_module.Computer(req_body["state"])
-        response = jsonify(computer.finish_after_input(req_body["input"]))
-        return response
+        if "session_id" in req_body:
+            if not req_body.get("input"):
+                return "Invalid request body. Need input and session_id.", 400
+            try:
+                computer, _ = get_computer(req_body)
+            except LookupError as err:
+                return err.args[0], 404
+        else:
+            if not (req_body["input"] and req_body["state"]):
+                return "Invalid request body. Need input and state.", 400
+            try:
+                computer = computer_module.Computer(req_body["state"])
+            except ValueError as err:
+                return err.args[0], 400
+        try:
+            input_value = computer_module.validate_input(req_body["input"])
+        except ValueError as err:
+            return err.args[0], 400
+        return jsonify(computer.finish_after_input(input_value))
     return "Expected JSON request", 415
 
 
+@app.post("/api/seek")
+def post_seek():
+    """Handles the POST /api/seek endpoint. Moves the computer in an execution session back to the
+    state it was in after an earlier cycle, either cycle (counting from when the session started)
+    or back (how many cycles to step back, 1 by default). Cycles after it are forgotten. Returns
+    the registers and memory locations that changed, the cycle now reached, and the earliest cycle
+    that can still be returned to."""
+    if request.is_json:
+        req_body = request.get_json()
+        if "session_id" not in req_body:
+            return "Need session_id", 400
+        try:
+            computer, _ = get_computer(req_body)
+        except LookupError as err:
+            return err.args[0], 404
+        value = req_body.get("cycle", req_body.get("back", 1))
+        if not isinstance(value, int) or isinstance(value, bool):
+            return "cycle and back must be integers", 400
+        cycle = value if "cycle" in req_body else computer.history.cycle - value
+        state_before = computer_module.copy_state(computer.memory_and_registers)
+        try:
+            computer.seek(cycle)
+        except ValueError as err:
+            return err.args[0], 400
+        return jsonify({
+            "cycle": computer.history.cycle,
+            "first_cycle": computer.history.first_cycle,
+            "delta": computer_module.get_state_delta(state_before, computer.memory_and_registers),
+        })
+    return "Expected JSON request", 415
+
 @app.post("/api/run")
 def post_run():
     """Handles the POST /api/run endpoint. Receives state of LMC and runs fetch-decode-execute
-    cycles until HLT or INP reached. Returns list of transfers."""
+    cycles until HLT or INP reached. Returns list of transfers, or a summary of the run if a
+    granularity other than "trace" is requested. If a list of inputs is sent, INP instructions use
+    them instead of stopping the run until they run out.
+    If the run is stopped early because it used up its cycle or time budget, got stuck in an
+    infinite loop, or reached a breakpoint or watchpoint, returns an object with the reason it
+    stopped (and which watchpoint, if one stopped it) and the list of transfers so far.
+    In a session, always returns an object, with only the registers and memory locations that
+    changed during the run in place of the state of the LMC.
+    Programs that can be proven to never reach HLT or INP are not run unless max_cycles is sent.
+    The state can be sent in the binary wire format instead of JSON, and a list of transfers is
+    returned in it if the client accepts it.
+    If runs are done in worker processes and too many are already waiting, responds with 503.
+    Runs outside sessions without breakpoints are answered from the result cache, if there is one
+    and the same state has been run with the same inputs and options before."""
+    try:
+        req_body = get_request_body()
+    except ValueError as err:
+        return err.args[0], 400
+    if req_body is not None:
+        try:
+            max_cycles, time_limit = get_run_limits(req_body)
+            inputs = get_inputs(req_body)
+        except ValueError as err:
+            return err.args[0], 400
+        granularity = req_body.get("granularity", "trace")
+        if granularity not in computer_module.GRANULARITIES:
+            return f"granularity must be one of {', '.join(computer_module.GRANULARITIES)}", 400
+        try:
+            computer, in_session = get_computer(req_body)
+        except LookupError as err:
+            return err.args[0], 404
+        except ValueError as err:
+            return err.args[0], 400
+        try:
+            breakpoints = get_breakpoints(req_body, computer)
+        except ValueError as err:
+            return err.args[0], 400
+        if "max_cycles" not in req_body and program_analysis.never_stops(
+            computer.memory_and_registers
+        ):
+            return "Program can never reach HLT or INP, so was not run. Send max_cycles to run it \
+anyway.", 400
+        state_before = computer_module.copy_state(computer.memory_and_registers)
+        run_args = {
+            "max_cycles": max_cycles, "time_limit": time_limit, "detect_loops": True,
+            "granularity": granularity, "inputs": inputs, "breakpoints": breakpoints,
+        }
+        cache_key, cached = get_cached_run(state_before, run_args, in_session)
+        if cached is not None:
+            computer.stop_reason, results = cached["stop_reason"], cached["results"]
+        else:
+            try:
+                if run_executor is None:
+                    results = computer.run(**run_args)
+                else:
+                    computer, results = run_executor.run(
+                        run_executor_module.run_computer, computer, run_args,
+                    )
+                    if in_session:
+                        # the worker ran a copy of the computer
+                        execution_sessions.replace(req_body["session_id"], computer)
+            except run_executor_module.ExecutorFullError as err:
+                server_metrics.increment("lmc_runs_rejected_total", endpoint="/api/run")
+                return err.args[0], 503, {"Retry-After": "1"}
+            except (ValueError, OverflowError) as err:
+                return f"Error when trying to run: {err.args[0]}", 500
+            server_metrics.observe(
+                "lmc_run_cycles", len(results) if granularity == "trace" else results["cycles"],
+                endpoint="/api/run",
+            )
+            if cache_key is not None and computer.stop_reason != "time_limit":
+                result_cache.put(
+                    cache_key, {"stop_reason": computer.stop_reason, "results": results},
+                )
+        if in_session:
+            # send back only what changed over the whole run, instead of the state
+            if granularity == "trace":
+                results = {
+                    "stop_reason": computer.stop_reason,
+                    "cycles": len(results),
+                    "results": [
+                        {key: value for key, value in result.items()
+                         if key != "memory_and_registers"}
+                        for result in results
+                    ],
+                }
+                if computer.watchpoint is not None:
+                    results["watchpoint"] = computer.watchpoint
+            else:
+                del results["memory_and_registers"]
+            results["delta"] = computer_module.get_state_delta(
+                state_before, computer.memory_and_registers,
+            )
+            return jsonify(results)
+        if granularity != "trace":
+            # the summary already says why the run stopped
+            return jsonify(results)
+        if computer.stop_reason in ("HLT", "INP"):
+            return make_state_response(results)
+        stopped_run = {
+            "stop_reason": computer.stop_reason,
+            "cycles": len(results),
+            "results": results,
+        }
+        if computer.watchpoint is not None:
+            stopped_run["watchpoint"] = computer.watchpoint
+        return jsonify(stopped_run)
+    return "Expected JSON or binary request", 415
+
+
+@app.post("/api/profile")
+def post_profile():
+    """Handles the POST /api/profile endpoint. Receives user-written assembly code, compiles it and
+    runs it from the start until HLT or INP is reached, using inputs if they are sent, and counting
+    where it spends its cycles. Returns the profile mapped back to the lines of object code and
+    user-written code, with the outputs and the reason the run stopped."""
     if request.is_json:
         req_body = request.get_json()
+        if not isinstance(req_body.get("uncompiledCode"), str):
+            return "Could not find uncompiledCode", 400
         try:
-            computer = computer_module.Computer(req_body)
-            response = jsonify(computer.run())
+            max_cycles, time_limit = get_run_limits(req_body)
+            inputs = get_inputs(req_body)
         except ValueError as err:
+            return err.args[0], 400
+
+        try:
+            compiled_assembly = compile_assembly.compile_assembly_cached(req_body["uncompiledCode"])
+        except ValueError as error:
+            return jsonify({
+                "valid": False,
+                "reason": error.args[0],
+                "line_number": error.args[1] if len(error.args) > 1 else "unknown"
+            })
+
+        computer = computer_module.Computer(compiled_assembly["memory_and_registers"])
+        profile = profiler.Profile()
+        try:
+            result = computer.run(max_cycles, time_limit, detect_loops=True,
+                                  granularity="outputs", inputs=inputs, profile=profile)
+        except (ValueError, OverflowError) as err:
             return f"Error when trying to run: {err.args[0]}", 500
-        return response
+        server_metrics.observe("lmc_run_cycles", result["cycles"], endpoint="/api/profile")
+        return jsonify({
+            "valid": True,
+            "stop_reason": result["stop_reason"],
+            "cycles": result["cycles"],
+            "outputs": result["outputs"],
+            "profile": profiler.get_report(
+                profile, compiled_assembly,
+                compile_assembly.get_line_numbers(req_body["uncompiledCode"]),
+            ),
+        })
+    return "Expected JSON request", 415
+
+def generate_run_stream(computer, max_cycles, time_limit, batch_size, encode, state_before=None,
+                        inputs=(), breakpoints=None):
+    """Runs the computer and yields its results in batches, so that a client can start animating
+    before the whole run has finished. If the client disconnects, the WSGI server closes this
+    generator and no more cycles are run.
+
+    Parameters
+    ----------
+    computer : Computer
+        The LMC to run.
+    max_cycles : int
+        The maximum number of FDE cycles to run.
+    time_limit : float
+        The maximum number of seconds to spend running.
+    batch_size : int
+        How many FDE cycles to put in each message.
+    encode : Callable[[dict], str]
+        Turns one message into the text to send.
+    state_before : dict, optional
+        If given, the last message contains only what changed since this state, instead of the
+        final state.
+    inputs : list[str], optional
+        The values to give to INP instructions, as in `Computer.run`.
+    breakpoints : breakpoints.Breakpoints, optional
+        The breakpoints and watchpoints to stop at, as in `Computer.run`.
+
+    Yields
+    ------
+    str
+        Messages containing a batch of results, each without the full state of the LMC. The last
+        message contains the final state, the number of cycles run and the reason the run stopped.
+    """
+    batched_results = []
+    cycles = 0
+    try:
+        for result in computer.iter_run(max_cycles, time_limit, detect_loops=True, inputs=inputs,
+                                        include_state=False, breakpoints=breakpoints):
+            cycles += 1
+            batched_results.append(result)
+            if len(batched_results) == batch_size:
+                yield encode({"results": batched_results})
+                batched_results = []
+    except (ValueError, OverflowError) as err:
+        if batched_results:
+            yield encode({"results": batched_results})
+        yield encode({"error": f"Error when trying to run: {err.args[0]}", "cycles": cycles})
+        return
+    finally:
+        server_metrics.observe("lmc_run_cycles", cycles, endpoint="/api/run/stream")
+    if batched_results:
+        yield encode({"results": batched_results})
+    final_message = {
+        "stop_reason": computer.stop_reason,
+        "cycles": cycles,
+        "inputs_used": computer.inputs_used,
+    }
+    if computer.watchpoint is not None:
+        final_message["watchpoint"] = computer.watchpoint
+    if state_before is None:
+        final_message["memory_and_registers"] = computer.memory_and_registers
+    else:
+        final_message["delta"] = computer_module.get_state_delta(
+            state_before, computer.memory_and_registers,
+        )
+    yield encode(final_message)
+
+@app.post("/api/run/stream")
+def post_run_stream():
+    """Handles the POST /api/run/stream endpoint. Receives state of LMC and runs
+    fetch-decode-execute cycles until HLT or INP reached, sending transfers back in batches as they
+    are produced.
+    Sends server-sent events if the client accepts text/event-stream, otherwise newline-delimited
+    JSON. Programs that can be proven to never reach HLT or INP are stopped after as many cycles as
+    /api/run allows, unless max_cycles is sent. Breakpoints and watchpoints are sent as in
+    /api/run."""
+    if request.is_json:
+        req_body = request.get_json()
+        try:
+            max_cycles, time_limit = get_run_limits(
+                req_body, MAX_STREAM_CYCLES, MAX_STREAM_SECONDS,
+            )
+            inputs = get_inputs(req_body)
+        except ValueError as err:
+            return err.args[0], 400
+        batch_size = req_body.get("batch_size", DEFAULT_STREAM_BATCH_SIZE)
+        if not (isinstance(batch_size, int) and not isinstance(batch_size, bool)
+                and 0 < batch_size <= MAX_STREAM_BATCH_SIZE):
+            return f"batch_size must be an integer from 1 to {MAX_STREAM_BATCH_SIZE}", 400
+        try:
+            computer, in_session = get_computer(req_body)
+        except LookupError as err:
+            return err.args[0], 404
+        except ValueError as err:
+            return err.args[0], 400
+        try:
+            breakpoints = get_breakpoints(req_body, computer)
+        except ValueError as err:
+            return err.args[0], 400
+        if "max_cycles" not in req_body and program_analysis.never_stops(
+            computer.memory_and_registers
+        ):
+            max_cycles = MAX_NON_TERMINATING_STREAM_CYCLES
+        state_before = computer_module.copy_state(computer.memory_and_registers) \
+            if in_session else None
+
+        if request.accept_mimetypes.best_match(
+            ["application/x-ndjson", "text/event-stream"]
+        ) == "text/event-stream":
+            mimetype = "text/event-stream"
+            def encode(message):
+                return f"data: {json.dumps(message)}\n\n"
+        else:
+            mimetype = "application/x-ndjson"
+            def encode(message):
+                return json.dumps(message) + "\n"
+
+        # the request, and so the session, is only finished with once the stream ends
+        return Response(
+            stream_with_context(generate_run_stream(
+                computer, max_cycles, time_limit, batch_size, encode, state_before, inputs,
+                breakpoints,
+            )),
+            mimetype=mimetype,
+        )
+    return "Expected JSON request", 415
+
+@app.post("/api/batch")
+def post_batch():
+    """Handles the POST /api/batch endpoint. Receives a list of jobs, each with uncompiledCode and a
+    list of inputs, and compiles and runs every one until it halts, using the inputs in order for
+    INP instructions. Returns the outputs, cycle count and final state of each job, in order.
+    If engine is "lockstep", the jobs are run together with NumPy (see lockstep_engine.py), which is
+    faster for large batches but does not detect infinite loops. If engine is "shared", each
+    program is only run once for every job whose inputs start the same way, up to where they
+    differ. Jobs that have been run before are answered from the result cache, if there is one."""
+    if request.is_json:
+        req_body = request.get_json()
+        jobs = req_body.get("jobs")
+        if not isinstance(jobs, list):
+            return "Could not find jobs list", 400
+        if len(jobs) > MAX_BATCH_JOBS:
+            return f"Too many jobs, the maximum is {MAX_BATCH_JOBS}", 400
+        for job in jobs:
+            if not (isinstance(job, dict) and isinstance(job.get("uncompiledCode"), str)
+                    and isinstance(job.get("inputs", []), list)):
+                return "Each job needs uncompiledCode and optionally a list of inputs", 400
+        try:
+            max_cycles, time_limit = get_run_limits(
+                req_body, MAX_BATCH_JOB_CYCLES, MAX_BATCH_JOB_SECONDS,
+            )
+        except ValueError as err:
+            return err.args[0], 400
+        engine = req_body.get("engine", "blocks")
+        if engine not in ("blocks", "lockstep", "shared"):
+            return "engine must be blocks, lockstep or shared", 400
+        if engine == "lockstep" and not lockstep_engine.is_available():
+            return "The lockstep engine needs NumPy, which is not installed on the server", 400
+
+        jobs = [(job["uncompiledCode"], job.get("inputs", [])) for job in jobs]
+        if engine == "lockstep":
+            run_function = batch.run_batch_lockstep
+        elif engine == "shared":
+            run_function = batch.run_batch_shared
+        else:
+            executor = get_batch_process_pool() if len(jobs) >= PARALLEL_BATCH_THRESHOLD else None
+            run_function = functools.partial(batch.run_batch, executor=executor)
+        if result_cache is None:
+            results = run_function(jobs, max_cycles, time_limit)
+        else:
+            # the lockstep engine doesn't detect infinite loops, so its results can differ
+            results = batch.run_batch_cached(
+                jobs, run_function, result_cache, max_cycles, time_limit,
+                detect_loops=engine != "lockstep",
+            )
+        for result in results:
+            if result["valid"]:
+                server_metrics.observe("lmc_run_cycles", result["cycles"], endpoint="/api/batch")
+        return jsonify({"results": results})
     return "Expected JSON request", 415
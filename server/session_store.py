@@ -0,0 +1,125 @@
+"""This file contains a store for objects that the server keeps between requests from the same
+client, such as a program being edited. The store is bounded both in size and in how long an unused
+session is kept. It can be used from several threads at once, and each session has its own lock so
+that only one request uses a session's object at a time.
+Classes:
+    SessionStore"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class SessionStore:
+    """A `SessionStore` maps session ids to objects. When it is full, the least recently used
+    session is removed, and sessions that have not been used for `ttl` seconds expire."""
+    def __init__(self, max_size: int = 1000, ttl: float = 1800.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        # {<session id>: (<time last used>, <value>, <lock held while the value is in use>)},
+        # ordered from least to most recently used
+        self.__sessions = OrderedDict()
+        # held while the sessions are read or changed
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            self.__remove_expired()
+            return len(self.__sessions)
+
+    def __remove_expired(self):
+        """Remove every session that has not been used within the time to live."""
+        oldest_allowed = time.monotonic() - self.ttl
+        while self.__sessions:
+            session_id, (last_used, _, _) = next(iter(self.__sessions.items()))
+            if last_used >= oldest_allowed:
+                break
+            del self.__sessions[session_id]
+
+    def add(self, value):
+        """Store a value in a new session.
+
+        Parameters
+        ----------
+        value : Any
+            The object to keep between requests.
+
+        Returns
+        -------
+        str
+            The id of the new session.
+        """
+        session_id = uuid.uuid4().hex
+        with self.__lock:
+            self.__remove_expired()
+            self.__sessions[session_id] = (time.monotonic(), value, threading.Lock())
+            if len(self.__sessions) > self.max_size:
+                self.__sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str):
+        """Get the value stored in a session, marking the session as recently used.
+
+        Parameters
+        ----------
+        session_id : str
+            The id returned by `add`.
+
+        Returns
+        -------
+        Any
+            The stored value, or None if the session does not exist or has expired.
+        """
+        entry = self.__touch(session_id)
+        return None if entry is None else entry[1]
+
+    def __touch(self, session_id):
+        """Get the entry of a session, marking the session as recently used, or None if the session
+        does not exist or has expired."""
+        with self.__lock:
+            self.__remove_expired()
+            if session_id not in self.__sessions:
+                return None
+            _, value, lock = self.__sessions.pop(session_id)
+            self.__sessions[session_id] = (time.monotonic(), value, lock)
+            return self.__sessions[session_id]
+
+    @contextmanager
+    def use(self, session_id: str):
+        """Get the value stored in a session, as with `get`, and hold the session's lock until the
+        with block ends. Other requests using the same session wait until then, so they can't
+        change the value while it is being used.
+
+        Parameters
+        ----------
+        session_id : str
+            The id returned by `add`.
+
+        Yields
+        ------
+        Any
+            The stored value, or None if the session does not exist or has expired.
+        """
+        entry = self.__touch(session_id)
+        if entry is None:
+            yield None
+            return
+        with entry[2]:
+            # the value may have been replaced while waiting for the lock
+            with self.__lock:
+                value = self.__sessions.get(session_id, entry)[1]
+            yield value
+
+    def remove(self, session_id: str):
+        """Remove a session if it exists."""
+        with self.__lock:
+            self.__sessions.pop(session_id, None)
+
+    def replace(self, session_id: str, value):
+        """Replace the value stored in a session, if the session still exists. Used when the value
+        was changed in another process, so the stored object is out of date."""
+        with self.__lock:
+            if session_id in self.__sessions:
+                _, _, lock = self.__sessions[session_id]
+                self.__sessions[session_id] = (time.monotonic(), value, lock)
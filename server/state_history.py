@@ -0,0 +1,165 @@
+"""This file contains a history of the states a computer has been in, so that it can go back to the
+state after any recent cycle without running the program again from the start. Every
+`CHECKPOINT_INTERVAL` cycles a full copy of the state is kept, and for every cycle in between, only
+the registers before it and the one memory location it wrote to (if any) are kept, packed into one
+integer. To return to a cycle, the nearest later checkpoint is restored and the cycles after the
+target are undone, so no more than `CHECKPOINT_INTERVAL` cycles are ever undone.
+Classes:
+    StateHistory
+Functions:
+    pack_record(registers: tuple[int], address: int, old_value: int) -> int
+    unpack_record(record: int) -> tuple[tuple[int], int, int]"""
+
+from array import array
+from collections import deque
+
+# how many cycles to keep between checkpoints
+CHECKPOINT_INTERVAL = 100
+# how many cycles of history to keep at most. older cycles are forgotten a checkpoint at a time
+MAX_HISTORY_CYCLES = 10_000
+
+# the number of bits used for each register in a record, in the order of `State.get_registers`
+REGISTER_BITS = (7, 10, 4, 7, 10, 1)
+# a record's memory address is stored plus one, so that 0 means nothing was written
+ADDRESS_BITS = 7
+# how far the memory address and its value are shifted in a record
+MEMORY_SHIFT = sum(REGISTER_BITS)
+
+def pack_record(registers, address=-1, old_value=0):
+    """Pack what is needed to undo one cycle into one integer (56 bits).
+
+    Parameters
+    ----------
+    registers : tuple[int]
+        The registers before the cycle, in the order of `State.get_registers`.
+    address : int, optional
+        The memory location the cycle wrote to, or -1 if it did not write to memory.
+    old_value : int, optional
+        The value in that memory location before the cycle.
+
+    Returns
+    -------
+    int
+        The record.
+    """
+    pc, acc, ir, mar, mdr, carry = registers
+    # the same layout as REGISTER_BITS, written out as this is called every cycle
+    return ((((((old_value << ADDRESS_BITS | address + 1) << 7 | pc) << 10 | acc) << 4 | ir) << 7
+             | mar) << 10 | mdr) << 1 | carry
+
+def unpack_record(record: int):
+    """Unpack a record made by `pack_record`.
+
+    Returns
+    -------
+    tuple[tuple[int], int, int]
+        The registers, the memory address written to (-1 if none), and its value before.
+    """
+    registers = []
+    for bits in reversed(REGISTER_BITS):
+        registers.append(record & ((1 << bits) - 1))
+        record >>= bits
+    address = (record & ((1 << ADDRESS_BITS) - 1)) - 1
+    old_value = record >> ADDRESS_BITS
+    return tuple(reversed(registers)), address, old_value
+
+class StateHistory:
+    """A `StateHistory` records the state of a computer before each cycle it runs. Cycles are
+    counted from when the history was started. The history is split into segments, each starting
+    with a checkpoint and holding the records of up to `checkpoint_interval` cycles after it.
+    Checkpoints share their copy of memory with the one before when memory has not changed."""
+    def __init__(self, state, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                 max_cycles: int = MAX_HISTORY_CYCLES):
+        self.checkpoint_interval = checkpoint_interval
+        self.max_cycles = max_cycles
+        # the number of cycles run so far
+        self.cycle = 0
+        # [(<cycle>, <memory as bytes>, <registers>, <array of records>)], oldest first
+        self.__segments = deque()
+        self.__add_checkpoint(state, None)
+
+    @property
+    def first_cycle(self):
+        """The earliest cycle that can still be returned to."""
+        return self.__segments[0][0]
+
+    def __add_checkpoint(self, state, memory):
+        """Start a new segment from the current state. `memory` is the memory of the previous
+        checkpoint if it is unchanged, otherwise None."""
+        if memory is None:
+            memory = state.memory.tobytes()
+        self.__segments.append((self.cycle, memory, state.get_registers(), array("Q")))
+        if (len(self.__segments) - 1) * self.checkpoint_interval > self.max_cycles:
+            self.__segments.popleft()
+
+    def record(self, state):
+        """Record the state of a computer before it runs a cycle. This must be called before every
+        cycle the computer runs, or the history will be wrong."""
+        _, memory, _, records = self.__segments[-1]
+        if len(records) == self.checkpoint_interval:
+            # memory has only changed since the last checkpoint if a record wrote to it
+            memory_changed = any(record >> MEMORY_SHIFT for record in records)
+            self.__add_checkpoint(state, None if memory_changed else memory)
+            records = self.__segments[-1][3]
+
+        opcode, operand = divmod(state.memory[state.pc], 100)
+        if opcode == 3:
+            # STA is about to overwrite a memory location
+            records.append(pack_record(state.get_registers(), operand, state.memory[operand]))
+        else:
+            records.append(pack_record(state.get_registers()))
+        self.cycle += 1
+
+    def seek(self, state, cycle: int):
+        """Change a state back to how it was after a number of cycles, and forget every cycle after
+        that, as running again from there can take a different path (e.g. after a different input).
+
+        Parameters
+        ----------
+        state : computer.State
+            The current state, which is changed in place.
+        cycle : int
+            The number of cycles from the start of the history to go back to.
+
+        Raises
+        ------
+        ValueError
+            The cycle is in the future, or too long ago to still be kept.
+        """
+        if not self.first_cycle <= cycle <= self.cycle:
+            raise ValueError(f"Can only go back to cycles {self.first_cycle} to {self.cycle}")
+        if cycle == self.cycle:
+            return
+        index = (cycle - self.first_cycle) // self.checkpoint_interval
+        if index + 1 < len(self.__segments):
+            # undo from the next checkpoint, instead of from the current state
+            _, memory, registers, _ = self.__segments[index + 1]
+            state.memory = array("h", memory)
+            state.pc, state.acc, state.ir, state.mar, state.mdr, state.carry = registers
+            while len(self.__segments) > index + 1:
+                self.__segments.pop()
+
+        start_cycle, _, _, records = self.__segments[index]
+        for record in reversed(records[cycle - start_cycle:]):
+            registers, address, old_value = unpack_record(record)
+            state.pc, state.acc, state.ir, state.mar, state.mdr, state.carry = registers
+            if address != -1:
+                state.memory[address] = old_value
+        del records[cycle - start_cycle:]
+        # the string form of memory no longer matches
+        state.memory_strings = None
+        self.cycle = cycle
+
+    def clear(self, state, cycles: int = 0):
+        """Forget the history, after the state has been changed without recording each cycle.
+
+        Parameters
+        ----------
+        state : computer.State
+            The state to start the history again from.
+        cycles : int, optional
+            The number of cycles run since the last one recorded, to keep counting cycles from.
+        """
+        self.cycle += cycles
+        self.__segments.clear()
+        self.__add_checkpoint(state, None)
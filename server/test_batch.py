@@ -0,0 +1,109 @@
+"""Tests for batch.py"""
+
+import pytest
+from batch import (
+    run_batch, run_batch_cached, run_batch_lockstep, run_batch_parallel, run_batch_shared, run_job,
+)
+from result_cache import ResultCache
+from test_programs import ADD_INPUTS_PROGRAM
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    example_assembly_program = f.read()
+
+@pytest.mark.parametrize("input_value, expected_output", [
+    (5, "205"), ("799", "999"), (800, "002"), (900, "003"),
+])
+def test_run_job_example_program(input_value, expected_output):
+    result = run_job(example_assembly_program, [input_value])
+    assert result["outputs"] == [expected_output]
+    assert result["stop_reason"] == "HLT"
+    assert result["inputs_used"] == 1
+
+def test_run_job_uses_every_input():
+    result = run_job(ADD_INPUTS_PROGRAM, [1, 2, 3, 4, 0])
+    assert result["outputs"] == ["010"]
+    assert result["inputs_used"] == 5
+    assert result["memory_and_registers"]["memory"]["08"] == "010"
+
+def test_run_job_runs_out_of_inputs():
+    result = run_job(ADD_INPUTS_PROGRAM, [1, 2])
+    assert result["stop_reason"] == "INP"
+    assert result["inputs_used"] == 2
+
+def test_run_job_limits():
+    assert run_job("loop BRA loop", [])["stop_reason"] == "loop_detected"
+    result = run_job("loop LDA x\nADD one\nSTA x\nBRA loop\nx DAT\none DAT 1", [], max_cycles=100)
+    assert result["stop_reason"] == "cycle_limit"
+    assert result["cycles"] == 100
+
+def test_run_batch_keeps_order_and_reports_errors():
+    results = run_batch([
+        (example_assembly_program, [1]),
+        ("1nvalid HLT", []),
+        ("x DAT 5", []),
+    ])
+    assert results[0]["outputs"] == ["201"]
+    assert not results[1]["valid"]
+    assert results[1]["line_number"] == 1
+    assert results[2]["stop_reason"] == "error"
+
+def test_run_batch_parallel_matches_serial():
+    jobs = [(ADD_INPUTS_PROGRAM, list(range(1, count)) + [0]) for count in range(1, 30)]
+    jobs.append(("loop BRA loop", []))
+    assert run_batch_parallel(jobs, workers=2, chunk_size=4) == run_batch(jobs)
+
+def test_run_batch_lockstep_matches_run_batch():
+    pytest.importorskip("numpy")
+    jobs = [(ADD_INPUTS_PROGRAM, list(range(1, count)) + [0]) for count in range(1, 30)]
+    jobs += [
+        (example_assembly_program, [800]),
+        ("1nvalid HLT", []),
+        ("x DAT 5", []),
+        ("INP\nHLT", ["abc"]),
+        (ADD_INPUTS_PROGRAM, [1, 2]),
+    ]
+    assert run_batch_lockstep(jobs) == run_batch(jobs)
+
+def test_run_batch_shared_matches_run_batch():
+    jobs = [(ADD_INPUTS_PROGRAM, list(range(1, count)) + [0]) for count in range(1, 30)]
+    jobs += [(example_assembly_program, [input_value]) for input_value in (5, 799, 800, 5)]
+    jobs += [
+        ("1nvalid HLT", []),
+        ("INP\nHLT", ["abc"]),
+        (ADD_INPUTS_PROGRAM, [1, 2]),
+        # an infinite loop and an invalid instruction, each reached after one input but not another
+        ("INP\nBRZ loop\nHLT\nloop BRA loop", [0]),
+        ("INP\nBRZ loop\nHLT\nloop BRA loop", [1]),
+        ("INP\nBRZ bad\nHLT\nbad DAT 905", [0]),
+        ("INP\nBRZ bad\nHLT\nbad DAT 905", [1]),
+        # more inputs than the recursion limit
+        ("loop INP\nBRA loop", [1] * 2000),
+    ]
+    assert run_batch_shared(jobs) == run_batch(jobs)
+
+def test_run_batch_shared_limits():
+    jobs = [("loop LDA x\nADD one\nSTA x\nINP\nBRA loop\nx DAT\none DAT 1", [1] * count)
+            for count in (10, 30)]
+    results = run_batch_shared(jobs, max_cycles=100)
+    assert [result["stop_reason"] for result in results] == ["INP", "cycle_limit"]
+    assert results == run_batch(jobs, max_cycles=100)
+
+def test_run_batch_cached(tmp_path):
+    jobs = [(example_assembly_program, [5]), (example_assembly_program, ["005"]),
+            ("1nvalid HLT", []), ("INP\nHLT", ["abc"]), ("loop BRA loop", [])]
+    ran = []
+    def run_and_record(jobs, max_cycles, time_limit):
+        ran.extend(jobs)
+        return run_batch(jobs, max_cycles, time_limit)
+
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    assert run_batch_cached(jobs, run_and_record, cache) == run_batch(jobs)
+    assert len(ran) == 5
+    ran.clear()
+    # only the jobs that can't be cached are run again
+    assert run_batch_cached(jobs, run_and_record, cache) == run_batch(jobs)
+    assert ran == jobs[2:4]
+    # the cycle limit changes the results
+    run_batch_cached(jobs, run_and_record, cache, max_cycles=10)
+    assert len(ran) == 7
+    cache.close()
@@ -0,0 +1,34 @@
+"""Tests for benchmark.py"""
+
+import json
+from benchmark import compare_results, main, make_labelled_program
+from compile_assembly import compile_assembly
+
+def test_labelled_program_fills_memory():
+    compiled_assembly = compile_assembly(make_labelled_program())
+    assert len(compiled_assembly["object_code"]) == 100
+    assert compiled_assembly["object_code"][4] == "04 BRA 28"
+
+def test_compare_results():
+    baseline = {"results": {
+        "run": {"value": 100.0, "unit": "cycles/s", "higher_is_better": True},
+        "request": {"value": 0.5, "unit": "s", "higher_is_better": False},
+    }}
+    results = {"results": {
+        "run": {"value": 80.0, "unit": "cycles/s", "higher_is_better": True},
+        "request": {"value": 0.25, "unit": "s", "higher_is_better": False},
+        "new": {"value": 1.0, "unit": "s", "higher_is_better": False},
+    }}
+    comparison = compare_results(results, baseline, tolerance=0.1)
+    assert [(row["name"], row["speedup"], row["regression"]) for row in comparison] == [
+        ("run", 0.8, True),
+        ("request", 2.0, False),
+    ]
+
+def test_main_writes_results(tmp_path):
+    output = tmp_path / "results.json"
+    assert main(["--rounds", "1", "--only", "compile", "--output", str(output)]) == 0
+    with open(output, "r", encoding="utf-8") as results_file:
+        results = json.load(results_file)
+    assert list(results["results"]) == ["compile_100_lines"]
+    assert results["results"]["compile_100_lines"]["unit"] == "compiles/s"
@@ -0,0 +1,89 @@
+"""Tests for binary_trace.py"""
+
+import pytest
+from binary_trace import TraceReader, TraceWriter
+from compile_assembly import compile_assembly
+from computer import Computer
+from test_computer import COUNTING_FOREVER_PROGRAM
+from test_programs import ADD_INPUTS_PROGRAM
+
+@pytest.fixture(name="trace_path")
+def fixture_trace_path(tmp_path):
+    return str(tmp_path / "run.lmct")
+
+def get_expected_records(computer, max_cycles=None, inputs=()):
+    """Run every cycle with `Computer.iter_run`, and get the values each record of it should
+    hold."""
+    expected = []
+    pc = computer.state.pc
+    for _ in computer.iter_run(max_cycles, inputs=inputs, include_state=False):
+        state = computer.state
+        expected.append((pc, state.ir, state.mar, state.acc, state.carry,
+                         state.mar if state.ir == 3 else None))
+        pc = state.pc
+    return expected
+
+def test_records_match_every_cycle(trace_path):
+    state = compile_assembly(ADD_INPUTS_PROGRAM)["memory_and_registers"]
+    computer = Computer(state)
+    with TraceWriter(trace_path, index_interval=4) as trace:
+        computer.run(granularity="final", inputs=[5, 7], trace=trace)
+        assert computer.stop_reason == "INP"
+        # the next run continues the same trace
+        computer.finish_after_input("0")
+        computer.run(granularity="outputs", trace=trace)
+        assert computer.stop_reason == "HLT"
+
+    computer = Computer(state)
+    expected = get_expected_records(computer, inputs=[5, 7])
+    computer.finish_after_input("0")
+    expected += get_expected_records(computer)
+    with TraceReader(trace_path) as reader:
+        assert len(reader) == len(expected)
+        assert [tuple(record)[1:] for record in reader.records()] == expected
+        assert reader[3] == next(reader.records(3))
+        assert [record.cycle for record in reader.records(5, 8)] == [5, 6, 7]
+        with pytest.raises(IndexError):
+            reader[len(reader)]
+
+def test_filter_address_and_get_memory(trace_path):
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    with TraceWriter(trace_path, index_interval=16) as trace:
+        Computer(state).run(max_cycles=1000, granularity="final", trace=trace)
+
+    with TraceReader(trace_path) as reader:
+        records = list(reader.records())
+        for address in (0, 4, 50):
+            assert list(reader.filter_address(address, 100, 700)) == [
+                record for record in records[100:700]
+                if record.pc == address
+                or (record.operand == address and record.opcode in (1, 2, 3, 5, 6, 7, 8))
+            ]
+        for cycle in (0, 1, 15, 16, 17, 500, 1000):
+            memory = Computer(state).run_fast(max_cycles=cycle)["memory_and_registers"]["memory"]
+            assert reader.get_memory(cycle) == [
+                int(memory[f"{address:02}"]) for address in range(100)
+            ]
+
+def test_cycles_before_an_error_are_written(trace_path):
+    state = compile_assembly("LDA one\nOUT\nbad DAT 905\none DAT 1")["memory_and_registers"]
+    computer = Computer(state)
+    with TraceWriter(trace_path) as trace:
+        with pytest.raises(ValueError):
+            computer.run(granularity="final", trace=trace)
+    with TraceReader(trace_path) as reader:
+        assert [record.opcode for record in reader.records()] == [5, 9]
+
+def test_trace_needs_final_or_outputs(trace_path):
+    computer = Computer(compile_assembly("HLT")["memory_and_registers"])
+    with TraceWriter(trace_path) as trace:
+        with pytest.raises(ValueError):
+            computer.run(granularity="trace", trace=trace)
+
+def test_reader_rejects_other_files(trace_path):
+    with open(trace_path, "wb") as trace_file:
+        trace_file.write(bytes(300))
+    with open(trace_path + ".index", "wb"):
+        pass
+    with pytest.raises(ValueError):
+        TraceReader(trace_path)
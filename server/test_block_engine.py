@@ -0,0 +1,84 @@
+"""Tests for block_engine.py"""
+
+import copy
+import pytest
+from compile_assembly import compile_assembly
+from block_engine import compile_block, run_blocks
+from fast_engine import decode_state, run_fast
+from test_programs import COUNTDOWN_PROGRAM, MULTIPLY_PROGRAM
+
+# copies the instruction at "copy" over "target" the first time round, which changes the loop
+SELF_MODIFYING_PROGRAM = """
+loop LDA count
+ADD one
+STA count
+OUT
+target SUB limit
+BRZ done
+LDA copy
+STA target
+BRA loop
+done HLT
+count DAT 0
+one DAT 1
+limit DAT 5
+copy LDA count
+"""
+
+@pytest.mark.parametrize("program", [COUNTDOWN_PROGRAM, MULTIPLY_PROGRAM, SELF_MODIFYING_PROGRAM])
+def test_run_blocks_matches_run_fast(program):
+    state = compile_assembly(program)["memory_and_registers"]
+    assert run_blocks(copy.deepcopy(state)) == run_fast(copy.deepcopy(state))
+    # stopping part of the way through a block is still exact
+    for max_cycles in range(40):
+        assert run_blocks(state, max_cycles) == run_fast(state, max_cycles)
+
+def test_self_modifying_code_invalidates_block():
+    state = compile_assembly(SELF_MODIFYING_PROGRAM)["memory_and_registers"]
+    result = run_blocks(state, max_cycles=1000)
+    # once "SUB limit" is replaced, the count is never compared to the limit again, so the program
+    # only stops when the cycle limit is reached
+    assert result["stop_reason"] == "cycle_limit"
+    assert result["outputs"][:3] == ["001", "002", "003"]
+    assert result["memory_and_registers"]["memory"]["04"] == "510"
+
+def test_bra_joins_blocks():
+    memory, _ = decode_state(compile_assembly(COUNTDOWN_PROGRAM)["memory_and_registers"])
+    # "BRA loop" at 04 is joined onto the loop it branches to, which ends at "BRZ done"
+    block = compile_block(memory, 4)
+    assert block.cells == (4, 0, 1, 2, 3)
+    assert block.repeats
+
+def test_run_blocks_inputs_and_errors():
+    state = compile_assembly("INP\nOUT\nINP\nOUT\nHLT")["memory_and_registers"]
+    result = run_blocks(state, inputs=[7])
+    assert (result["outputs"], result["stop_reason"], result["inputs_used"]) == (["007"], "INP", 1)
+
+    with pytest.raises(ValueError):
+        run_blocks(compile_assembly("DAT 950")["memory_and_registers"])
+    state = compile_assembly("HLT")["memory_and_registers"]
+    # BRA 98, then LDA at 98 runs on past the end of memory
+    state["memory"]["00"] = "698"
+    state["memory"]["98"] = "500"
+    with pytest.raises(OverflowError):
+        run_blocks(state)
+
+def test_run_blocks_limits():
+    state = compile_assembly("loop BRA loop")["memory_and_registers"]
+    assert run_blocks(state, time_limit=0.05)["stop_reason"] == "time_limit"
+    assert run_blocks(state, detect_loops=True)["stop_reason"] == "loop_detected"
+    assert run_blocks(state, max_cycles=12345)["cycles"] == 12345
+
+def test_cycle_limit_reached_at_address_99():
+    state = compile_assembly("HLT")["memory_and_registers"]
+    for address, value in enumerate(["503", "205", "202", "303", "699"]):
+        state["memory"][f"{address:02}"] = value
+    # the 5th cycle branches to 99, so the limit is reached before anything is fetched from there
+    for max_cycles in range(6):
+        assert run_blocks(state, max_cycles) == run_fast(state, max_cycles)
+    with pytest.raises(OverflowError):
+        run_blocks(state, 6)
+
+    state["registers"]["PC"] = "99"
+    assert run_blocks(state, 0) == run_fast(state, 0)
+    assert run_blocks(state, 0)["stop_reason"] == "cycle_limit"
@@ -0,0 +1,101 @@
+"""Tests for breakpoints.py"""
+
+import pytest
+from breakpoints import Breakpoints, get_line_addresses
+from compile_assembly import compile_assembly, get_line_numbers
+from computer import Computer, copy_state
+from fast_engine import run_fast
+from test_programs import COUNTDOWN_TEMPLATE
+
+COUNTDOWN_PROGRAM = COUNTDOWN_TEMPLATE.format(count=5, step=1)
+COUNTDOWN_STATE = compile_assembly(COUNTDOWN_PROGRAM)["memory_and_registers"]
+
+def test_tables():
+    breakpoints = Breakpoints([3], [
+        {"register": "ACC", "condition": "<=", "value": 2},
+        {"register": "ACC", "condition": "==", "value": 1},
+        {"address": 8},
+        {"address": 9, "condition": ">", "value": 500},
+    ])
+    assert breakpoints.addresses[3] == 1 and sum(breakpoints.addresses) == 1
+    # the first watchpoint that matches is the one triggered
+    assert breakpoints.acc[:4] == [1, 1, 1, 0]
+    assert breakpoints.carry == [0, 0]
+    assert breakpoints.memory[8] == [3] * 1000
+    assert breakpoints.memory[9][500:502] == [0, 4]
+    assert breakpoints.memory[0] is None
+
+def test_get_watchpoint():
+    breakpoints = Breakpoints(watchpoints=[
+        {"register": "CARRY", "condition": "==", "value": 1},
+        {"address": 42},
+    ])
+    # SUB that sets the carry
+    assert breakpoints.get_watchpoint(2, 10, 999, 1) == 0
+    assert breakpoints.get_watchpoint(2, 10, 5, 0) is None
+    # STA to the watched location, and to another one
+    assert breakpoints.get_watchpoint(3, 42, 5, 0) == 1
+    assert breakpoints.get_watchpoint(3, 41, 5, 0) is None
+    # BRA does not write anything
+    assert breakpoints.get_watchpoint(6, 42, 5, 1) is None
+
+@pytest.mark.parametrize("addresses, watchpoints", [
+    ([100], []),
+    ([True], []),
+    ([], ["ACC"]),
+    ([], [{"register": "ACC"}]),
+    ([], [{"register": "PC", "condition": "==", "value": 1}]),
+    ([], [{"register": "ACC", "condition": "=", "value": 1}]),
+    ([], [{"register": "ACC", "condition": "==", "value": "1"}]),
+    ([], [{"address": -1}]),
+])
+def test_invalid_breakpoints(addresses, watchpoints):
+    with pytest.raises(ValueError):
+        Breakpoints(addresses, watchpoints)
+
+def test_get_line_addresses():
+    line_numbers = get_line_numbers(COUNTDOWN_PROGRAM)
+    assert get_line_addresses(line_numbers, [2, 7]) == [0, 5]
+    with pytest.raises(ValueError, match="Line 1 "):
+        get_line_addresses(line_numbers, [1])
+
+@pytest.mark.parametrize("addresses, watchpoints, stop_reason, cycles", [
+    # stops before the BRZ, the first time and then each time round the loop
+    ([3], [], "breakpoint", 3),
+    # stops after the ACC is first set to 2
+    ([], [{"register": "ACC", "condition": "==", "value": 2}], "watchpoint", 12),
+    # stops after the first STA to count
+    ([], [{"address": 8}], "watchpoint", 3),
+    ([], [{"address": 8, "condition": "<", "value": 3}], "watchpoint", 13),
+    # never triggered, so runs to the end
+    ([], [{"register": "CARRY", "condition": "==", "value": 1}], "HLT", 27),
+])
+def test_engines_stop_at_the_same_cycle(addresses, watchpoints, stop_reason, cycles):
+    breakpoints = Breakpoints(addresses, watchpoints)
+    fast_result = run_fast(copy_state(COUNTDOWN_STATE), breakpoints=breakpoints)
+    computer = Computer(copy_state(COUNTDOWN_STATE))
+    trace = computer.run(granularity="trace", breakpoints=breakpoints)
+
+    assert fast_result["stop_reason"] == computer.stop_reason == stop_reason
+    assert fast_result["cycles"] == len(trace) == cycles
+    assert fast_result["memory_and_registers"] == computer.memory_and_registers
+    if stop_reason == "watchpoint":
+        assert fast_result["watchpoint"] == computer.watchpoint == 0
+    else:
+        assert "watchpoint" not in fast_result and computer.watchpoint is None
+
+def test_running_again_continues_past_breakpoint():
+    computer = Computer(copy_state(COUNTDOWN_STATE))
+    breakpoints = Breakpoints([3])
+    summary = computer.run(granularity="final", breakpoints=breakpoints)
+    assert summary["stop_reason"] == "breakpoint"
+    assert summary["memory_and_registers"]["registers"]["PC"] == "03"
+    summary = computer.run(granularity="final", breakpoints=breakpoints)
+    assert summary["stop_reason"] == "breakpoint"
+    assert summary["cycles"] == 5
+    assert summary["memory_and_registers"]["memory"]["08"] == "003"
+
+def test_profile_with_breakpoints_is_rejected():
+    computer = Computer(copy_state(COUNTDOWN_STATE))
+    with pytest.raises(ValueError):
+        computer.run(granularity="final", profile=object(), breakpoints=Breakpoints([3]))
@@ -1,7 +1,7 @@
 """Tests for compile_assembly.py"""
 
 import pytest
-from compile_assembly import compile_assembly, check_assembly
+from compile_assembly import compile_assembly, check_assembly, CompileCache
 
 with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
     example_assembly_program = f.read()
@@ -158,3 +158,35 @@ def test_invalid_label():
     with pytest.raises(ValueError):
         compile_assembly(user_written_code)
     assert check_assembly(user_written_code) == False
+
+def test_compile_cache_hits_on_equivalent_code():
+    cache = CompileCache()
+    first_result = cache.compile(example_assembly_program)
+    # comments, case and spacing do not change the compiled program
+    edited_program = example_assembly_program.lower().replace("// else", "//   otherwise")
+    second_result = cache.compile(edited_program)
+    assert first_result == second_result == compile_assembly(example_assembly_program)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # results are copies, so running a program cannot change what is cached
+    second_result["memory_and_registers"]["memory"]["00"] = "000"
+    assert cache.compile(example_assembly_program) == first_result
+
+def test_compile_cache_caches_errors():
+    cache = CompileCache()
+    for _ in range(2):
+        with pytest.raises(ValueError) as error:
+            cache.compile("HLT\n1nvalidlabel HLT")
+        assert error.value.args[1] == 2
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_compile_cache_evicts_least_recently_used():
+    cache = CompileCache(max_size=2)
+    cache.compile("HLT")
+    cache.compile("OUT")
+    cache.compile("HLT")
+    cache.compile("INP") # evicts OUT
+    assert len(cache) == 2
+    cache.compile("HLT")
+    cache.compile("OUT")
+    assert (cache.hits, cache.misses) == (2, 4)
@@ -0,0 +1,128 @@
+"""Tests for computer.py"""
+
+import copy
+import pytest
+from compile_assembly import compile_assembly
+from computer import Computer, State, validate_input
+
+INFINITE_LOOP_PROGRAM = """
+LDA one
+loop ADD one
+SUB one
+BRA loop
+one DAT 1
+"""
+
+COUNTING_FOREVER_PROGRAM = """
+loop LDA count
+ADD one
+STA count
+BRA loop
+count DAT 0
+one DAT 1
+"""
+
+def test_run_stops_at_hlt():
+    computer = Computer(compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"])
+    results = computer.run()
+    assert computer.stop_reason == "HLT"
+    assert [result["output"] for result in results] == ["", "001", ""]
+
+def test_run_detects_infinite_loop():
+    state = compile_assembly(INFINITE_LOOP_PROGRAM)["memory_and_registers"]
+    computer = Computer(copy.deepcopy(state))
+    results = computer.run(max_cycles=1000, detect_loops=True)
+    assert computer.stop_reason == "loop_detected"
+    assert len(results) < 10
+
+    computer = Computer(copy.deepcopy(state))
+    results = computer.run(max_cycles=1000)
+    assert computer.stop_reason == "cycle_limit"
+    assert len(results) == 1000
+
+def test_run_does_not_report_loop_when_memory_changes():
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    computer = Computer(state)
+    computer.run(max_cycles=500, detect_loops=True)
+    assert computer.stop_reason == "cycle_limit"
+
+def test_run_time_limit():
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    computer = Computer(state)
+    computer.run(time_limit=0.01)
+    assert computer.stop_reason == "time_limit"
+
+def test_run_fast_limits_match_run():
+    for program in (INFINITE_LOOP_PROGRAM, COUNTING_FOREVER_PROGRAM):
+        state = compile_assembly(program)["memory_and_registers"]
+        slow_computer = Computer(copy.deepcopy(state))
+        results = slow_computer.run(max_cycles=500, detect_loops=True)
+        fast_computer = Computer(copy.deepcopy(state))
+        fast_result = fast_computer.run_fast(max_cycles=500, detect_loops=True)
+        assert fast_computer.stop_reason == slow_computer.stop_reason
+        assert fast_result["cycles"] == len(results)
+        assert fast_computer.memory_and_registers == slow_computer.memory_and_registers
+
+def test_run_granularities_reach_same_state():
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    trace_computer = Computer(copy.deepcopy(state))
+    trace = trace_computer.run(max_cycles=200)
+    for granularity in ("final", "outputs", "delta"):
+        computer = Computer(copy.deepcopy(state))
+        summary = computer.run(max_cycles=200, granularity=granularity)
+        assert summary["memory_and_registers"] == trace_computer.memory_and_registers
+        assert summary["cycles"] == len(trace)
+        assert summary["stop_reason"] == "cycle_limit"
+
+def test_run_delta_granularity():
+    state = compile_assembly("LDA one\nSTA two\nOUT\nHLT\none DAT 1\ntwo DAT 0")
+    computer = Computer(state["memory_and_registers"])
+    summary = computer.run(granularity="delta")
+    assert summary["outputs"] == ["001"]
+    assert summary["deltas"][1]["memory"] == {"05": "001"}
+    assert summary["deltas"][0]["registers"]["ACC"] == "001"
+    assert "ACC" not in summary["deltas"][1]["registers"]
+    assert summary["deltas"][2]["output"] == "001"
+
+def test_validate_input():
+    assert validate_input(7) == "7"
+    with pytest.raises(ValueError):
+        validate_input(1000)
+    with pytest.raises(ValueError):
+        validate_input("-1")
+
+def test_run_uses_inputs_inline():
+    state = compile_assembly("loop INP\nOUT\nBRZ done\nBRA loop\ndone HLT")["memory_and_registers"]
+    for granularity in ("outputs", "delta"):
+        computer = Computer(copy.deepcopy(state))
+        summary = computer.run(granularity=granularity, inputs=[3, "2", 1])
+        assert summary["outputs"] == ["003", "002", "001"]
+        assert summary["stop_reason"] == "INP"
+        assert summary["inputs_used"] == 3
+
+    computer = Computer(copy.deepcopy(state))
+    results = computer.run(inputs=["5", "0"])
+    assert computer.stop_reason == "HLT"
+    assert computer.inputs_used == 2
+    assert results[0]["input"] == "5"
+    assert not results[0]["reached_INP"]
+    assert results[0]["transfers"][-1] == {"end_reg": "ACC", "value": "005"}
+
+def test_state_round_trip():
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    state["registers"].update({"PC": "02", "ACC": "041", "IR": "1", "MAR": "05", "CARRY": "1"})
+    typed_state = State.from_dict(state)
+    assert (typed_state.pc, typed_state.acc, typed_state.memory[0]) == (2, 41, 504)
+    assert typed_state.to_dict() == state
+
+def test_step_results_keep_their_state():
+    computer = Computer(compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"])
+    results = computer.run(max_cycles=8)
+    # each result has the state from after its own cycle, not the final state
+    assert [result["memory_and_registers"]["registers"]["PC"] for result in results] \
+        == ["01", "02", "03", "00"] * 2
+    assert [result["memory_and_registers"]["memory"]["04"] for result in results] \
+        == ["000", "000", "001", "001", "001", "001", "002", "002"]
+    # memory is shared between results until it is written to
+    assert results[0]["memory_and_registers"]["memory"] \
+        is results[1]["memory_and_registers"]["memory"]
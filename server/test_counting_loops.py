@@ -0,0 +1,77 @@
+"""Tests for counting_loops.py"""
+
+import pytest
+from block_engine import run_blocks
+from breakpoints import Breakpoints
+from compile_assembly import compile_assembly
+from computer import copy_state
+from counting_loops import find_counting_loop
+from fast_engine import decode_state, run_fast
+from test_programs import COUNTDOWN_TEMPLATE, MULTIPLY_TEMPLATE
+
+def get_instructions(program, start, end):
+    """Get the instructions from start to end (inclusive) of a program, as engines find them."""
+    memory, _ = decode_state(compile_assembly(program)["memory_and_registers"])
+    return tuple(
+        (address, memory[address], *divmod(memory[address], 100))
+        for address in range(start, end + 1)
+    )
+
+def run_without_skipping(state, max_cycles=None, detect_loops=False):
+    """Run with the fast engine, which does not skip loops while watching for watchpoints."""
+    return run_fast(copy_state(state), max_cycles, None, detect_loops, breakpoints=Breakpoints())
+
+def test_find_counting_loop():
+    loop = find_counting_loop(get_instructions(MULTIPLY_TEMPLATE.format(a=3, b=4), 0, 7))
+    assert loop.length == 8
+    assert loop.groups == [(11, [(1, 12)]), (13, [(-1, 14)])]
+    # the same loop as the block engine finds it, starting at the BRA
+    instructions = get_instructions(MULTIPLY_TEMPLATE.format(a=3, b=4), 0, 7)
+    assert find_counting_loop(instructions[-1:] + instructions[:-1]).groups == loop.groups
+
+@pytest.mark.parametrize("program, end", [
+    # the BRZ is not last
+    ("loop LDA count\nBRZ done\nSUB one\nSTA count\nBRA loop\ndone HLT\ncount DAT 5\none DAT 1",
+     4),
+    # stores somewhere else
+    ("loop LDA count\nSUB one\nSTA other\nBRZ done\nBRA loop\ndone HLT\ncount DAT 5\n"
+     "one DAT 1\nother DAT", 4),
+    # subtracts a location the loop changes
+    ("loop LDA count\nSUB count\nSTA count\nBRZ done\nBRA loop\ndone HLT\ncount DAT 5", 4),
+    # outputs every iteration
+    ("loop LDA count\nSUB one\nSTA count\nOUT\nBRZ done\nBRA loop\ndone HLT\ncount DAT 5\n"
+     "one DAT 1", 5),
+    # changes its own code
+    ("loop LDA loop\nSUB one\nSTA loop\nBRZ done\nBRA loop\ndone HLT\none DAT 1", 4),
+])
+def test_find_counting_loop_rejects(program, end):
+    assert find_counting_loop(get_instructions(program, 0, end)) is None
+
+@pytest.mark.parametrize("program", [
+    COUNTDOWN_TEMPLATE.format(count=999, step=1),
+    COUNTDOWN_TEMPLATE.format(count=5, step=2), # wraps past 000
+    COUNTDOWN_TEMPLATE.format(count=7, step=998), # counts up
+    COUNTDOWN_TEMPLATE.format(count=0, step=1),
+    COUNTDOWN_TEMPLATE.format(count=5, step=10), # never reaches 000
+    COUNTDOWN_TEMPLATE.format(count=5, step=0),
+    MULTIPLY_TEMPLATE.format(a=37, b=40),
+    MULTIPLY_TEMPLATE.format(a=999, b=999),
+])
+@pytest.mark.parametrize("max_cycles", [100_000, 10_000, 1234, 3])
+@pytest.mark.parametrize("detect_loops", [False, True])
+def test_engines_match_running_every_cycle(program, max_cycles, detect_loops):
+    state = compile_assembly(program)["memory_and_registers"]
+    expected = run_without_skipping(state, max_cycles, detect_loops)
+    assert run_fast(copy_state(state), max_cycles, None, detect_loops) == expected
+    if expected["stop_reason"] != "loop_detected":
+        # the block engine can detect loops a few cycles later
+        assert run_blocks(copy_state(state), max_cycles, None, detect_loops) == expected
+
+def test_long_loop_is_skipped():
+    state = compile_assembly(COUNTDOWN_TEMPLATE.format(count=999, step=1))["memory_and_registers"]
+    result = run_fast(copy_state(state), max_cycles=4997)
+    assert result["stop_reason"] == "HLT"
+    assert result["cycles"] == 4997
+    assert result["outputs"] == ["000"]
+    # one cycle fewer is not enough to reach the HLT
+    assert run_fast(copy_state(state), max_cycles=4996)["stop_reason"] == "cycle_limit"
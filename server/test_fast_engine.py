@@ -0,0 +1,85 @@
+"""Tests for fast_engine.py"""
+
+import copy
+import pytest
+from compile_assembly import compile_assembly
+from computer import Computer
+from fast_engine import decode_state, run_fast
+from test_programs import COUNTDOWN_PROGRAM, MULTIPLY_PROGRAM
+
+def run_with_step(memory_and_registers):
+    """Run a program with `Computer.step` until HLT or INP, returning the final step result and
+    outputs."""
+    computer = Computer(memory_and_registers)
+    outputs = []
+    cycles = 0
+    while True:
+        result = computer.step()
+        cycles += 1
+        if result["output"]:
+            outputs.append(result["output"])
+        if result["reached_HLT"] or result["reached_INP"]:
+            return result, outputs, cycles
+
+@pytest.mark.parametrize("program", [COUNTDOWN_PROGRAM, MULTIPLY_PROGRAM])
+def test_run_fast_matches_step(program):
+    state = compile_assembly(program)["memory_and_registers"]
+    fast_result = run_fast(copy.deepcopy(state))
+    step_result, outputs, cycles = run_with_step(copy.deepcopy(state))
+
+    assert fast_result["memory_and_registers"] == step_result["memory_and_registers"]
+    assert fast_result["outputs"] == outputs
+    assert fast_result["cycles"] == cycles
+    assert fast_result["reached_HLT"]
+
+@pytest.mark.parametrize("input_value", ["0", "799", "800", "801", "999"])
+def test_run_fast_matches_step_after_input(input_value):
+    with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+        state = compile_assembly(f.read())["memory_and_registers"]
+
+    computer = Computer(state)
+    first_result = computer.run_fast()
+    assert first_result["reached_INP"]
+    computer.finish_after_input(input_value)
+    state = computer.memory_and_registers
+
+    fast_result = run_fast(copy.deepcopy(state))
+    step_result, outputs, _ = run_with_step(copy.deepcopy(state))
+    assert fast_result["memory_and_registers"] == step_result["memory_and_registers"]
+    assert fast_result["outputs"] == outputs
+
+def test_run_fast_does_not_modify_state():
+    state = compile_assembly(COUNTDOWN_PROGRAM)["memory_and_registers"]
+    original_state = copy.deepcopy(state)
+    run_fast(state)
+    assert state == original_state
+
+def test_run_fast_invalid_instruction():
+    state = compile_assembly("count DAT 5")["memory_and_registers"]
+    with pytest.raises(ValueError):
+        run_fast(state)
+
+def test_run_fast_pc_overflow():
+    state = compile_assembly("BRA end\nend DAT 400")["memory_and_registers"]
+    state["memory"]["01"] = "699" # jump to last memory location
+    with pytest.raises(OverflowError):
+        run_fast(state)
+
+@pytest.mark.parametrize("memory_value, registers", [
+    ("abc", {}), ("5000", {}), (-1, {}), (None, {}), ("500", {"PC": "150"}),
+    ("500", {"CARRY": "2"}), ("500", {"ACC": "xyz"}), ("500", {"MDR": True}),
+])
+def test_decode_state_rejects_invalid_values(memory_value, registers):
+    state = compile_assembly("HLT")["memory_and_registers"]
+    state = {
+        "memory": {**state["memory"], "05": memory_value},
+        "registers": {**state["registers"], **registers},
+    }
+    with pytest.raises(ValueError):
+        decode_state(state)
+
+def test_decode_state_accepts_short_values():
+    state = compile_assembly("HLT")["memory_and_registers"]
+    state = {"memory": {**state["memory"], "05": "5"}, "registers": state["registers"]}
+    memory, registers = decode_state(state)
+    assert memory[5] == 5 and registers["PC"] == 0
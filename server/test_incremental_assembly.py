@@ -0,0 +1,60 @@
+"""Tests for incremental_assembly.py"""
+
+import pytest
+from compile_assembly import compile_assembly
+from incremental_assembly import IncrementalAssembler
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    example_assembly_program = f.read()
+
+def compile_or_error(user_written_code):
+    """Return the result of compiling code, or the arguments of the error it raised."""
+    try:
+        return compile_assembly(user_written_code)
+    except ValueError as error:
+        return error.args
+
+def result_or_error(assembler):
+    """Return the result of an incremental assembler, or the arguments of the error it raised."""
+    try:
+        return assembler.result()
+    except ValueError as error:
+        return error.args
+
+def test_initial_result_matches_compile_assembly():
+    assembler = IncrementalAssembler(example_assembly_program)
+    assert assembler.result() == compile_assembly(example_assembly_program)
+
+@pytest.mark.parametrize("start, end, new_lines", [
+    (5, 6, ["INP // different comment"]), # no change to memory
+    (23, 24, ["three DAT 004"]), # change a value in place
+    (9, 9, ["OUT"]), # insert a line, moving everything after it
+    (11, 14, []), # delete lines
+    (23, 24, ["two DAT 002", "three DAT 003"]), # create a label twice, the last one is used
+    (21, 22, ["notthree DAT 003"]), # remove a label that is used
+    (8, 9, ["1nvalid HLT"]), # invalid line
+])
+def test_edit_matches_compile_assembly(start, end, new_lines):
+    assembler = IncrementalAssembler(example_assembly_program)
+    lines = example_assembly_program.split("\n")
+    assembler.replace_lines(start, end, new_lines)
+    lines[start:end] = new_lines
+    assert result_or_error(assembler) == compile_or_error("\n".join(lines))
+
+def test_edit_only_reports_changed_memory():
+    assembler = IncrementalAssembler(example_assembly_program)
+    assert assembler.replace_lines(5, 6, ["INP // different comment"]) == {}
+    assert assembler.replace_lines(23, 24, ["three DAT 004"]) == {"15": "004"}
+
+def test_fixing_an_error_restores_program():
+    assembler = IncrementalAssembler(example_assembly_program)
+    original_line = example_assembly_program.split("\n")[21]
+    assembler.replace_lines(21, 22, ["two DAT 1000"])
+    assert result_or_error(assembler)[1] == 22
+    assembler.replace_lines(21, 22, [original_line])
+    assert assembler.result() == compile_assembly(example_assembly_program)
+
+def test_replace_lines_outside_program():
+    assembler = IncrementalAssembler("HLT")
+    with pytest.raises(IndexError):
+        assembler.replace_lines(1, 3, ["OUT"])
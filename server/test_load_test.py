@@ -0,0 +1,17 @@
+"""Tests for load_test.py"""
+
+from load_test import percentile, run_load_test
+
+def test_percentile():
+    values = [float(value) for value in range(100, 0, -1)]
+    assert percentile(values, 0.5) == 51.0
+    assert percentile(values, 0.99) == 100.0
+    assert percentile([1.0], 0.99) == 1.0
+
+def test_run_load_test():
+    results = run_load_test(duration=0.4, heavy_clients=1, workers=1)
+    assert set(results) == {"idle", "loaded"}
+    for phase in results.values():
+        assert phase["/api/check"]["requests"] > 0
+        assert phase["/api/check"]["p50"] <= phase["/api/check"]["p99"]
+    assert results["loaded"]["heavy_runs_refused"] == 0
@@ -0,0 +1,55 @@
+"""Tests for lockstep_engine.py"""
+
+import pytest
+from compile_assembly import compile_assembly
+from computer import copy_state
+from fast_engine import run_fast
+import lockstep_engine
+from test_programs import ADD_INPUTS_PROGRAM, MULTIPLY_PROGRAM
+
+pytest.importorskip("numpy")
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    example_assembly_program = f.read()
+
+def compile_state(program):
+    return compile_assembly(program)["memory_and_registers"]
+
+def test_matches_run_fast():
+    # different programs, stopping at different cycles, at HLT and at INP
+    machines = [(compile_state(example_assembly_program), [value]) for value in range(0, 1000, 37)]
+    machines += [(compile_state(ADD_INPUTS_PROGRAM), list(range(1, count)) + [0])
+                 for count in range(1, 20)]
+    machines.append((compile_state(ADD_INPUTS_PROGRAM), [999, 5]))
+    machines.append((compile_state(MULTIPLY_PROGRAM), []))
+    results = lockstep_engine.run_lockstep(
+        [state for state, _ in machines], [inputs for _, inputs in machines],
+    )
+    for (state, inputs), result in zip(machines, results):
+        assert result == run_fast(copy_state(state), inputs=inputs)
+
+def test_limits():
+    states = [compile_state("loop BRA loop"), compile_state(MULTIPLY_PROGRAM)]
+    results = lockstep_engine.run_lockstep(states, max_cycles=100)
+    assert [result["stop_reason"] for result in results] == ["cycle_limit", "cycle_limit"]
+    assert results[1] == run_fast(copy_state(states[1]), max_cycles=100)
+    results = lockstep_engine.run_lockstep(states[:1], time_limit=0.01)
+    assert results[0]["stop_reason"] == "time_limit"
+
+def test_errors_keep_starting_state():
+    states = [
+        compile_state("BRA bad\nHLT\nbad DAT 905"),
+        compile_state("BRA last\n" + "HLT\n" * 98 + "last DAT 100"),
+        compile_state("HLT"),
+    ]
+    results = lockstep_engine.run_lockstep(states)
+    assert results[0]["error"] == "Invalid instruction beginning in 0 or 9"
+    assert results[1]["error"] == "Can't increment PC to a value above 99."
+    for state, result in zip(states, results[:2]):
+        assert result["stop_reason"] == "error"
+        assert result["memory_and_registers"] == state
+        assert result["cycles"] == 0
+    assert results[2]["stop_reason"] == "HLT"
+
+def test_no_machines():
+    assert not lockstep_engine.run_lockstep([])
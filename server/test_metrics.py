@@ -0,0 +1,35 @@
+"""Tests for metrics.py"""
+
+from metrics import Histogram, MetricsRegistry, format_labels
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.render("cycles", {"endpoint": "/api/run"}) == [
+        'cycles_bucket{endpoint="/api/run",le="1"} 2',
+        'cycles_bucket{endpoint="/api/run",le="10"} 3',
+        'cycles_bucket{endpoint="/api/run",le="+Inf"} 4',
+        'cycles_sum{endpoint="/api/run"} 56.5',
+        'cycles_count{endpoint="/api/run"} 4',
+    ]
+
+def test_registry_render():
+    registry = MetricsRegistry()
+    registry.define_counter("requests_total", "Number of requests.")
+    registry.define_gauge("ratio", "A ratio.")
+    registry.increment("requests_total", status="200")
+    registry.increment("requests_total", status="200")
+    registry.set("ratio", 0.5)
+    assert registry.get("requests_total", status="200") == 2
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Number of requests.",
+        "# TYPE requests_total counter",
+        'requests_total{status="200"} 2',
+        "# HELP ratio A ratio.",
+        "# TYPE ratio gauge",
+        "ratio 0.5",
+    ]) + "\n"
+
+def test_labels_are_escaped():
+    assert format_labels({"path": 'a"b\\c'}) == '{path="a\\"b\\\\c"}'
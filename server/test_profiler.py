@@ -0,0 +1,61 @@
+"""Tests for profiler.py"""
+
+import pytest
+from compile_assembly import compile_assembly, get_line_numbers
+from computer import Computer
+from fast_engine import run_fast
+from profiler import Profile, get_report, run_profiled
+from test_programs import MULTIPLY_PROGRAM
+
+def test_run_profiled_matches_run_fast():
+    state = compile_assembly(MULTIPLY_PROGRAM)["memory_and_registers"]
+    profile = Profile()
+    assert run_profiled(state, profile) == run_fast(state)
+    assert profile.cycles == run_fast(state)["cycles"]
+
+def test_profile_counts():
+    state = compile_assembly(MULTIPLY_PROGRAM)["memory_and_registers"]
+    profile = Profile()
+    run_profiled(state, profile)
+    # the loop body (00-06) runs once for each of the 40 times "a" is added
+    assert list(profile.executions[:8]) == [40] * 7 + [39]
+    assert (profile.branches_taken[6], profile.branches_not_taken[6]) == (1, 39)
+    assert profile.instructions[1] == 40 # ADD
+    assert list(profile.instructions[9:]) == [0, 1] # INP, OUT
+    # "total" is read by LDA every time round and once at the end, and written by STA
+    assert (profile.reads[11], profile.writes[11]) == (41, 40)
+
+def test_computer_run_with_profile():
+    computer = Computer(compile_assembly("INP\nOUT\nINP\nOUT\nHLT")["memory_and_registers"])
+    profile = Profile()
+    computer.run(granularity="outputs", inputs=[1], profile=profile)
+    # running again after the INP adds to the same counts
+    computer.finish_after_input("2")
+    computer.run(granularity="final", profile=profile)
+    assert list(profile.executions[:5]) == [1] * 5
+    with pytest.raises(ValueError):
+        computer.run(profile=profile)
+
+def test_report_maps_to_source_lines():
+    code = "// multiply\n" + MULTIPLY_PROGRAM
+    compiled_assembly = compile_assembly(code)
+    line_numbers = get_line_numbers(code)
+    assert line_numbers[:2] == [3, 4]
+
+    profile = Profile()
+    run_profiled(compiled_assembly["memory_and_registers"], profile)
+    report = get_report(profile, compiled_assembly, line_numbers)
+    assert report["lines"][1] == {
+        "address": "01",
+        "object_code": "01 ADD 12",
+        "line_number": 4,
+        "executions": 40,
+        "reads": 0,
+        "writes": 0,
+        "branches_taken": 0,
+        "branches_not_taken": 0,
+    }
+    assert report["instructions"]["BRZ"] == 40
+    assert report["hot_spots"][0] == "00"
+    assert report["loops"][0]["addresses"] == [str(i).zfill(2) for i in range(8)]
+    assert report["loops"][0]["cycles"] == 40 * 7 + 39
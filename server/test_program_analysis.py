@@ -0,0 +1,49 @@
+"""Tests for program_analysis.py"""
+
+from compile_assembly import compile_assembly
+from program_analysis import never_stops
+from test_computer import COUNTING_FOREVER_PROGRAM, INFINITE_LOOP_PROGRAM
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    example_assembly_program = f.read()
+
+def test_analyse_example_program():
+    analysis = compile_assembly(example_assembly_program, analyse=True)["analysis"]
+    # every instruction can run, and the data is not part of the graph
+    assert analysis["unreachable"] == []
+    assert list(analysis["graph"]) == [str(i).zfill(2) for i in range(12)]
+    assert analysis["graph"]["03"] == ["06", "04"]
+    assert analysis["graph"]["11"] == []
+    assert not analysis["never_stops"]
+
+def test_analyse_loops():
+    analysis = compile_assembly(INFINITE_LOOP_PROGRAM, analyse=True)["analysis"]
+    assert analysis["stateless_loops"] == [["01", "02", "03"]]
+    assert analysis["never_stops"]
+
+    analysis = compile_assembly("loop BRA loop\nHLT", analyse=True)["analysis"]
+    assert analysis["self_loops"] == ["00"]
+    assert analysis["stateless_loops"] == []
+    assert analysis["unreachable"] == ["01"]
+    assert analysis["never_stops"]
+
+    # the loop writes to memory it reads, so it is not stateless, but it still never stops
+    analysis = compile_assembly(COUNTING_FOREVER_PROGRAM, analyse=True)["analysis"]
+    assert analysis["stateless_loops"] == []
+    assert analysis["never_stops"]
+
+def test_modified_code_might_stop():
+    # the STA overwrites the BRA with a HLT (the ACC holds 000)
+    analysis = compile_assembly("STA loop\nloop BRA loop", analyse=True)["analysis"]
+    assert analysis["modified_code"] == ["01"]
+    assert not analysis["never_stops"]
+
+def test_never_stops_from_pc():
+    state = compile_assembly("INP\nloop BRA loop")["memory_and_registers"]
+    assert not never_stops(state)
+    # once past the INP, the program can never stop
+    state["registers"]["PC"] = "01"
+    assert never_stops(state)
+
+def test_compile_default_has_no_analysis():
+    assert "analysis" not in compile_assembly(example_assembly_program)
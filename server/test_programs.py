@@ -0,0 +1,49 @@
+"""Programs shared by the tests and benchmark.py"""
+
+# counts down from count in steps of step, then outputs what is left
+COUNTDOWN_TEMPLATE = """
+loop LDA count
+SUB step
+STA count
+BRZ done
+BRA loop
+done LDA count
+OUT
+HLT
+count DAT {count}
+step DAT {step}
+"""
+COUNTDOWN_PROGRAM = COUNTDOWN_TEMPLATE.format(count=250, step=1)
+
+# outputs a * b, found by adding a to a total b times
+MULTIPLY_TEMPLATE = """
+loop LDA total
+ADD a
+STA total
+LDA b
+SUB one
+STA b
+BRZ done
+BRA loop
+done LDA total
+OUT
+HLT
+total DAT 0
+a DAT {a}
+b DAT {b}
+one DAT 1
+"""
+MULTIPLY_PROGRAM = MULTIPLY_TEMPLATE.format(a=37, b=40)
+
+# outputs the sum of its inputs, once it is given 0
+ADD_INPUTS_PROGRAM = """
+loop INP
+BRZ done
+ADD total
+STA total
+BRA loop
+done LDA total
+OUT
+HLT
+total DAT 0
+"""
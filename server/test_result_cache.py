@@ -0,0 +1,61 @@
+"""Tests for result_cache.py"""
+
+import os
+import pytest
+from compile_assembly import compile_assembly
+from result_cache import ResultCache, get_key
+
+@pytest.fixture(name="cache_path")
+def fixture_cache_path(tmp_path):
+    return str(tmp_path / "results.sqlite3")
+
+def test_get_key():
+    state = compile_assembly("INP\nOUT\nHLT")["memory_and_registers"]
+    key = get_key(state, [5], max_cycles=100)
+    assert get_key(state, ["005"], max_cycles=100) == key
+    assert get_key(state, [6], max_cycles=100) != key
+    assert get_key(state, [5], max_cycles=101) != key
+    assert get_key(compile_assembly("INP\nHLT")["memory_and_registers"], [5], max_cycles=100) != key
+    with pytest.raises(ValueError):
+        get_key(state, ["abc"])
+
+def test_results_survive_reopening(cache_path):
+    cache = ResultCache(cache_path)
+    assert cache.get("key") is None
+    cache.put("key", {"outputs": ["005"], "cycles": 3})
+    assert cache.get("key") == {"outputs": ["005"], "cycles": 3}
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    cache = ResultCache(cache_path)
+    assert len(cache) == 1
+    assert cache.get("key") == {"outputs": ["005"], "cycles": 3}
+    cache.clear()
+    assert cache.get("key") is None
+    cache.close()
+
+def test_least_recently_used_results_are_evicted(cache_path):
+    cache = ResultCache(cache_path, max_bytes=20_000)
+    # hex digits of random bytes compress to a little over half their length
+    values = [os.urandom(500).hex() for _ in range(40)]
+    for index, value in enumerate(values[:20]):
+        cache.put(str(index), value)
+    assert cache.get("0") == values[0]
+    for index, value in enumerate(values[20:], 20):
+        cache.put(str(index), value)
+    assert cache.size <= cache.max_bytes
+    # the results kept are the ones used most recently
+    order = [str(index) for index in range(1, 40)]
+    order.insert(19, "0")
+    kept = [cache.get(key) is not None for key in order]
+    assert not kept[0] and kept[-1]
+    assert kept == sorted(kept)
+    cache.close()
+
+def test_large_results_are_not_stored(cache_path):
+    cache = ResultCache(cache_path, max_bytes=1600)
+    cache.put("small", "abc")
+    cache.put("large", [str(index) for index in range(1000)])
+    assert cache.get("small") == "abc"
+    assert cache.get("large") is None
+    cache.close()
@@ -0,0 +1,37 @@
+"""Tests for run_executor.py"""
+
+import time
+import pytest
+from compile_assembly import compile_assembly
+from computer import Computer
+from run_executor import ExecutorFullError, RunExecutor, run_computer
+
+@pytest.fixture(name="executor")
+def fixture_executor():
+    executor = RunExecutor(1, max_pending=1)
+    yield executor
+    executor.shutdown()
+
+def test_run_computer(executor):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    computer, summary = executor.run(run_computer, Computer(state), {"granularity": "outputs"})
+    assert summary["outputs"] == ["001"]
+    assert computer.stop_reason == "HLT"
+    assert computer.memory_and_registers == summary["memory_and_registers"]
+
+def test_errors_are_raised_again(executor):
+    state = compile_assembly("BRA bad\nHLT\nbad DAT 905")["memory_and_registers"]
+    with pytest.raises(ValueError):
+        executor.run(run_computer, Computer(state), {})
+    assert executor.pending == 0
+
+def test_admission_control(executor):
+    future = executor.submit(time.sleep, 0.5)
+    assert executor.pending == 1
+    with pytest.raises(ExecutorFullError):
+        executor.submit(time.sleep, 0)
+    future.result()
+    # the callback that frees the slot may run just after the result is set
+    time.sleep(0.05)
+    assert executor.pending == 0
+    executor.run(time.sleep, 0)
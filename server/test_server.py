@@ -0,0 +1,419 @@
+"""Tests for server.py"""
+
+import json
+import threading
+import time
+import pytest
+from compile_assembly import compile_assembly
+import lockstep_engine
+import wire_format
+import server
+from server import app
+from result_cache import ResultCache
+from run_executor import RunExecutor
+from test_computer import COUNTING_FOREVER_PROGRAM
+
+@pytest.fixture(name="client")
+def fixture_client():
+    return app.test_client()
+
+def test_run_until_hlt(client):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    response = client.post("/api/run", json=state)
+    assert response.status_code == 200
+    results = response.get_json()
+    assert isinstance(results, list)
+    assert results[-1]["reached_HLT"]
+
+@pytest.mark.parametrize("granularity", ["final", "trace"])
+def test_run_reports_pc_overflow(client, granularity):
+    state = compile_assembly("HLT")["memory_and_registers"]
+    state["memory"] = {**state["memory"], "00": "699", "99": "500"}
+    response = client.post("/api/run", json={**state, "max_cycles": 10, "granularity": granularity})
+    assert response.status_code == 500
+    assert "above 99" in response.get_data(as_text=True)
+
+    response = client.post("/api/run/stream", json={**state, "max_cycles": 10})
+    assert response.status_code == 200
+    assert "above 99" in json.loads(response.get_data(as_text=True).splitlines()[-1])["error"]
+
+    state["registers"] = {**state["registers"], "PC": "99"}
+    assert client.post("/api/step", json=state).status_code == 500
+
+def test_run_reports_loop_detected(client):
+    state = compile_assembly("loop BRA loop")["memory_and_registers"]
+    # asking for a cycle limit runs the program even though it can never stop
+    response = client.post("/api/run", json={**state, "max_cycles": 100})
+    assert response.status_code == 200
+    assert response.get_json()["stop_reason"] == "loop_detected"
+
+def test_run_refuses_program_that_never_stops(client):
+    state = compile_assembly("loop BRA loop")["memory_and_registers"]
+    response = client.post("/api/run", json=state)
+    assert response.status_code == 400
+
+def test_stream_caps_program_that_never_stops(client):
+    state = compile_assembly(
+        "loop LDA count\nADD one\nSTA count\nBRA loop\ncount DAT 0\none DAT 1"
+    )["memory_and_registers"]
+    response = client.post("/api/run/stream", json=state)
+    final_message = json.loads(response.get_data(as_text=True).splitlines()[-1])
+    assert final_message["stop_reason"] == "cycle_limit"
+    assert final_message["cycles"] == 10_000
+
+def test_compile_with_analysis(client):
+    response = client.post("/api/compile", json={
+        "uncompiledCode": "HLT\nloop BRA loop", "analyse": True,
+    })
+    analysis = response.get_json()["result"]["analysis"]
+    assert analysis["unreachable"] == ["01"]
+    assert not analysis["never_stops"]
+
+def test_run_reports_cycle_limit(client):
+    state = compile_assembly(
+        "loop LDA count\nADD one\nSTA count\nBRA loop\ncount DAT 0\none DAT 1"
+    )["memory_and_registers"]
+    response = client.post("/api/run", json={**state, "max_cycles": 50})
+    body = response.get_json()
+    assert body["stop_reason"] == "cycle_limit"
+    assert body["cycles"] == 50
+
+def test_run_rejects_invalid_limit(client):
+    state = compile_assembly("HLT")["memory_and_registers"]
+    response = client.post("/api/run", json={**state, "max_cycles": -1})
+    assert response.status_code == 400
+
+def test_run_final_granularity(client):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    response = client.post("/api/run", json={**state, "granularity": "outputs"})
+    body = response.get_json()
+    assert body["stop_reason"] == "HLT"
+    assert body["outputs"] == ["001"]
+    assert body["cycles"] == 3
+
+    response = client.post("/api/run", json={**state, "granularity": "everything"})
+    assert response.status_code == 400
+
+def test_run_stream_ndjson(client):
+    state = compile_assembly(
+        "loop LDA count\nSUB one\nSTA count\nBRZ done\nBRA loop\n"
+        "done OUT\nHLT\ncount DAT 10\none DAT 1"
+    )["memory_and_registers"]
+    response = client.post("/api/run/stream", json={**state, "batch_size": 8})
+    assert response.mimetype == "application/x-ndjson"
+    messages = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    batches = [message["results"] for message in messages[:-1]]
+    assert all(len(batch) == 8 for batch in batches[:-1])
+    assert sum(len(batch) for batch in batches) == messages[-1]["cycles"] == 51
+    assert batches[-1][-1]["reached_HLT"]
+    assert messages[-1]["stop_reason"] == "HLT"
+    assert "memory_and_registers" not in batches[0][0]
+
+def test_run_stream_server_sent_events(client):
+    state = compile_assembly("loop BRA loop")["memory_and_registers"]
+    response = client.post("/api/run/stream", json=state, headers={"Accept": "text/event-stream"})
+    assert response.mimetype == "text/event-stream"
+    events = response.get_data(as_text=True).strip().split("\n\n")
+    assert all(event.startswith("data: ") for event in events)
+    assert json.loads(events[-1][len("data: "):])["stop_reason"] == "loop_detected"
+
+def test_check_edit_session(client):
+    response = client.post("/api/check-edit", json={"uncompiledCode": "LDA one\nHLT\none DAT 1"})
+    body = response.get_json()
+    assert body["valid"]
+
+    response = client.post("/api/check-edit", json={
+        "session_id": body["session_id"], "start": 2, "end": 3, "lines": ["one DAT 5"],
+    })
+    body = response.get_json()
+    assert body["valid"]
+    assert body["changed_memory"] == {"02": "005"}
+
+    response = client.post("/api/check-edit", json={
+        "session_id": body["session_id"], "start": 2, "end": 3, "lines": ["two DAT 5"],
+    })
+    assert not response.get_json()["valid"]
+
+    response = client.post("/api/check-edit", json={
+        "session_id": "unknown", "start": 0, "end": 0, "lines": [],
+    })
+    assert response.status_code == 404
+
+def test_batch(client):
+    response = client.post("/api/batch", json={"jobs": [
+        {"uncompiledCode": "INP\nOUT\nHLT", "inputs": [42]},
+        {"uncompiledCode": "loop BRA loop"},
+    ]})
+    results = response.get_json()["results"]
+    assert results[0]["outputs"] == ["042"]
+    assert results[1]["stop_reason"] == "loop_detected"
+
+    response = client.post("/api/batch", json={"jobs": [{"inputs": []}]})
+    assert response.status_code == 400
+
+def test_batch_in_parallel(client):
+    jobs = [{"uncompiledCode": "INP\nOUT\nHLT", "inputs": [number]} for number in range(40)]
+    response = client.post("/api/batch", json={"jobs": jobs})
+    results = response.get_json()["results"]
+    assert [result["outputs"] for result in results] == [
+        [str(number).zfill(3)] for number in range(40)
+    ]
+
+def test_batch_shared(client):
+    jobs = [{"uncompiledCode": "INP\nSTA x\nINP\nADD x\nOUT\nHLT\nx DAT", "inputs": inputs}
+            for inputs in ([1, 2], [1, 3], [2], [1, 2])]
+    response = client.post("/api/batch", json={"jobs": jobs, "engine": "shared"})
+    results = response.get_json()["results"]
+    assert [result["outputs"] for result in results] == [["003"], ["004"], [], ["003"]]
+    assert results[2]["stop_reason"] == "INP"
+
+def test_batch_lockstep(client):
+    jobs = [{"uncompiledCode": "INP\nOUT\nHLT", "inputs": [number]} for number in range(3)]
+    response = client.post("/api/batch", json={"jobs": jobs, "engine": "lockstep"})
+    if lockstep_engine.is_available():
+        results = response.get_json()["results"]
+        assert [result["outputs"] for result in results] == [["000"], ["001"], ["002"]]
+    else:
+        assert response.status_code == 400
+    response = client.post("/api/batch", json={"jobs": jobs, "engine": "numpy"})
+    assert response.status_code == 400
+
+def test_execution_session(client):
+    response = client.post("/api/compile", json={
+        "uncompiledCode": "INP\nSTA x\nLDA x\nOUT\nHLT\nx DAT", "session": True,
+    })
+    session = {"session_id": response.get_json()["session_id"]}
+
+    body = client.post("/api/step", json=session).get_json()
+    assert body["reached_INP"]
+    assert body["delta"] == {"memory": {}, "registers": {
+        "PC": "01", "IR": "9", "MAR": "01", "MDR": "901",
+    }}
+    assert "memory_and_registers" not in body
+
+    client.post("/api/after-input", json={**session, "input": "7"})
+    body = client.post("/api/run", json={**session, "granularity": "outputs"}).get_json()
+    assert body["outputs"] == ["007"]
+    assert body["stop_reason"] == "HLT"
+    assert body["delta"]["memory"] == {"05": "007"}
+    assert "memory_and_registers" not in body
+
+    response = client.post("/api/run", json={"session_id": "unknown"})
+    assert response.status_code == 404
+
+def test_seek_in_session(client):
+    response = client.post("/api/compile", json={
+        "uncompiledCode": COUNTING_FOREVER_PROGRAM, "session": True,
+    })
+    session = {"session_id": response.get_json()["session_id"]}
+    client.post("/api/run", json={**session, "max_cycles": 250, "granularity": "final"})
+
+    body = client.post("/api/seek", json={**session, "back": 4}).get_json()
+    assert body["cycle"] == 246
+    assert body["first_cycle"] == 0
+    assert body["delta"]["memory"] == {"04": "061"}
+
+    body = client.post("/api/seek", json={**session, "cycle": 2}).get_json()
+    assert body["cycle"] == 2
+    assert body["delta"]["registers"]["ACC"] == "001"
+    assert body["delta"]["memory"] == {"04": "000"}
+
+    assert client.post("/api/seek", json={**session, "cycle": 3}).status_code == 400
+    assert client.post("/api/seek", json={**session, "back": "1"}).status_code == 400
+    assert client.post("/api/seek", json={"cycle": 0}).status_code == 400
+
+def test_run_with_breakpoints(client):
+    response = client.post("/api/compile", json={
+        "uncompiledCode": COUNTING_FOREVER_PROGRAM, "session": True,
+    })
+    session = {"session_id": response.get_json()["session_id"], "max_cycles": 1000}
+    body = client.post("/api/run", json={
+        **session, "granularity": "final",
+        "watchpoints": [{"address": 4, "condition": ">=", "value": 3}],
+    }).get_json()
+    assert body["stop_reason"] == "watchpoint"
+    assert body["watchpoint"] == 0
+    assert body["delta"]["memory"] == {"04": "003"}
+
+    body = client.post("/api/run", json={**session, "breakpoint_lines": [2]}).get_json()
+    assert body["stop_reason"] == "breakpoint"
+    assert "watchpoint" not in body
+    assert body["delta"]["registers"]["PC"] == "00"
+
+    assert client.post("/api/run", json={**session, "breakpoint_lines": [50]}).status_code == 400
+    assert client.post("/api/run", json={**session, "watchpoints": {}}).status_code == 400
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    response = client.post("/api/run", json={**state, "max_cycles": 10, "breakpoint_lines": [1]})
+    assert response.status_code == 400
+
+def test_run_in_worker_process(client, monkeypatch):
+    executor = RunExecutor(1, max_pending=1)
+    monkeypatch.setattr(server, "run_executor", executor)
+    try:
+        response = client.post("/api/compile", json={
+            "uncompiledCode": COUNTING_FOREVER_PROGRAM, "session": True,
+        })
+        session = {"session_id": response.get_json()["session_id"]}
+        for expected in ("010", "020"):
+            body = client.post("/api/run", json={
+                **session, "max_cycles": 40, "granularity": "final",
+            }).get_json()
+            # the session keeps the computer that was run in the worker
+            assert body["delta"]["memory"] == {"04": expected}
+
+        future = executor.submit(time.sleep, 0.5)
+        response = client.post("/api/run", json={**session, "max_cycles": 40})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        future.result()
+    finally:
+        executor.shutdown()
+
+def test_run_and_batch_use_result_cache(client, monkeypatch, tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    monkeypatch.setattr(server, "result_cache", cache)
+    state = compile_assembly("INP\nOUT\nHLT")["memory_and_registers"]
+    for granularity in ("trace", "outputs"):
+        body = {**state, "inputs": [5], "granularity": granularity}
+        first = client.post("/api/run", json=body)
+        second = client.post("/api/run", json=body)
+        assert second.status_code == 200
+        assert second.get_json() == first.get_json()
+    state = compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"]
+    for _ in range(2):
+        body = client.post("/api/run", json={**state, "max_cycles": 10}).get_json()
+        assert body["stop_reason"] == "cycle_limit" and body["cycles"] == 10
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    jobs = {"jobs": [{"uncompiledCode": "INP\nOUT\nHLT", "inputs": [7]}]}
+    first = client.post("/api/batch", json=jobs).get_json()
+    assert client.post("/api/batch", json=jobs).get_json() == first
+    assert first["results"][0]["outputs"] == ["007"]
+    assert (cache.hits, cache.misses) == (4, 4)
+    cache.close()
+
+@pytest.mark.parametrize("endpoint", ["/api/step", "/api/run", "/api/run/stream"])
+@pytest.mark.parametrize("memory_value, pc", [("abc", "00"), ("500", "150"), ("5000", "00")])
+def test_invalid_state_is_rejected(client, endpoint, memory_value, pc):
+    state = compile_assembly("HLT")["memory_and_registers"]
+    state = {
+        "memory": {**state["memory"], "05": memory_value},
+        "registers": {**state["registers"], "PC": pc},
+    }
+    response = client.post(endpoint, json=state)
+    assert response.status_code == 400
+
+def test_invalid_binary_state_is_rejected(client):
+    state = compile_assembly("HLT")["memory_and_registers"]
+    data = bytearray(wire_format.encode(state))
+    # memory location 05 holds 40000, which needs all 16 bits
+    data[11:13] = (40000).to_bytes(2, "little")
+    response = client.post(
+        "/api/run", data=bytes(data), headers={"Content-Type": wire_format.MIMETYPE},
+    )
+    assert response.status_code == 400
+
+def test_after_input_rejects_invalid_input(client):
+    state = compile_assembly("INP\nHLT")["memory_and_registers"]
+    response = client.post("/api/after-input", json={"state": state, "input": "abc"})
+    assert response.status_code == 400
+    response = client.post("/api/after-input", json={"state": state, "input": "12"})
+    assert response.get_json() == {"end_reg": "ACC", "value": "012"}
+
+def test_run_with_inputs(client):
+    state = compile_assembly("loop INP\nOUT\nBRZ done\nBRA loop\ndone HLT")["memory_and_registers"]
+    body = client.post("/api/run", json={
+        **state, "granularity": "outputs", "inputs": [4, 5, 0],
+    }).get_json()
+    assert body["outputs"] == ["004", "005", "000"]
+    assert body["inputs_used"] == 3
+    assert body["stop_reason"] == "HLT"
+
+    response = client.post("/api/run", json={**state, "inputs": [1000]})
+    assert response.status_code == 400
+
+def test_profile(client):
+    response = client.post("/api/profile", json={
+        "uncompiledCode": "INP\nloop SUB one\nBRP done\nBRA loop\ndone OUT\nHLT\none DAT 1",
+        "inputs": [3],
+    })
+    body = response.get_json()
+    assert body["stop_reason"] == "HLT"
+    lines = body["profile"]["lines"]
+    assert (lines[1]["line_number"], lines[1]["executions"]) == (2, 4)
+    assert (lines[2]["branches_taken"], lines[2]["branches_not_taken"]) == (1, 3)
+    assert lines[6]["reads"] == 4
+
+    response = client.post("/api/profile", json={"uncompiledCode": "1nvalidlabel HLT"})
+    assert not response.get_json()["valid"]
+
+def test_metrics(client):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    client.post("/api/run", json=state)
+    client.post("/api/compile", json={"uncompiledCode": "HLT"})
+    client.post("/api/compile", json={"uncompiledCode": "HLT"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'lmc_request_duration_seconds_count{endpoint="/api/run"}' in text
+    assert 'lmc_requests_total{endpoint="/api/compile",method="POST",status="200"}' in text
+    assert 'lmc_run_cycles_bucket{endpoint="/api/run",le="10"}' in text
+    assert "lmc_compile_cache_hit_ratio " in text
+
+    response = client.get("/metrics", environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert response.status_code == 403
+
+def test_step_binary(client):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    response = client.post(
+        "/api/step", data=wire_format.encode(state),
+        headers={"Content-Type": wire_format.MIMETYPE, "Accept": wire_format.MIMETYPE},
+    )
+    assert response.mimetype == wire_format.MIMETYPE
+    step_result = wire_format.decode(response.get_data())
+    assert step_result == client.post("/api/step", json=state).get_json()
+
+    # the binary format is only used if the client asks for it
+    response = client.post(
+        "/api/step", data=wire_format.encode(state),
+        headers={"Content-Type": wire_format.MIMETYPE},
+    )
+    assert response.is_json
+
+    response = client.post(
+        "/api/step", data=b"\x01\x00", headers={"Content-Type": wire_format.MIMETYPE},
+    )
+    assert response.status_code == 400
+
+def test_run_binary(client):
+    state = compile_assembly("LDA one\nOUT\nHLT\none DAT 1")["memory_and_registers"]
+    response = client.post("/api/run", json=state, headers={"Accept": wire_format.MIMETYPE})
+    assert wire_format.decode(response.get_data()) == client.post("/api/run", json=state).get_json()
+
+    # summaries of runs are still sent as JSON
+    response = client.post("/api/run", json={**state, "granularity": "final"},
+                           headers={"Accept": wire_format.MIMETYPE})
+    assert response.is_json
+
+def test_session_is_used_by_one_request_at_a_time(client):
+    response = client.post("/api/compile", json={
+        "uncompiledCode": COUNTING_FOREVER_PROGRAM, "session": True,
+    })
+    session = {"session_id": response.get_json()["session_id"]}
+    stream = client.post("/api/run/stream", json={**session, "max_cycles": 100}, buffered=False)
+    # the stream has not been read, so its run is still using the session
+    responses = []
+    thread = threading.Thread(
+        target=lambda: responses.append(app.test_client().post("/api/step", json=session)),
+    )
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert json.loads(stream.get_data(as_text=True).splitlines()[-1])["cycles"] == 100
+    stream.close()
+    thread.join()
+    assert responses[0].status_code == 200
+    body = client.post("/api/seek", json={**session, "back": 0}).get_json()
+    assert body["cycle"] == 101
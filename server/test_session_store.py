@@ -0,0 +1,45 @@
+"""Tests for session_store.py"""
+
+import threading
+import time
+from session_store import SessionStore
+
+def test_least_recently_used_session_is_removed():
+    store = SessionStore(max_size=2)
+    first, second = store.add("a"), store.add("b")
+    assert store.get(first) == "a"
+    store.add("c")
+    assert store.get(second) is None
+    assert store.get(first) == "a"
+    assert len(store) == 2
+
+def test_sessions_expire():
+    store = SessionStore(ttl=0.05)
+    session_id = store.add("a")
+    time.sleep(0.1)
+    assert store.get(session_id) is None
+    assert len(store) == 0
+
+def test_session_is_used_by_one_thread_at_a_time():
+    store = SessionStore()
+    session_id = store.add("a")
+    used = []
+    def use_session():
+        with store.use(session_id) as value:
+            used.append(value)
+
+    with store.use(session_id) as value:
+        assert value == "a"
+        thread = threading.Thread(target=use_session)
+        thread.start()
+        thread.join(0.1)
+        # the other thread waits for the session, but the store can still be used
+        assert thread.is_alive()
+        assert store.get(store.add("b")) == "b"
+        store.replace(session_id, "c")
+    thread.join()
+    # the value replaced while the other thread waited is the one it gets
+    assert used == ["c"]
+
+    with store.use("unknown") as value:
+        assert value is None
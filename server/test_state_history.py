@@ -0,0 +1,70 @@
+"""Tests for state_history.py"""
+
+import pytest
+from compile_assembly import compile_assembly
+from computer import Computer
+from state_history import StateHistory, pack_record, unpack_record
+from test_computer import COUNTING_FOREVER_PROGRAM
+
+def test_pack_record():
+    registers = (99, 999, 9, 99, 999, 1)
+    assert unpack_record(pack_record(registers, 99, 999)) == (registers, 99, 999)
+    assert unpack_record(pack_record((0, 0, 0, 0, 0, 0))) == ((0, 0, 0, 0, 0, 0), -1, 0)
+
+def test_seek_restores_every_cycle():
+    computer = Computer(compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"])
+    computer.history = StateHistory(computer.state, checkpoint_interval=4)
+    states = [computer.memory_and_registers]
+    for _ in range(30):
+        computer.step()
+        states.append(computer.memory_and_registers)
+    assert computer.history.cycle == 30
+
+    for cycle in (29, 26, 24, 13, 12, 0):
+        computer.seek(cycle)
+        assert computer.memory_and_registers == states[cycle]
+        assert computer.history.cycle == cycle
+
+    # running again from an earlier cycle records a new history
+    computer.run(max_cycles=10)
+    assert computer.history.cycle == 10
+    computer.seek(5)
+    assert computer.memory_and_registers == states[5]
+
+def test_seek_out_of_range():
+    computer = Computer(compile_assembly("INP\nHLT")["memory_and_registers"], keep_history=True)
+    computer.step()
+    with pytest.raises(ValueError):
+        computer.seek(2)
+    with pytest.raises(ValueError):
+        computer.seek(-1)
+    with pytest.raises(ValueError):
+        Computer(compile_assembly("HLT")["memory_and_registers"]).seek(0)
+
+def test_history_is_bounded():
+    computer = Computer(compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"])
+    computer.history = StateHistory(computer.state, checkpoint_interval=10, max_cycles=50)
+    computer.run(max_cycles=200, granularity="final")
+    assert computer.history.cycle == 200
+    assert 140 <= computer.history.first_cycle <= 150
+    with pytest.raises(ValueError):
+        computer.seek(100)
+    computer.seek(computer.history.first_cycle)
+
+def test_input_is_kept_by_later_cycles():
+    computer = Computer(compile_assembly("INP\nOUT\nHLT")["memory_and_registers"],
+                        keep_history=True)
+    computer.step()
+    computer.finish_after_input("42")
+    computer.step()
+    computer.seek(1)
+    # cycle 1 is the state the next cycle started from, after the input was taken
+    assert computer.memory_and_registers["registers"]["ACC"] == "042"
+
+def test_engines_clear_history():
+    computer = Computer(compile_assembly(COUNTING_FOREVER_PROGRAM)["memory_and_registers"],
+                        keep_history=True)
+    computer.step()
+    computer.run_fast(max_cycles=20)
+    assert computer.history.cycle == 21
+    assert computer.history.first_cycle == 21
@@ -0,0 +1,48 @@
+"""Tests for wire_format.py"""
+
+import json
+import pytest
+import wire_format
+from compile_assembly import compile_assembly
+from computer import Computer
+from test_programs import MULTIPLY_PROGRAM
+
+with open("../example_assembly_program.txt", "r", encoding="utf-8") as f:
+    example_assembly_program = f.read()
+
+def test_state_round_trip():
+    state = compile_assembly(example_assembly_program)["memory_and_registers"]
+    encoded = wire_format.encode(state)
+    assert len(encoded) == 1 + 212
+    assert wire_format.decode(encoded) == state
+
+def test_transfer_round_trip():
+    for transfer in (
+        {"start_reg": "PC", "end_reg": "MAR", "value": "07"},
+        {"start_mem": "12", "end_reg": "MDR", "value": "200"},
+        {"start_reg": "MDR", "end_reg": "IR", "value": "9"},
+        {"start_reg": "ACC", "end_mem": "13", "value": "042"},
+        {"end_reg": "PC", "value": "10"},
+    ):
+        encoded = wire_format.encode_transfer(transfer)
+        assert len(encoded) == 5
+        assert wire_format.decode_transfer(encoded) == (transfer, 5)
+
+@pytest.mark.parametrize("program,inputs", [
+    (MULTIPLY_PROGRAM, []),
+    (example_assembly_program, ["5"]),
+    (example_assembly_program, ["005"]),
+])
+def test_step_results_round_trip(program, inputs):
+    computer = Computer(compile_assembly(program)["memory_and_registers"])
+    results = computer.run(inputs=inputs)
+    encoded = wire_format.encode(results)
+    assert wire_format.decode(encoded) == results
+    # far smaller than the same results as JSON
+    assert len(encoded) * 5 < len(json.dumps(results))
+
+def test_decode_invalid():
+    with pytest.raises(ValueError):
+        wire_format.decode(b"\x01\x00")
+    with pytest.raises(ValueError):
+        wire_format.decode(b"\x07")
@@ -0,0 +1,208 @@
+"""This file contains a compact binary format for sending the state of the LMC and the results of
+FDE cycles between the server and the client, as an alternative to JSON. The state is packed as 106
+unsigned 16-bit integers (100 memory locations, then PC, ACC, IR, MAR, MDR and CARRY), and each
+transfer as one byte for its kind, one each for its source and destination, and a 16-bit value.
+All integers are little-endian. Every message begins with a byte saying what it contains:
+    1: a state of the LMC
+    2: the result of one FDE cycle: flags (1 = reached HLT, 2 = reached INP, 4 = output, 8 = input
+       taken from a list, with the number of digits of the input in the next two bits), the value
+       output or input (16-bit), the number of transfers, the transfers, then the state
+    3: a 32-bit count, then that many FDE cycle results, laid out as in message 2
+Functions:
+    encode_state(memory_and_registers: dict) -> bytes
+    decode_state(data: bytes, offset: int) -> tuple[dict, int]
+    encode_transfer(transfer: dict) -> bytes
+    decode_transfer(data: bytes, offset: int) -> tuple[dict, int]
+    encode_step_result(step_result: dict) -> bytes
+    decode_step_result(data: bytes, offset: int) -> tuple[dict, int]
+    encode(value: dict | list[dict]) -> bytes
+    decode(data: bytes) -> dict | list[dict]"""
+
+import struct
+
+MIMETYPE = "application/x-lmc-binary"
+
+STATE_MESSAGE = 1
+STEP_RESULT_MESSAGE = 2
+STEP_RESULTS_MESSAGE = 3
+
+# registers in the order they are packed, with the number of digits each one displays
+REGISTERS = ("PC", "ACC", "IR", "MAR", "MDR", "CARRY")
+REGISTER_WIDTHS = {"PC": 2, "ACC": 3, "IR": 1, "MAR": 2, "MDR": 3, "CARRY": 1}
+
+# where a transfer starts or ends, packed into the kind byte as <source> | <destination> << 2
+NO_LOCATION = 0
+REGISTER_LOCATION = 1
+MEMORY_LOCATION = 2
+
+STATE_STRUCT = struct.Struct(f"<{100 + len(REGISTERS)}H")
+TRANSFER_STRUCT = struct.Struct("<BBBH")
+STEP_HEADER_STRUCT = struct.Struct("<BHB")
+COUNT_STRUCT = struct.Struct("<I")
+
+HLT_FLAG = 1
+INP_FLAG = 2
+OUTPUT_FLAG = 4
+INPUT_FLAG = 8
+INPUT_WIDTH_SHIFT = 4
+
+def encode_state(memory_and_registers: dict):
+    """Pack the state of the LMC into 212 bytes."""
+    memory = memory_and_registers["memory"]
+    registers = memory_and_registers["registers"]
+    return STATE_STRUCT.pack(
+        *(int(memory[str(address).zfill(2)]) for address in range(100)),
+        *(int(registers[register]) for register in REGISTERS),
+    )
+
+def decode_state(data: bytes, offset: int = 0):
+    """Unpack a state of the LMC packed by `encode_state`.
+
+    Returns
+    -------
+    tuple[dict, int]
+        The state, and the offset of the first byte after it.
+    """
+    values = STATE_STRUCT.unpack_from(data, offset)
+    memory_and_registers = {
+        "memory": {
+            str(address).zfill(2): str(value).zfill(3) for address, value in enumerate(values[:100])
+        },
+        "registers": {
+            register: str(value).zfill(REGISTER_WIDTHS[register])
+            for register, value in zip(REGISTERS, values[100:])
+        },
+    }
+    return memory_and_registers, offset + STATE_STRUCT.size
+
+def encode_transfer(transfer: dict):
+    """Pack one transfer into 5 bytes. The width of the value is not stored, as it is always the
+    width of the register or memory location it ends in."""
+    if "start_reg" in transfer:
+        source_kind, source = REGISTER_LOCATION, REGISTERS.index(transfer["start_reg"])
+    elif "start_mem" in transfer:
+        source_kind, source = MEMORY_LOCATION, int(transfer["start_mem"])
+    else:
+        source_kind, source = NO_LOCATION, 0
+    if "end_reg" in transfer:
+        destination_kind, destination = REGISTER_LOCATION, REGISTERS.index(transfer["end_reg"])
+    else:
+        destination_kind, destination = MEMORY_LOCATION, int(transfer["end_mem"])
+    return TRANSFER_STRUCT.pack(
+        source_kind | destination_kind << 2, source, destination, int(transfer["value"]),
+    )
+
+def decode_transfer(data: bytes, offset: int = 0):
+    """Unpack one transfer packed by `encode_transfer`.
+
+    Returns
+    -------
+    tuple[dict, int]
+        The transfer, and the offset of the first byte after it.
+    """
+    kind, source, destination, value = TRANSFER_STRUCT.unpack_from(data, offset)
+    transfer = {}
+    if kind & 3 == REGISTER_LOCATION:
+        transfer["start_reg"] = REGISTERS[source]
+    elif kind & 3 == MEMORY_LOCATION:
+        transfer["start_mem"] = str(source).zfill(2)
+    if kind >> 2 == REGISTER_LOCATION:
+        transfer["end_reg"] = REGISTERS[destination]
+        transfer["value"] = str(value).zfill(REGISTER_WIDTHS[REGISTERS[destination]])
+    else:
+        transfer["end_mem"] = str(destination).zfill(2)
+        transfer["value"] = str(value).zfill(3)
+    return transfer, offset + TRANSFER_STRUCT.size
+
+def encode_step_result(step_result: dict):
+    """Pack the result of one FDE cycle, as returned by `Computer.step` or `Computer.iter_run`."""
+    flags = (
+        (HLT_FLAG if step_result["reached_HLT"] else 0)
+        | (INP_FLAG if step_result["reached_INP"] else 0)
+    )
+    value = 0
+    if step_result["output"]:
+        flags |= OUTPUT_FLAG
+        value = int(step_result["output"])
+    elif "input" in step_result:
+        flags |= INPUT_FLAG | len(step_result["input"]) << INPUT_WIDTH_SHIFT
+        value = int(step_result["input"])
+    return b"".join((
+        STEP_HEADER_STRUCT.pack(flags, value, len(step_result["transfers"])),
+        *(encode_transfer(transfer) for transfer in step_result["transfers"]),
+        encode_state(step_result["memory_and_registers"]),
+    ))
+
+def decode_step_result(data: bytes, offset: int = 0):
+    """Unpack the result of one FDE cycle packed by `encode_step_result`.
+
+    Returns
+    -------
+    tuple[dict, int]
+        The result, and the offset of the first byte after it.
+    """
+    flags, value, transfer_count = STEP_HEADER_STRUCT.unpack_from(data, offset)
+    offset += STEP_HEADER_STRUCT.size
+    transfers = []
+    for _ in range(transfer_count):
+        transfer, offset = decode_transfer(data, offset)
+        transfers.append(transfer)
+    memory_and_registers, offset = decode_state(data, offset)
+    step_result = {
+        "memory_and_registers": memory_and_registers,
+        "transfers": transfers,
+        "reached_HLT": bool(flags & HLT_FLAG),
+        "reached_INP": bool(flags & INP_FLAG),
+        "output": str(value).zfill(3) if flags & OUTPUT_FLAG else "",
+    }
+    if flags & INPUT_FLAG:
+        step_result["input"] = str(value).zfill(flags >> INPUT_WIDTH_SHIFT)
+    return step_result, offset
+
+def encode(value):
+    """Pack a state of the LMC, the result of one FDE cycle, or a list of results, into a message.
+
+    Parameters
+    ----------
+    value : dict | list[dict]
+        The state (with memory and registers), step result (with transfers) or list of step
+        results.
+
+    Returns
+    -------
+    bytes
+        The message.
+    """
+    if isinstance(value, list):
+        return b"".join((
+            bytes((STEP_RESULTS_MESSAGE,)),
+            COUNT_STRUCT.pack(len(value)),
+            *(encode_step_result(step_result) for step_result in value),
+        ))
+    if "transfers" in value:
+        return bytes((STEP_RESULT_MESSAGE,)) + encode_step_result(value)
+    return bytes((STATE_MESSAGE,)) + encode_state(value)
+
+def decode(data: bytes):
+    """Unpack a message packed by `encode`.
+
+    Raises
+    ------
+    ValueError
+        The message is not in the binary format.
+    """
+    try:
+        if data[0] == STATE_MESSAGE:
+            return decode_state(data, 1)[0]
+        if data[0] == STEP_RESULT_MESSAGE:
+            return decode_step_result(data, 1)[0]
+        if data[0] == STEP_RESULTS_MESSAGE:
+            (count,), offset = COUNT_STRUCT.unpack_from(data, 1), 1 + COUNT_STRUCT.size
+            step_results = []
+            for _ in range(count):
+                step_result, offset = decode_step_result(data, offset)
+                step_results.append(step_result)
+            return step_results
+    except (IndexError, struct.error) as error:
+        raise ValueError("Binary message is incomplete") from error
+    raise ValueError("Unknown binary message type")